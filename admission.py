@@ -0,0 +1,203 @@
+"""
+Token-bucket admission control
+
+Each bucket holds up to `burst` tokens and refills at `rate` tokens a second;
+a request takes one token from every bucket it is checked against, or none if
+any is short, in which case it is told how long until it would fit. Buckets
+live in a SQLite file so every worker on the host draws from the same ones,
+or in process memory when there is no file.
+
+Checking a request is one short write transaction, far cheaper than letting
+an overload reach the database and queue up there.
+"""
+
+import sqlite3
+import threading
+import time
+
+from hashlib import sha256
+from typing import Callable, List, Tuple
+
+from local_sqlite import LocalSqlite
+
+## (key, tokens per second, burst)
+Bucket = Tuple[str, float, float]
+
+## Buckets untouched for this many refill periods are dropped as full
+PRUNE_AFTER_REFILLS = 2
+## Takes between prunes, per process
+PRUNE_EVERY = 1000
+## Longest a take waits for another worker's transaction
+BUSY_TIMEOUT_S = 0.25
+
+BUCKETS_SCHEMA = "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);"
+
+
+"""
+Input: Request headers and the client's address
+Output: Str identity of the client. The key id when one is sent, otherwise a
+    hash of the signature (constant per app build, as the signed message is),
+    otherwise the address. Not verified: the endpoint-wide bucket bounds what
+    a client rotating identities can do
+"""
+def client_identity(headers, remote_addr) -> str:
+    key_id = headers.get("X-Hmac-Key-Id")
+    if key_id:
+        return f"key:{key_id}"
+    signature = headers.get("X-Hmac-Signature")
+    if signature:
+        return f"sig:{sha256(signature.encode()).hexdigest()[:16]}"
+    return f"addr:{remote_addr}"
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+def _wait(tokens, rate):
+    return (1 - tokens) / rate if rate > 0 else float("inf")
+
+def _prune_horizon(now, longest_refill):
+    # A bucket idle this long has refilled, so dropping it changes nothing
+    return now - PRUNE_AFTER_REFILLS * max(longest_refill, 1.0)
+
+
+class MemoryBucketStore:
+    """
+    Buckets for this process only
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._takes = 0
+        self._longest_refill = 0.0
+
+    """
+    Input: Buckets to take a token from, the current time
+    Output: 0.0 if a token was taken from every bucket, otherwise seconds
+        until there would be one in all of them (nothing is taken)
+    """
+    def take(self, buckets: List[Bucket], now: float = None) -> float:
+        now = time.time() if now == None else now
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = _refill(tokens, updated, now, rate, burst)
+                if tokens < 1:
+                    wait = max(wait, _wait(tokens, rate))
+                levels.append((key, tokens))
+                if rate > 0:
+                    self._longest_refill = max(self._longest_refill, burst / rate)
+
+            self._takes += 1
+            if self._takes % PRUNE_EVERY == 0:
+                horizon = _prune_horizon(now, self._longest_refill)
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[1] >= horizon}
+            if wait > 0:
+                return wait
+            for key, tokens in levels:
+                self._buckets[key] = (tokens - 1, now)
+            return 0.0
+
+
+class SqliteBucketStore:
+    """
+    Buckets in a SQLite file shared by every process that opens it, see
+    local_sqlite.py. If the file stays locked past BUSY_TIMEOUT_S the
+    request is admitted
+    """
+
+    def __init__(self, path: str):
+        self.db = LocalSqlite(path, BUCKETS_SCHEMA, BUSY_TIMEOUT_S)
+        self._takes = 0
+        self._longest_refill = 0.0
+
+    """
+    See MemoryBucketStore.take
+    """
+    def take(self, buckets: List[Bucket], now: float = None) -> float:
+        now = time.time() if now == None else now
+        try:
+            with self.db.transaction() as connection:
+                levels = []
+                wait = 0.0
+                for key, rate, burst in buckets:
+                    row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                    tokens = burst if row == None else _refill(row[0], row[1], now, rate, burst)
+                    if tokens < 1:
+                        wait = max(wait, _wait(tokens, rate))
+                    levels.append((key, tokens))
+                    if rate > 0:
+                        self._longest_refill = max(self._longest_refill, burst / rate)
+
+                if wait == 0:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                        [(key, tokens - 1, now) for key, tokens in levels],
+                    )
+                self._takes += 1
+                if self._takes % PRUNE_EVERY == 0:
+                    horizon = _prune_horizon(now, self._longest_refill)
+                    connection.execute("DELETE FROM buckets WHERE updated < ?", (horizon,))
+        except sqlite3.OperationalError:
+            # Still locked after the busy timeout: admit rather than fail
+            return 0.0
+        return wait
+
+
+"""
+Input: SQLite file path, empty for per-process buckets
+Output: Bucket store
+"""
+def make_bucket_store(path: str):
+    if path == "":
+        return MemoryBucketStore()
+    return SqliteBucketStore(path)
+
+
+class BoundedStream:
+    """
+    Request body of unknown length (sent chunked) that calls on_exceeded,
+    which should raise, as soon as more than limit bytes have been read from
+    it. Never asks the wrapped stream for more than one byte past the limit
+    """
+
+    ## Bytes asked for at a time by read() with no size
+    READ_CHUNK = 64 * 1024
+
+    def __init__(self, stream, limit: int, on_exceeded: Callable[[], None]):
+        self.stream = stream
+        self.limit = limit
+        self.on_exceeded = on_exceeded
+        self.consumed = 0
+
+    def _allowance(self, size) -> int:
+        allowance = self.limit - self.consumed + 1
+        return allowance if size == None or size < 0 else min(size, allowance)
+
+    def _count(self, data: bytes) -> bytes:
+        self.consumed += len(data)
+        if self.consumed > self.limit:
+            self.on_exceeded()
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        if size != None and size >= 0:
+            return self._count(self.stream.read(self._allowance(size)))
+        chunks = []
+        while True:
+            chunk = self.read(self.READ_CHUNK)
+            if chunk == b"":
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._count(self.stream.readline(self._allowance(size)))
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if line == b"":
+                return
+            yield line
@@ -1,32 +1,312 @@
-from flask import Flask, request
-from flask_restful import abort, Api, Resource
-
 import hmac
+import math
+import sqlite3
+import time
+
+from hashlib import sha256
+
+from bson.objectid import ObjectId
+from flask import Flask, Request, Response, current_app, g, make_response, request, stream_with_context
+from flask_restful import abort, Api, Resource
+from werkzeug.exceptions import TooManyRequests
 
 from data import (
     insert_generic_item, 
+    insert_generic_items,
     insert_matched_item, 
+    insert_matched_items,
     insert_generic_item_update,
-    fetch_generic_item_id
+    insert_generic_item_updates,
+    fetch_generic_item_id,
+    page_generic_items,
+    page_matched_items,
+    page_generic_item_updates,
+    page_review_queue,
+    iter_export,
+    suggest_generic_items,
+    autocomplete_generic_items,
+    SUBMISSION_COUNT_FIELD,
+    SUBMISSION_HASH_FIELD,
+)
+from schema import GENERIC_ITEM_KEYS_AND_TYPES, UPDATE_GENERIC_ITEM_KEYS_AND_TYPES
+from validation import check_generic_item, check_matched_item, check_updated_generic_item
+from security.hmac_sig_gen import HmacVerifier
+import codec
+from admission import BoundedStream, client_identity, make_bucket_store
+from autocomplete import MAX_COMPLETIONS
+from idempotency import DONE, PENDING, claim_or_wait, make_idempotency_store
+from export import COMPRESSIONS, export_chunks, id_range, parse_time
+from ingest import ingest_ndjson
+from metrics import inc, observe, render_metrics, start_flusher, timer
+
+from config import (
+    default_hmac_key_id,
+    hmac_secret_keys,
+    idempotency_lease_s,
+    idempotency_max_keys,
+    idempotency_store_path,
+    idempotency_ttl_s,
+    idempotency_wait_s,
+    max_request_bytes,
+    max_stream_request_bytes,
+    metrics_token,
+    metrics_public,
+    rate_limit_enabled,
+    rate_limit_client_per_s,
+    rate_limit_client_burst,
+    rate_limit_endpoint_per_s,
+    rate_limit_endpoint_burst,
+    rate_limit_store_path,
 )
-from security.hmac_sig_gen import generate_hmac_signature
 
-from config import secret_key
+
+## Request bodies and responses both go through codec.py
+class CodecRequest(Request):
+    json_module = codec
+
+    ## MAX_CONTENT_LENGTH, except on the streamed endpoints with their own cap
+    @property
+    def max_content_length(self):
+        if self.endpoint in STREAM_ENDPOINTS:
+            return max_stream_request_bytes or None
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = CodecRequest
+app.config["MAX_CONTENT_LENGTH"] = max_request_bytes or None
 api = Api(app)
 
+@api.representation("application/json")
+def output_json(data, code, headers=None):
+    resp = make_response(codec.dumps(data, indent=current_app.debug) + b"\n", code)
+    resp.headers.extend(headers or {})
+    return resp
+
+## Keyed once at startup, see HmacVerifier
+hmac_verifier = HmacVerifier(hmac_secret_keys, default_key_id=default_hmac_key_id)
+
+
+##
+## Metrics
+##  - see metrics.py, served on /metrics
+##
+
+def endpoint_label():
+    return request.endpoint or "unmatched"
+
+def stage(name):
+    return timer("syg_request_stage_seconds", endpoint=endpoint_label(), stage=name)
+
+def count_abort(reason):
+    inc("syg_request_errors_total", endpoint=endpoint_label(), reason=reason)
+
+@app.before_request
+def start_request_timer():
+    start_flusher()
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    endpoint = endpoint_label()
+    if "request_start" in g:
+        observe("syg_request_seconds", time.perf_counter() - g.request_start, endpoint=endpoint)
+    inc("syg_requests_total", endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    if not metrics_public:
+        if metrics_token == "":
+            return Response("metrics need METRICS_TOKEN, or METRICS_PUBLIC to serve them openly\n", status=403, mimetype="text/plain")
+        received = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(received.encode(), f"Bearer {metrics_token}".encode()):
+            return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 
 ##
 ## Abort conditions
 ##
 
-def abort_invalid_json():
-    abort(403, message="Submitted json does not fit required format") 
+def abort_invalid_json(errors=None):
+    count_abort("invalid_json")
+    if errors == None:
+        abort(403, message="Submitted json does not fit required format") 
+    abort(403, message="Submitted json does not fit required format", errors=errors)
 
 def abort_invalid_hmac_signature():
+    count_abort("invalid_hmac_signature")
     abort(403, message="Received HMAC signature could not be verified")
 
+def abort_invalid_batch():
+    count_abort("invalid_batch")
+    abort(403, message=f"Submitted batch must be a json array of 1 to {MAX_BATCH_SIZE} items")
+
+def abort_invalid_ndjson():
+    count_abort("invalid_content_type")
+    abort(415, message="Submitted body must be application/x-ndjson, one json document per line")
+
+def abort_invalid_query(message):
+    count_abort("invalid_query")
+    abort(400, message=message)
+
+def abort_rate_limited(retry_after):
+    count_abort("rate_limited")
+    # TooManyRequests adds the Retry-After header
+    error = TooManyRequests(retry_after=retry_after)
+    error.data = {"message": "Too many requests, retry later"}
+    raise error
+
+def abort_body_too_large(limit):
+    count_abort("body_too_large")
+    abort(413, message=f"Request body must be at most {limit} bytes")
+
+def abort_invalid_idempotency_key():
+    count_abort("invalid_idempotency_key")
+    abort(400, message=f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+
+def abort_idempotency_key_in_use():
+    count_abort("idempotency_key_in_use")
+    abort(409, message="A request with this Idempotency-Key is still being handled, retry later")
+
+def abort_idempotency_key_reused():
+    count_abort("idempotency_key_reused")
+    abort(422, message="Idempotency-Key was already used for a different request body")
+
+def abort_not_found():
+    count_abort("not_found")
+    abort(404, message="Could not find the Generic Item")
+
+
+##
+## Admission control
+##  - runs before any resource reads its body. Refuses bodies over the cap, 
+##    then takes a token from the client's bucket for the endpoint and from 
+##    the endpoint's bucket, see admission.py
+##  - a chunked body has no length to check up front, so reading it is cut
+##    off with a 413 once it passes the cap
+##
+
+## Endpoints whose body is streamed, with their own size cap
+STREAM_ENDPOINTS = {"usersubmittedgenericitemsetstream"}
+## Endpoints admission control leaves alone
+UNLIMITED_ENDPOINTS = {"prometheus_metrics", "static", None}
+
+bucket_store = make_bucket_store(rate_limit_store_path) if rate_limit_enabled else None
+
+@app.before_request
+def admit_request():
+    endpoint = request.endpoint
+    if endpoint in UNLIMITED_ENDPOINTS:
+        return
+
+    limit = max_stream_request_bytes if endpoint in STREAM_ENDPOINTS else max_request_bytes
+    if limit > 0 and request.content_length != None and request.content_length > limit:
+        abort_body_too_large(limit)
+    if limit > 0 and request.content_length == None:
+        # Before anything reads the body, so request.stream is the bounded one
+        request.environ["wsgi.input"] = BoundedStream(
+            request.environ["wsgi.input"], limit, lambda: abort_body_too_large(limit)
+        )
+
+    if bucket_store == None:
+        return
+    # Reads and writes to one resource are limited separately
+    route = f"{request.method} {endpoint}"
+    client = client_identity(request.headers, request.remote_addr)
+    wait = bucket_store.take([
+        (f"{route}|{client}", rate_limit_client_per_s, rate_limit_client_burst),
+        (route, rate_limit_endpoint_per_s, rate_limit_endpoint_burst),
+    ])
+    if wait > 0:
+        abort_rate_limited(max(1, math.ceil(wait)))
+
+
+##
+## Idempotency keys
+##  - a POST to one of IDEMPOTENT_ENDPOINTS may send an Idempotency-Key. 
+##    Repeats get the first response back, marked Idempotent-Replayed, 
+##    without running the resource again, see idempotency.py
+##  - runs after admission control and the HMAC check, before the resource
+##    reads the body. Only 2xx responses are kept, so a refused request
+##    never answers for its key
+##
+
+IDEMPOTENT_ENDPOINTS = {
+    "usersubmittedgenericitemset",
+    "usersubmittedmatcheditemset",
+    "userupdatedgenericitemset",
+    "usersubmittedgenericitemsetbatch",
+    "usersubmittedmatcheditemsetbatch",
+    "userupdatedgenericitemsetbatch",
+}
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+idempotency_store = make_idempotency_store(
+    idempotency_store_path, idempotency_ttl_s, idempotency_lease_s, idempotency_max_keys
+)
+
+@app.before_request
+def replay_idempotent_request():
+    if request.method != "POST" or request.endpoint not in IDEMPOTENT_ENDPOINTS:
+        return
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key == None:
+        return
+    if idempotency_key == "" or len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        abort_invalid_idempotency_key()
+
+    # Before the key is claimed, so an unauthenticated request cannot take it
+    with stage("hmac"):
+        validate_headers()
+
+    client = client_identity(request.headers, request.remote_addr)
+    key = f"{request.endpoint}|{client}|{idempotency_key}"
+    # get_json reads the body from this cache later
+    fingerprint = sha256(request.get_data(cache=True)).hexdigest()
+    try:
+        state, stored = claim_or_wait(idempotency_store, key, fingerprint, idempotency_wait_s)
+    except sqlite3.OperationalError:
+        # Key store locked up: handle the request without a key
+        return
+
+    if state == PENDING:
+        abort_idempotency_key_in_use()
+    if state == DONE:
+        if stored.fingerprint != fingerprint:
+            abort_idempotency_key_reused()
+        inc("syg_idempotent_replays_total", endpoint=request.endpoint)
+        response = Response(stored.body, status=stored.status, mimetype=stored.mimetype)
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+    g.idempotency_claim = (key, fingerprint)
+
+@app.after_request
+def store_idempotent_response(response):
+    claim = g.pop("idempotency_claim", None)
+    if claim == None:
+        return response
+    key, fingerprint = claim
+    try:
+        if not 200 <= response.status_code < 300:
+            # Not kept, so a retry is handled afresh
+            idempotency_store.release(key)
+        else:
+            idempotency_store.store(key, fingerprint, response.status_code, response.mimetype, response.get_data())
+    except sqlite3.OperationalError:
+        pass
+    return response
+
+@app.teardown_request
+def release_idempotency_key(error=None):
+    # Only still set if the response never reached store_idempotent_response
+    claim = g.pop("idempotency_claim", None)
+    if claim != None:
+        try:
+            idempotency_store.release(claim[0])
+        except sqlite3.OperationalError:
+            pass
+
 
 ##
 ## Validation
@@ -34,61 +314,127 @@ def abort_invalid_hmac_signature():
 
 
 def validate_headers():
+    # Already checked for this request, before its Idempotency-Key was claimed
+    if g.get("hmac_verified"):
+        return
     headers = request.headers
 
-    ## Validate hmac signature. Must use stored secret key
+    ## Validate hmac signature. Must use one of the stored secret keys
     received_hmac_sig = headers["X-Hmac-Signature"]
     received_hmac_message = headers["X-Hmac-Message"]
-    generated_hmac_sig = generate_hmac_signature(received_hmac_message, secret_key).hex()
+    received_key_id = headers.get("X-Hmac-Key-Id")
 
-    if not hmac.compare_digest(received_hmac_sig, generated_hmac_sig):
+    if not hmac_verifier.verify(received_hmac_message, received_hmac_sig, received_key_id):
         abort_invalid_hmac_signature()
-
-GENERIC_ITEM_KEYS_AND_TYPES = {'Name': str, 'Category': str, 'Subcategory': str, 'IsCut': bool, 'IsCooked': bool, 'IsOpened': bool, 'DaysInFridge': float, 'DaysOnShelf': float, 'DaysInFreezer': float, 'Notes': str, 'Links': str}
-
-MATCHED_ITEM_KEYS_AND_TYPES = {'ScannedItemName': str, 'GenericItemObj': dict}
-
-UPDATE_GENERIC_ITEM_KEYS_AND_TYPES = {'Original': dict, 'Updated': dict}
+    g.hmac_verified = True
 
 def validate_generic_item_json(rec_json):
-    keys_to_validate = set(rec_json.keys())
-    if len(set(GENERIC_ITEM_KEYS_AND_TYPES.keys()).difference(keys_to_validate)) > 3 :
-        abort_invalid_json()
-    
-    for k in keys_to_validate:
-        if type(rec_json[k]) != GENERIC_ITEM_KEYS_AND_TYPES[k]:
-            if type(rec_json[k]) == int and GENERIC_ITEM_KEYS_AND_TYPES[k] == float: 
-                continue 
-            abort_invalid_json()
+    errors = check_generic_item(rec_json)
+    if errors:
+        abort_invalid_json(errors)
 
 def validate_matched_item_json(rec_json):
-    keys_to_validate = set(rec_json.keys())
-    if len(set(MATCHED_ITEM_KEYS_AND_TYPES.keys()).difference(keys_to_validate)) > 0 :
-        abort_invalid_json()
-    
-    for k in keys_to_validate:
-        if type(rec_json[k]) != MATCHED_ITEM_KEYS_AND_TYPES[k]:
-            abort_invalid_json()
-        
-        if type(rec_json[k]) == dict: 
-            validate_generic_item_json(rec_json[k])
-
+    errors = check_matched_item(rec_json)
+    if errors:
+        abort_invalid_json(errors)
 
 def validate_updated_generic_item_json(rec_json):
-    keys_to_validate = set(rec_json.keys())
-    if len(set(UPDATE_GENERIC_ITEM_KEYS_AND_TYPES.keys()).difference(keys_to_validate)) > 0 :
-        abort_invalid_json()
-    for k in keys_to_validate:
-        if type(rec_json[k]) != UPDATE_GENERIC_ITEM_KEYS_AND_TYPES[k]:
-            abort_invalid_json()
-        
-        validate_generic_item_json(rec_json[k])
+    errors = check_updated_generic_item(rec_json)
+    if errors:
+        abort_invalid_json(errors)
+
+## Batch bodies are a non-empty JSON array of at most MAX_BATCH_SIZE items
+MAX_BATCH_SIZE = 500
+
+def validate_batch_json(rec_json):
+    if type(rec_json) != list or len(rec_json) == 0 or len(rec_json) > MAX_BATCH_SIZE:
+        abort_invalid_batch()
+
+def validate_ndjson_content_type():
+    if request.mimetype != "application/x-ndjson":
+        abort_invalid_ndjson()
 
 def is_test_request():
     headers = request.headers 
     return headers["X-Is-Test-Request"] == 'True'
 
 
+##
+## Paginated reads
+##  - GET on a submission collection returns its documents in _id order:
+##      {"items": [...], "next": Str or null}
+##  - query parameters:
+##      after   _id to start after, the previous page's "next"
+##      limit   page size, 1 to MAX_PAGE_SIZE
+##      fields  comma separated fields to return, _id is always included
+##  - "next" is null once a page comes back short. The body is written as the
+##    documents are read from the cursor, see data.iter_page
+##
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+SUBMISSION_PAGE_FIELDS = {"_id", SUBMISSION_HASH_FIELD, SUBMISSION_COUNT_FIELD}
+GENERIC_ITEM_PAGE_FIELDS = SUBMISSION_PAGE_FIELDS | set(GENERIC_ITEM_KEYS_AND_TYPES)
+MATCHED_ITEM_PAGE_FIELDS = SUBMISSION_PAGE_FIELDS | {"ScannedItemName", "GenericItemID"}
+UPDATED_GENERIC_ITEM_PAGE_FIELDS = SUBMISSION_PAGE_FIELDS | set(UPDATE_GENERIC_ITEM_KEYS_AND_TYPES)
+REVIEW_QUEUE_PAGE_FIELDS = {"_id", "OriginalHash", "Original", "Updates", "TotalVotes", "FirstProposed", "LastProposed"}
+
+"""
+Input: Set of field names the collection's documents can be projected to
+Output: (ObjectId or None, Int page size, List of field names or None) from 
+    the query string
+"""
+def page_params(allowed_fields):
+    args = request.args
+
+    after = args.get("after")
+    if after != None:
+        if not ObjectId.is_valid(after):
+            abort_invalid_query("after must be an _id from a previous page")
+        after = ObjectId(after)
+
+    limit = args.get("limit", str(DEFAULT_PAGE_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_SIZE:
+        abort_invalid_query(f"limit must be a whole number from 1 to {MAX_PAGE_SIZE}")
+    limit = int(limit)
+
+    fields = args.get("fields")
+    if fields != None:
+        fields = [field.strip() for field in fields.split(",") if field.strip() != ""]
+        unknown = [field for field in fields if field not in allowed_fields]
+        if len(fields) == 0 or len(unknown) > 0:
+            abort_invalid_query(f"fields must be some of {', '.join(sorted(allowed_fields))}")
+
+    return after, limit, fields
+
+"""
+Input: Generator of the page's documents and the page size
+Output: Generator of the response body in chunks, one per document
+"""
+def page_body(documents, limit):
+    yield b'{"items":['
+    count, last_id = 0, None
+    for document in documents:
+        yield codec.dumps(document) if count == 0 else b"," + codec.dumps(document)
+        count += 1
+        last_id = document["_id"]
+    next_after = str(last_id) if count == limit else None
+    yield b'],"next":' + codec.dumps(next_after) + b"}\n"
+
+"""
+Input: A data.py page_* function and the fields it can be projected to
+Output: Streamed json response with one page
+"""
+def get_page(page, allowed_fields):
+    with stage("hmac"):
+        validate_headers()
+    after, limit, fields = page_params(allowed_fields)
+
+    documents = page(after=after, limit=limit, fields=fields)
+    return Response(stream_with_context(page_body(documents, limit)), mimetype="application/json")
+
+
 ##
 ## Api resource routing
 ##  - expects content-type of application/json 
@@ -96,26 +442,37 @@ def is_test_request():
 
 class UserSubmittedGenericItemSet(Resource):
     def post(self):
-        rec_json = request.get_json()
-        validate_headers()
+        with stage("json"):
+            rec_json = request.get_json()
+        with stage("hmac"):
+            validate_headers()
 
-        # validate_generic_item_json(rec_json) 
+        with stage("validate"):
+            validate_generic_item_json(rec_json)
 
         if is_test_request():
             return "success"
         
-        insert_generic_item(rec_json) 
+        with stage("write"):
+            insert_generic_item(rec_json)
+
+    def get(self):
+        return get_page(page_generic_items, GENERIC_ITEM_PAGE_FIELDS)
 
 class UserSubmittedMatchedItemSet(Resource):
     def post(self):
-        rec_json = request.get_json()
-        validate_headers()
+        with stage("json"):
+            rec_json = request.get_json()
+        with stage("hmac"):
+            validate_headers()
 
-        # validate_matched_item_json(rec_json) 
+        with stage("validate"):
+            validate_matched_item_json(rec_json)
 
-        _id = fetch_generic_item_id(rec_json['GenericItemObj'])
+        with stage("lookup"):
+            _id = fetch_generic_item_id(rec_json['GenericItemObj'])
         if _id == None: 
-            abort(404, message="Could not find the Generic Item")
+            abort_not_found()
 
         payload = {
             'ScannedItemName': rec_json['ScannedItemName'],
@@ -125,23 +482,337 @@ class UserSubmittedMatchedItemSet(Resource):
         if is_test_request():
             return "success"
 
-        insert_matched_item(payload) 
+        with stage("write"):
+            insert_matched_item(payload)
+
+    def get(self):
+        return get_page(page_matched_items, MATCHED_ITEM_PAGE_FIELDS)
 
 class UserUpdatedGenericItemSet(Resource):
     def post(self):
-        rec_json = request.get_json()
-        validate_headers()
+        with stage("json"):
+            rec_json = request.get_json()
+        with stage("hmac"):
+            validate_headers()
 
-        # validate_updated_generic_item_json(rec_json) 
+        with stage("validate"):
+            validate_updated_generic_item_json(rec_json)
 
         if is_test_request():
             return "success"
         
-        insert_generic_item_update(rec_json) 
+        with stage("write"):
+            insert_generic_item_update(rec_json)
+
+    def get(self):
+        return get_page(page_generic_item_updates, UPDATED_GENERIC_ITEM_PAGE_FIELDS)
+
+
+##
+## Batch resource routing
+##  - expects a json array of the single-item payloads
+##  - responds with one result per item, in input order:
+##      {"index": Int, "status": Int, "_id": Str} on success
+##      {"index": Int, "status": Int, "message": Str} otherwise
+##    where status mirrors what the single-item endpoint would have returned
+##
+
+BATCH_INVALID_JSON_MESSAGE = "Submitted json does not fit required format"
+BATCH_NOT_FOUND_MESSAGE = "Could not find the Generic Item"
+
+def batch_item_error(index, status, message, errors=None):
+    error = {"index": index, "status": status, "message": message}
+    if errors != None:
+        error["errors"] = errors
+    return error
+
+"""
+Input: Parallel lists of indices into the request batch and documents to 
+    write, plus the data.py insert_* batch function to write them with 
+Output: List of per-item results for those indices 
+"""
+def write_batch(indices, documents, insert_many):
+    if is_test_request():
+        return [{"index": i, "status": 200} for i in indices]
+
+    results = []
+    for i, result in zip(indices, insert_many(documents)):
+        if "error" in result:
+            results.append(batch_item_error(i, 500, result["error"]))
+        elif "_id" in result:
+            results.append({"index": i, "status": 200, "_id": result["_id"]})
+        else:
+            # Merged into an earlier identical submission
+            results.append({"index": i, "status": 200})
+    return results
+
+"""
+Input: Request batch, a prepare function and a data.py insert_* batch function.
+    prepare(index, item) returns (document, None) for an item that should be 
+    written, or (None, error_result) for one that should not 
+Output: Response body with per-item results, in input order 
+"""
+def process_batch(rec_json, prepare, insert_many):
+    results = []
+    indices, documents = [], []
+    for i, item in enumerate(rec_json):
+        document, error = prepare(i, item)
+        if error != None:
+            results.append(error)
+            continue
+        indices.append(i)
+        documents.append(document)
+
+    results.extend(write_batch(indices, documents, insert_many))
+    results.sort(key=lambda result: result["index"])
+    return {"results": results}
+
+def prepare_if_valid(check):
+    def prepare(index, item):
+        errors = check(item)
+        if errors:
+            return None, batch_item_error(index, 403, BATCH_INVALID_JSON_MESSAGE, errors)
+        return item, None
+    return prepare
+
+def prepare_matched_item(index, item):
+    errors = check_matched_item(item)
+    if errors:
+        return None, batch_item_error(index, 403, BATCH_INVALID_JSON_MESSAGE, errors)
+
+    _id = fetch_generic_item_id(item['GenericItemObj'])
+    if _id == None:
+        return None, batch_item_error(index, 404, BATCH_NOT_FOUND_MESSAGE)
+
+    payload = {
+        'ScannedItemName': item['ScannedItemName'],
+        'GenericItemID': _id
+    }
+    return payload, None
+
+class UserSubmittedGenericItemSetBatch(Resource):
+    def post(self):
+        with stage("json"):
+            rec_json = request.get_json()
+        with stage("hmac"):
+            validate_headers()
+        validate_batch_json(rec_json)
+
+        with stage("batch"):
+            return process_batch(rec_json, prepare_if_valid(check_generic_item), insert_generic_items)
+
+class UserSubmittedMatchedItemSetBatch(Resource):
+    def post(self):
+        with stage("json"):
+            rec_json = request.get_json()
+        with stage("hmac"):
+            validate_headers()
+        validate_batch_json(rec_json)
+
+        with stage("batch"):
+            return process_batch(rec_json, prepare_matched_item, insert_matched_items)
+
+class UserUpdatedGenericItemSetBatch(Resource):
+    def post(self):
+        with stage("json"):
+            rec_json = request.get_json()
+        with stage("hmac"):
+            validate_headers()
+        validate_batch_json(rec_json)
+
+        with stage("batch"):
+            return process_batch(rec_json, prepare_if_valid(check_updated_generic_item), insert_generic_item_updates)
+
+
+##
+## Streaming ingest
+##  - expects content-type of application/x-ndjson, one generic item per line
+##  - the body is read line by line and written in chunks of MAX_BATCH_SIZE,
+##    see ingest.py for the response
+##
+
+class UserSubmittedGenericItemSetStream(Resource):
+    def post(self):
+        with stage("hmac"):
+            validate_headers()
+        validate_ndjson_content_type()
+
+        with stage("ingest"):
+            return ingest_ndjson(
+                request.stream,
+                check_generic_item,
+                insert_generic_items,
+                chunk_size=MAX_BATCH_SIZE,
+                dry_run=is_test_request(),
+            )
+
+
+##
+## Exports
+##  - the whole collection as NDJSON in _id order, streamed from the cursor,
+##    see export.py
+##  - query parameters, all optional:
+##      after     _id to start after, the last _id of the previous export
+##      since     ISO 8601 time to start at, UTC unless it says otherwise
+##      until     ISO 8601 time to stop before
+##      compress  gzip
+##
+
+def parse_time_param(name):
+    value = request.args.get(name)
+    if value == None:
+        return None
+    try:
+        return parse_time(value)
+    except ValueError:
+        abort_invalid_query(f"{name} must be an ISO 8601 time")
+
+"""
+Input: Name of one of data.EXPORT_COLLECTIONS
+Output: Streamed NDJSON response, gzipped if asked for
+"""
+def get_export(collection_name):
+    with stage("hmac"):
+        validate_headers()
+
+    after = request.args.get("after")
+    if after != None:
+        if not ObjectId.is_valid(after):
+            abort_invalid_query("after must be an _id from a previous export")
+        after = ObjectId(after)
+    since, until = parse_time_param("since"), parse_time_param("until")
+    compress = request.args.get("compress")
+    if compress != None and compress not in COMPRESSIONS:
+        abort_invalid_query(f"compress must be one of {', '.join(COMPRESSIONS)}")
+
+    documents = iter_export(collection_name, id_range(after, since, until))
+    if compress == "gzip":
+        mimetype, filename = "application/gzip", f"{collection_name}.ndjson.gz"
+    else:
+        mimetype, filename = "application/x-ndjson", f"{collection_name}.ndjson"
+    return Response(
+        stream_with_context(export_chunks(documents, compress)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+class UserSubmittedGenericItemSetExport(Resource):
+    def get(self):
+        return get_export("UserSubmittedGenericItemSet")
+
+class UserSubmittedMatchedItemSetExport(Resource):
+    def get(self):
+        return get_export("UserSubmittedMatchedItemDict")
+
+class UserUpdatedGenericItemSetExport(Resource):
+    def get(self):
+        return get_export("UserUpdatedGenericItemSet")
+
+
+##
+## Review queue
+##  - updates grouped by their Original with a vote count per distinct
+##    Updated, one document per Original, see data.py. Paged like the
+##    submission collections
+##
+
+class GenericItemUpdateReviewQueue(Resource):
+    def get(self):
+        return get_page(page_review_queue, REVIEW_QUEUE_PAGE_FIELDS)
+
+
+
+##
+## Generic item suggestions
+##  - GenericItemSet items whose names are closest to a scanned name, from an
+##    in-memory trigram index, see suggest.py:
+##      {"ScannedItemName": Str, "suggestions": [{"_id": Str, "score": Float,
+##       "GenericItemObj": Dict}]}
+##    best first, scores from 0 to 1
+##  - query parameters:
+##      ScannedItemName  required
+##      limit            most suggestions, 1 to MAX_SUGGESTIONS
+##
+
+DEFAULT_SUGGESTIONS = 5
+MAX_SUGGESTIONS = 20
+MAX_SCANNED_NAME_LENGTH = 200
+
+class GenericItemSuggestions(Resource):
+    def get(self):
+        with stage("hmac"):
+            validate_headers()
+
+        args = request.args
+        scanned_item_name = args.get("ScannedItemName", "")
+        if scanned_item_name.strip() == "" or len(scanned_item_name) > MAX_SCANNED_NAME_LENGTH:
+            abort_invalid_query(f"ScannedItemName must be 1 to {MAX_SCANNED_NAME_LENGTH} characters")
+        limit = args.get("limit", str(DEFAULT_SUGGESTIONS))
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_SUGGESTIONS:
+            abort_invalid_query(f"limit must be a whole number from 1 to {MAX_SUGGESTIONS}")
+
+        suggestions = suggest_generic_items(scanned_item_name, limit=int(limit))
+        return {
+            "ScannedItemName": scanned_item_name,
+            "suggestions": [
+                {"_id": _id, "score": round(score, 4), "GenericItemObj": item}
+                for score, _id, item in suggestions
+            ],
+        }, 200
+
+
+
+##
+## Generic item autocomplete
+##  - GenericItemSet names, categories and subcategories starting with what
+##    the user has typed so far, most submitted first, from an in-memory
+##    sorted index, see autocomplete.py:
+##      {"prefix": Str, "completions": [{"text": Str, "field": Str,
+##       "popularity": Int}]}
+##    where field is Name, Category or Subcategory
+##  - query parameters:
+##      prefix  required, matched against the start of any word
+##      limit   most completions, 1 to MAX_COMPLETIONS
+##
+
+DEFAULT_COMPLETIONS = 10
+MAX_PREFIX_LENGTH = 100
+
+class GenericItemAutocomplete(Resource):
+    def get(self):
+        with stage("hmac"):
+            validate_headers()
+
+        args = request.args
+        prefix = args.get("prefix", "")
+        if prefix.strip() == "" or len(prefix) > MAX_PREFIX_LENGTH:
+            abort_invalid_query(f"prefix must be 1 to {MAX_PREFIX_LENGTH} characters")
+        limit = args.get("limit", str(DEFAULT_COMPLETIONS))
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_COMPLETIONS:
+            abort_invalid_query(f"limit must be a whole number from 1 to {MAX_COMPLETIONS}")
+
+        completions = autocomplete_generic_items(prefix, limit=int(limit))
+        return {
+            "prefix": prefix,
+            "completions": [
+                {"text": text, "field": field, "popularity": popularity}
+                for text, field, popularity in completions
+            ],
+        }, 200
 
 api.add_resource(UserSubmittedGenericItemSet, "/usersubmittedgenericitemset")
 api.add_resource(UserSubmittedMatchedItemSet, "/usersubmittedmatcheditemset")
 api.add_resource(UserUpdatedGenericItemSet, "/userupdatedgenericitemset")
+api.add_resource(UserSubmittedGenericItemSetBatch, "/usersubmittedgenericitemset/batch")
+api.add_resource(UserSubmittedMatchedItemSetBatch, "/usersubmittedmatcheditemset/batch")
+api.add_resource(UserUpdatedGenericItemSetBatch, "/userupdatedgenericitemset/batch")
+api.add_resource(UserSubmittedGenericItemSetStream, "/usersubmittedgenericitemset/ndjson")
+api.add_resource(UserSubmittedGenericItemSetExport, "/usersubmittedgenericitemset/export")
+api.add_resource(UserSubmittedMatchedItemSetExport, "/usersubmittedmatcheditemset/export")
+api.add_resource(UserUpdatedGenericItemSetExport, "/userupdatedgenericitemset/export")
+api.add_resource(GenericItemUpdateReviewQueue, "/userupdatedgenericitemset/reviewqueue")
+api.add_resource(GenericItemSuggestions, "/genericitemsuggestions")
+api.add_resource(GenericItemAutocomplete, "/genericitemautocomplete")
 
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,152 @@
+"""
+Async entry point serving part of api.py
+
+Only the three single-item POSTs, with the same HMAC check, validation and
+responses as api.py, on an event loop with async_data.py behind it, so one
+process holds many requests that are waiting on Mongo. Serve with
+
+    hypercorn async_api:app
+
+Not served here: the batch and ndjson endpoints, the GETs and exports,
+suggestions and autocomplete, /metrics, admission control, idempotency keys
+and the write-behind buffer. Use api.py for those.
+"""
+
+from quart import Quart, jsonify, request
+
+from async_data import (
+    close_client,
+    insert_generic_item,
+    insert_matched_item,
+    insert_generic_item_update,
+    fetch_generic_item_id
+)
+from security.hmac_sig_gen import HmacVerifier
+from validation import check_generic_item, check_matched_item, check_updated_generic_item
+
+from config import default_hmac_key_id, hmac_secret_keys
+
+app = Quart(__name__)
+
+## Keyed once at startup, see HmacVerifier
+hmac_verifier = HmacVerifier(hmac_secret_keys, default_key_id=default_hmac_key_id)
+
+
+##
+## Abort conditions
+##  - same status codes and bodies as the flask_restful aborts in api.py
+##
+
+class RequestAborted(Exception):
+    def __init__(self, status, **body):
+        super().__init__(body.get("message"))
+        self.status = status
+        self.body = body
+
+## The motor client is made on first use in the serving loop, see async_data
+@app.after_serving
+async def close_mongo_client():
+    close_client()
+
+
+@app.errorhandler(RequestAborted)
+async def handle_request_aborted(e):
+    return jsonify(e.body), e.status
+
+def abort_invalid_json(errors=None):
+    if errors == None:
+        raise RequestAborted(403, message="Submitted json does not fit required format")
+    raise RequestAborted(403, message="Submitted json does not fit required format", errors=errors)
+
+def abort_invalid_hmac_signature():
+    raise RequestAborted(403, message="Received HMAC signature could not be verified")
+
+def abort_not_found():
+    raise RequestAborted(404, message="Could not find the Generic Item")
+
+
+##
+## Validation
+##
+
+def validate_headers():
+    headers = request.headers
+
+    ## Validate hmac signature. Must use one of the stored secret keys
+    received_hmac_sig = headers["X-Hmac-Signature"]
+    received_hmac_message = headers["X-Hmac-Message"]
+    received_key_id = headers.get("X-Hmac-Key-Id")
+
+    if not hmac_verifier.verify(received_hmac_message, received_hmac_sig, received_key_id):
+        abort_invalid_hmac_signature()
+
+def validate_json(check, rec_json):
+    errors = check(rec_json)
+    if errors:
+        abort_invalid_json(errors)
+
+def is_test_request():
+    headers = request.headers
+    return headers["X-Is-Test-Request"] == 'True'
+
+## flask_restful renders a handler that returns None as json null
+def empty_response():
+    return jsonify(None)
+
+
+##
+## Routes
+##  - expects content-type of application/json
+##
+
+@app.route("/usersubmittedgenericitemset", methods=["POST"])
+async def user_submitted_generic_item_set():
+    rec_json = await request.get_json()
+    validate_headers()
+
+    validate_json(check_generic_item, rec_json)
+
+    if is_test_request():
+        return jsonify("success")
+
+    await insert_generic_item(rec_json)
+    return empty_response()
+
+@app.route("/usersubmittedmatcheditemset", methods=["POST"])
+async def user_submitted_matched_item_set():
+    rec_json = await request.get_json()
+    validate_headers()
+
+    validate_json(check_matched_item, rec_json)
+
+    _id = await fetch_generic_item_id(rec_json['GenericItemObj'])
+    if _id == None:
+        abort_not_found()
+
+    payload = {
+        'ScannedItemName': rec_json['ScannedItemName'],
+        'GenericItemID': _id
+    }
+
+    if is_test_request():
+        return jsonify("success")
+
+    await insert_matched_item(payload)
+    return empty_response()
+
+@app.route("/userupdatedgenericitemset", methods=["POST"])
+async def user_updated_generic_item_set():
+    rec_json = await request.get_json()
+    validate_headers()
+
+    validate_json(check_updated_generic_item, rec_json)
+
+    if is_test_request():
+        return jsonify("success")
+
+    await insert_generic_item_update(rec_json)
+    return empty_response()
+
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,209 @@
+"""
+Async counterpart of data.py for async_api.py, backed by motor
+
+Mirrors the insert_* and fetch_generic_item_id functions of data.py with the
+same documents, content hash lookup, lookup cache and snapshot, but every
+Mongo round trip is awaited instead of blocking a worker. The dedup upserts
+and review queue votes are built by submissions.py for both, so either mode
+stores the same data.
+"""
+
+import asyncio
+import os
+import weakref
+
+from datetime import datetime, timezone
+from pymongo.errors import BulkWriteError
+
+from typing import Any, Dict, List
+
+from cache import MISSING, TTLCache
+from canonical import CONTENT_HASH_FIELD, generic_item_hash, matched_item_hash
+from config import (
+    mongo_uri,
+    dedup_submissions_enabled,
+    generic_item_cache_size,
+    generic_item_cache_ttl_s,
+    generic_item_cache_negative_ttl_s,
+    generic_item_snapshot_path,
+    generic_item_snapshot_check_interval_s,
+)
+from metrics import inc
+from mongo_client import LazyCollection, client_options
+from snapshot import SnapshotReader
+from submissions import (
+    SUBMISSION_HASH_FIELD,
+    submission_upsert,
+    review_vote_operations,
+    split_review_vote_errors,
+)
+
+SYG_DATA = "syg_data"
+
+
+## Typings
+MongoObject = Dict[str, Any]
+
+
+##
+## Client
+##  - a motor client belongs to the event loop it was made on, so there is one
+##    per loop, made on first use inside it. Nothing connects at import, and a
+##    forked worker drops the parent's clients like mongo_client.py does
+##
+
+_clients = weakref.WeakKeyDictionary()
+
+"""
+Output: AsyncIOMotorClient for the running event loop, built on the first
+    call in it. Same pool and timeout settings as data.py's client
+"""
+def get_client():
+    # Imported here so importing this module opens nothing
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client == None:
+        client = AsyncIOMotorClient(mongo_uri, io_loop=loop, **client_options())
+        _clients[loop] = client
+    return client
+
+"""
+Closes the running event loop's client, for app shutdown
+"""
+def close_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client != None:
+        client.close()
+
+def _reset_after_fork():
+    global _clients
+    _clients = weakref.WeakKeyDictionary()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+###
+## Collection References
+##  - resolved against the running loop's client on each use
+##
+
+
+user_submitted_generic_item_set = LazyCollection(SYG_DATA, "UserSubmittedGenericItemSet", client_getter=get_client)
+user_submitted_matched_item_dict = LazyCollection(SYG_DATA, "UserSubmittedMatchedItemDict", client_getter=get_client)
+user_updated_generic_item_set = LazyCollection(SYG_DATA, "UserUpdatedGenericItemSet", client_getter=get_client)
+generic_item_set = LazyCollection(SYG_DATA, "GenericItemSet", client_getter=get_client)
+generic_item_update_review_queue = LazyCollection(SYG_DATA, "GenericItemUpdateReviewQueue", client_getter=get_client)
+
+
+## Deduplicated submissions
+##  - only used when DEDUP_SUBMISSIONS is set, see data.py
+
+"""
+Input: Collection reference, a Dict document and its submission hash
+Output: UpdateResult of the upsert
+"""
+async def upsert_submission(collection, document: MongoObject, submission_hash: str):
+    document[SUBMISSION_HASH_FIELD] = submission_hash
+    query, update = submission_upsert(document, 1, datetime.now(timezone.utc))
+    return await collection.update_one(query, update, upsert=True)
+
+
+## User Submitted Generic Item Set
+
+async def insert_generic_item(generic_item: MongoObject):
+    if dedup_submissions_enabled:
+        return await upsert_submission(user_submitted_generic_item_set, generic_item, generic_item_hash(generic_item))
+    return await user_submitted_generic_item_set.insert_one(generic_item)
+
+
+## User Submitted Matched Item Dict
+
+async def insert_matched_item(matched_item: MongoObject):
+    if dedup_submissions_enabled:
+        return await upsert_submission(user_submitted_matched_item_dict, matched_item, matched_item_hash(matched_item))
+    return await user_submitted_matched_item_dict.insert_one(matched_item)
+
+
+## User Updated Generic Item Set
+
+async def insert_generic_item_update(generic_item_update: MongoObject):
+    result = await user_updated_generic_item_set.insert_one(generic_item_update)
+    await record_review_votes([generic_item_update])
+    return result
+
+
+## Generic Item Update Review Queue
+
+"""
+Input: List of Dict generic item updates that were stored
+Output: Int Originals whose votes could not be recorded, same retry and
+    metrics as data.record_review_votes
+"""
+async def record_review_votes(generic_item_updates: List[MongoObject]) -> int:
+    if len(generic_item_updates) == 0:
+        return 0
+
+    operations = review_vote_operations(generic_item_updates, datetime.now(timezone.utc))
+    failed = 0
+    for attempt in range(2):
+        try:
+            await generic_item_update_review_queue.bulk_write(operations, ordered=False)
+            operations = []
+        except BulkWriteError as e:
+            failed_for_good, operations = split_review_vote_errors(operations, e)
+            failed += failed_for_good
+        if len(operations) == 0:
+            break
+
+    failed += len(operations)
+    if failed > 0:
+        inc("syg_review_queue_errors_total", amount=failed)
+    return failed
+
+
+## Generic Item Set
+
+generic_item_cache = TTLCache(
+    max_entries=generic_item_cache_size,
+    ttl=generic_item_cache_ttl_s,
+    negative_ttl=generic_item_cache_negative_ttl_s,
+)
+
+generic_item_snapshot = None
+if generic_item_snapshot_path != "":
+    generic_item_snapshot = SnapshotReader(
+        generic_item_snapshot_path, check_interval=generic_item_snapshot_check_interval_s
+    )
+
+"""
+Input: Dict generic item format
+Output: _id of the GenericItemSet document with the same content hash, or None.
+    Same lookup order as data.fetch_generic_item_id: snapshot, cache, Mongo
+"""
+async def fetch_generic_item_id(generic_item):
+    key = generic_item_hash(generic_item)
+    if generic_item_snapshot != None:
+        _id = generic_item_snapshot.lookup_id(key)
+        if _id != None:
+            return _id
+
+    use_cache = generic_item_cache_size > 0
+    if use_cache:
+        _id = generic_item_cache.get(key)
+        if _id is not MISSING:
+            return _id
+
+    returned_items = await generic_item_set.find_one({CONTENT_HASH_FIELD: key}, {"_id": 1})
+    _id = None if returned_items == None else returned_items["_id"]
+
+    if use_cache:
+        generic_item_cache.put(key, _id)
+    return _id
+
+def invalidate_generic_item_cache(generic_item=None):
+    if generic_item == None:
+        generic_item_cache.invalidate()
+    else:
+        generic_item_cache.invalidate(generic_item_hash(generic_item))
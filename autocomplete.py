@@ -0,0 +1,335 @@
+"""
+Prefix autocomplete over GenericItemSet names, categories and subcategories
+
+Every distinct Name, Category and Subcategory is a term, found by a prefix of
+the term or of any of its later words ("bre" finds "Chicken Breast"). Terms
+are ranked by popularity, how often users picked them:
+    Name          matched items submitted with an item of that name, plus
+                  generic items submitted under that name
+    Category,     the popularity of the names in it
+    Subcategory
+then shorter first, then alphabetically.
+
+The index is a sorted array of the normalized keys, one per term and word,
+searched with bisect. A prefix matching more than SCAN_LIMIT keys ("c", "ch")
+has its best completions worked out when the index is built, so no query
+looks at more than SCAN_LIMIT keys. The arrays are rebuilt off to the side
+and swapped in whole, so queries never wait on a refresh.
+
+Popularity is summed on the server with a $group per submission collection.
+With a SharedTerms store only one worker on a host runs that per refresh
+interval; the others rebuild their index from the terms it stored.
+"""
+
+import heapq
+import json
+import os
+import re
+import sys
+import time
+
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from local_sqlite import LocalSqlite
+
+## (text, field, popularity)
+Term = Tuple[str, str, int]
+
+TERM_FIELDS = ("Name", "Category", "Subcategory")
+
+## Most completions a query can ask for
+MAX_COMPLETIONS = 20
+## Prefixes matching more keys than this have their completions precomputed
+SCAN_LIMIT = 256
+## Groups fetched per round trip while counting popularity
+POPULARITY_BATCH_SIZE = 1000
+## Longest a worker waits for another's term store transaction
+BUSY_TIMEOUT_S = 5.0
+## How often a worker with no terms yet checks for another worker's
+POLL_INTERVAL_S = 0.5
+
+WHITESPACE = re.compile(r"\s+")
+
+
+"""
+Input: Str as typed or stored
+Output: Str lowercased with runs of whitespace made single spaces
+"""
+def normalize(text: str) -> str:
+    return WHITESPACE.sub(" ", text.casefold()).strip()
+
+
+"""
+Input: Normalized prefix
+Output: Smallest Str greater than every Str starting with prefix, or None if
+    there is none, for a prefix of only the last code point (U+10FFFF)
+"""
+def prefix_end(prefix: str) -> Optional[str]:
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if prefix == "":
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+"""
+Input: Sorted keys, normalized prefix and the range of keys to search, which
+    must start at the first key not less than prefix
+Output: Int index of the first key in the range not starting with prefix
+"""
+def prefix_range_end(keys: List[str], prefix: str, start: int, end: int) -> int:
+    after = prefix_end(prefix)
+    return end if after == None else bisect_left(keys, after, start, end)
+
+
+class AutocompleteIndex:
+    """
+    Terms are numbered best first, so the best completions in a range of
+    keys are its smallest term numbers
+    """
+
+    def __init__(self, terms: Iterable[Term] = ()):
+        self._index = ((), (), (), {})
+        self.rebuild(terms)
+
+    def __len__(self):
+        return len(self._index[2])
+
+    """
+    Input: Terms to index, replacing the current ones
+    """
+    def rebuild(self, terms: Iterable[Term]):
+        ranked = sorted(terms, key=lambda term: (-term[2], len(term[0]), term[0], term[1]))
+        entries = []
+        for number, (text, _, _) in enumerate(ranked):
+            words = normalize(text).split(" ")
+            keys = {" ".join(words[i:]) for i in range(len(words))}
+            entries.extend((key, number) for key in keys if key != "")
+        entries.sort()
+        keys = [key for key, _ in entries]
+        numbers = [number for _, number in entries]
+        # One swap, so a query sees either the old index or the new one
+        self._index = (keys, numbers, ranked, precompute(keys, numbers))
+
+    """
+    Input: Prefix as typed, how many completions at most (up to MAX_COMPLETIONS)
+    Output: List of (text, field, popularity), best first
+    """
+    def complete(self, prefix: str, limit: int = 10) -> List[Term]:
+        prefix = normalize(prefix)
+        if prefix == "":
+            return []
+        keys, numbers, ranked, precomputed = self._index
+
+        best = precomputed.get(prefix)
+        if best == None:
+            start = bisect_left(keys, prefix)
+            end = prefix_range_end(keys, prefix, start, min(len(keys), start + SCAN_LIMIT + 1))
+            best = heapq.nsmallest(limit, set(numbers[start:end]))
+        return [ranked[number] for number in best[:limit]]
+
+
+"""
+Input: Sorted keys and their term numbers
+Output: Dict of each prefix matching more than SCAN_LIMIT keys to its best
+    MAX_COMPLETIONS term numbers. Prefixes are taken a character longer at a
+    time until none matches that many
+"""
+def precompute(keys: List[str], numbers: List[int]) -> Dict[str, List[int]]:
+    precomputed = {}
+    spans = [(0, len(keys))]
+    length = 1
+    while spans:
+        wide = []
+        for start, end in spans:
+            group_start = start
+            while group_start < end:
+                if len(keys[group_start]) < length:
+                    group_start += 1
+                    continue
+                prefix = keys[group_start][:length]
+                group_end = prefix_range_end(keys, prefix, group_start, end)
+                if group_end - group_start > SCAN_LIMIT:
+                    precomputed[prefix] = heapq.nsmallest(MAX_COMPLETIONS, set(numbers[group_start:group_end]))
+                    wide.append((group_start, group_end))
+                group_start = group_end
+        spans = wide
+        length += 1
+    return precomputed
+
+
+##
+## Building the terms from the collections
+##
+
+"""
+Input: Collection reference, field the counts are keyed on, field holding
+    how many submissions a document stands for (missing counts as one)
+Output: Counter of the key field's values, summed by the server so only one
+    document per distinct value comes back
+"""
+def count_submissions(collection, key_field: str, count_field: str) -> Counter:
+    pipeline = [{"$group": {
+        "_id": f"${key_field}",
+        "count": {"$sum": {"$ifNull": [f"${count_field}", 1]}},
+    }}]
+    counts = Counter()
+    cursor = collection.aggregate(pipeline, allowDiskUse=True, batchSize=POPULARITY_BATCH_SIZE)
+    with cursor:
+        for group in cursor:
+            if group["_id"] != None:
+                counts[group["_id"]] += group["count"]
+    return counts
+
+"""
+Input: GenericItemSet, UserSubmittedMatchedItemDict and
+    UserSubmittedGenericItemSet collection references, the submission count
+    field of deduplicated submissions
+Output: List of terms with their popularity
+"""
+def load_terms(generic_items, matched_item_submissions, generic_item_submissions, count_field: str) -> List[Term]:
+    picked = count_submissions(matched_item_submissions, "GenericItemID", count_field)
+    submitted = Counter()
+    for name, count in count_submissions(generic_item_submissions, "Name", count_field).items():
+        if isinstance(name, str):
+            submitted[normalize(name)] += count
+
+    # Terms with the same normalized text are one, shown as first seen
+    texts: Dict[Tuple[str, str], str] = {}
+    popularity = Counter()
+    names: Dict[Tuple[str, str], set] = {}
+    for item in generic_items.find({}, {field: 1 for field in TERM_FIELDS}):
+        name = normalize(item["Name"]) if isinstance(item.get("Name"), str) else None
+        for field in TERM_FIELDS:
+            text = item.get(field)
+            if not isinstance(text, str) or normalize(text) == "":
+                continue
+            term = (normalize(text), field)
+            texts.setdefault(term, text.strip())
+            popularity[term] += picked.get(item["_id"], 0)
+            if name != None:
+                names.setdefault(term, set()).add(name)
+
+    # Submitted generic items count once per name, however many items share it
+    for term, term_names in names.items():
+        popularity[term] += sum(submitted.get(name, 0) for name in term_names)
+    return [(texts[term], term[1], popularity[term]) for term in texts]
+
+"""
+Rebuilds index from the collections, see load_terms
+Output: Int number of terms
+"""
+def refresh_index(index: AutocompleteIndex, generic_items, matched_item_submissions, generic_item_submissions, count_field: str) -> int:
+    terms = load_terms(generic_items, matched_item_submissions, generic_item_submissions, count_field)
+    index.rebuild(terms)
+    return len(terms)
+
+
+##
+## Sharing the terms between the workers on a host
+##
+
+TERMS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS autocomplete_terms (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    terms TEXT,
+    built REAL,
+    lease_pid INTEGER,
+    lease_expires REAL
+);
+INSERT OR IGNORE INTO autocomplete_terms (id) VALUES (0);
+"""
+
+
+class SharedTerms:
+    """
+    The last loaded terms in a SQLite file, see local_sqlite.py. Terms older
+    than max_age are stale; the first worker to find them so takes a lease
+    and loads them again while the others keep theirs. A lease held past
+    lease seconds, by a worker that died say, is taken over
+    """
+
+    def __init__(self, path: str, max_age: float, lease: float):
+        self.max_age = max_age
+        self.lease = lease
+        self._db = LocalSqlite(path, TERMS_SCHEMA, BUSY_TIMEOUT_S)
+
+    """
+    Input: Build time of the terms this worker already has, the current time
+    Output: (claimed, terms, built). claimed is True when this worker now holds
+        the lease and must store new terms. terms are the stored ones if newer
+        than have_built, otherwise None
+    """
+    def claim(self, have_built: Optional[float] = None, now: float = None) -> Tuple[bool, Optional[List[Term]], Optional[float]]:
+        now = time.time() if now == None else now
+        with self._db.transaction() as connection:
+            terms, built, lease_expires = connection.execute(
+                "SELECT terms, built, lease_expires FROM autocomplete_terms WHERE id = 0"
+            ).fetchone()
+            claimed = (built == None or now - built >= self.max_age) and (lease_expires == None or lease_expires <= now)
+            if claimed:
+                connection.execute(
+                    "UPDATE autocomplete_terms SET lease_pid = ?, lease_expires = ? WHERE id = 0",
+                    (os.getpid(), now + self.lease),
+                )
+        if built == None or built == have_built:
+            return claimed, None, built
+        return claimed, [tuple(term) for term in json.loads(terms)], built
+
+    """
+    Stores terms loaded under the lease and gives it up
+    Output: Their build time
+    """
+    def store(self, terms: List[Term], now: float = None) -> float:
+        now = time.time() if now == None else now
+        with self._db.transaction() as connection:
+            connection.execute(
+                "UPDATE autocomplete_terms SET terms = ?, built = ?, lease_pid = NULL, lease_expires = NULL WHERE id = 0",
+                (json.dumps(terms), now),
+            )
+        return now
+
+    """
+    Gives up the lease without storing, after a failed load
+    """
+    def release(self):
+        with self._db.transaction() as connection:
+            connection.execute(
+                "UPDATE autocomplete_terms SET lease_pid = NULL, lease_expires = NULL WHERE id = 0 AND lease_pid = ?",
+                (os.getpid(),),
+            )
+
+
+class SharedIndexRefresh:
+    """
+    Refresh function for a BackgroundRefresher: loads the terms if this
+    worker wins the lease, otherwise rebuilds from the stored terms when they
+    changed. A worker with no terms yet waits for the one loading them
+    """
+
+    def __init__(self, index: AutocompleteIndex, shared: SharedTerms, load: Callable[[], List[Term]]):
+        self.index = index
+        self.shared = shared
+        self.load = load
+        self.built = None
+
+    """
+    Output: Int number of terms in the index
+    """
+    def __call__(self) -> int:
+        claimed, terms, built = self.shared.claim(self.built)
+        while not claimed and terms == None and self.built == None:
+            time.sleep(POLL_INTERVAL_S)
+            claimed, terms, built = self.shared.claim(self.built)
+
+        if claimed:
+            try:
+                terms = self.load()
+            except BaseException:
+                self.shared.release()
+                raise
+            built = self.shared.store(terms)
+        if terms != None:
+            self.index.rebuild(terms)
+            self.built = built
+        return len(self.index)
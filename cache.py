@@ -0,0 +1,96 @@
+"""
+Bounded in-process TTL/LRU cache
+
+Used in front of read-mostly lookups against the reference collections, e.g.
+data.fetch_generic_item_id. Misses (a lookup that found nothing) can be cached
+too, with their own shorter TTL, so repeated requests for an unknown item stop
+reaching the database as well.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+## Returned by TTLCache.get when the key is not cached
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Input: max_entries before the least recently used entry is evicted,
+        ttl in seconds for found values and negative_ttl in seconds for
+        cached misses (a value of None). A negative_ttl of 0 disables
+        negative caching
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, negative_ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    """
+    Output: The cached value (possibly None for a cached miss) or MISSING
+    """
+    def get(self, key: Hashable) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry == None:
+                self._stats["misses"] += 1
+                return MISSING
+
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self._stats["negative_hits" if value == None else "hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        ttl = self.negative_ttl if value == None else self.ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    """
+    Input: A key to drop, or None to drop everything
+    """
+    def invalidate(self, key: Optional[Hashable] = None):
+        with self._lock:
+            if key == None:
+                self._stats["invalidations"] += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(key, None) != None:
+                self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["negative_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,104 @@
+"""
+Canonical form and content hash of a generic item
+
+Two submissions of the same item hash the same regardless of key order,
+whether a number was sent as 30 or 30.0, or whether an optional flag was left
+out. GenericItemSet stores the hash on every document so lookups are a single
+indexed point query.
+"""
+
+import hashlib
+import json
+
+from typing import Any, Dict
+
+from schema import GENERIC_ITEM_KEYS_AND_TYPES, GENERIC_ITEM_OPTIONAL_DEFAULTS
+
+## Field on GenericItemSet documents holding generic_item_hash of the document
+CONTENT_HASH_FIELD = "ContentHash"
+
+## Fields naming a reference item; a load updates the item with the same ones.
+## The flags are part of it: a cut apple keeps for other days than a whole one
+IDENTITY_FIELDS = ("Name", "Category", "Subcategory", "IsCut", "IsCooked", "IsOpened")
+
+MongoObject = Dict[str, Any]
+
+
+"""
+Input: Dict generic item format. Unknown fields (_id, ContentHash, ...) are ignored 
+Output: Dict with the known fields in GENERIC_ITEM_KEYS_AND_TYPES order, 
+    ints coerced to float where a float is expected and omitted optional 
+    fields filled with their defaults
+"""
+def canonicalize_generic_item(generic_item: MongoObject) -> MongoObject:
+    canonical = {}
+    for k, expected_type in GENERIC_ITEM_KEYS_AND_TYPES.items():
+        if k in generic_item:
+            v = generic_item[k]
+            if expected_type == float and type(v) == int:
+                v = float(v)
+            canonical[k] = v
+        elif k in GENERIC_ITEM_OPTIONAL_DEFAULTS:
+            canonical[k] = GENERIC_ITEM_OPTIONAL_DEFAULTS[k]
+    return canonical
+
+
+"""
+Input: Dict generic item format 
+Output: Hex sha256 of the canonical form 
+"""
+def generic_item_hash(generic_item: MongoObject) -> str:
+    encoded = json.dumps(
+        canonicalize_generic_item(generic_item),
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+"""
+Input: Dict generic item format 
+Output: Copy of the item with its content hash set, ready to store in GenericItemSet
+"""
+def with_content_hash(generic_item: MongoObject) -> MongoObject:
+    hashed = dict(generic_item)
+    hashed[CONTENT_HASH_FIELD] = generic_item_hash(generic_item)
+    return hashed
+
+
+"""
+Input: Dict generic item format
+Output: Dict of its IDENTITY_FIELDS, usable as a query. A flag at its default,
+    or left out, also matches a stored item that left it out
+"""
+def generic_item_identity(generic_item: MongoObject) -> MongoObject:
+    identity = {}
+    for k in IDENTITY_FIELDS:
+        default = GENERIC_ITEM_OPTIONAL_DEFAULTS.get(k)
+        v = generic_item.get(k, default)
+        if k in GENERIC_ITEM_OPTIONAL_DEFAULTS and v == default:
+            identity[k] = {"$in": [v, None]}
+        else:
+            identity[k] = v
+    return identity
+
+
+"""
+Input: Scanned item name as read off a receipt 
+Output: The name with case and runs of whitespace normalized away 
+"""
+def canonicalize_scanned_item_name(scanned_item_name: str) -> str:
+    return " ".join(scanned_item_name.split()).casefold()
+
+
+"""
+Input: Dict matched item as stored, with ScannedItemName and GenericItemID 
+Output: Hex sha256 identifying the scanned name -> generic item pairing 
+"""
+def matched_item_hash(matched_item: MongoObject) -> str:
+    encoded = json.dumps(
+        [canonicalize_scanned_item_name(matched_item["ScannedItemName"]), str(matched_item["GenericItemID"])],
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode()
+    return hashlib.sha256(encoded).hexdigest()
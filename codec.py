@@ -0,0 +1,60 @@
+"""
+JSON codec used for request bodies and responses
+
+Uses orjson when it is installed and the standard library otherwise; both
+produce the same json. BSON types are encoded during serialization, through
+the encoder's default hook, so documents read from Mongo can be returned as
+they are:
+
+    ObjectId    its 24 character hex string
+    datetime    ISO 8601 string
+"""
+
+import json
+
+from bson.objectid import ObjectId
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson != None:
+    JSON_LIBRARY = "orjson"
+
+    """
+    Input: bytes or str
+    Output: Parsed json. Raises a ValueError on invalid json
+    """
+    def loads(data):
+        return orjson.loads(data)
+
+    """
+    Input: Any json serializable object, or one holding ObjectIds
+    Output: utf-8 encoded json bytes
+    """
+    def dumps(obj, indent=False) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_INDENT_2 if indent else 0)
+
+else:
+    JSON_LIBRARY = "json"
+
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"))
+    _indent_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, indent=2)
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj, indent=False) -> bytes:
+        encoder = _indent_encoder if indent else _encoder
+        return encoder.encode(obj).encode()
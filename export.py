@@ -0,0 +1,144 @@
+"""
+Streaming export of the submission collections as NDJSON
+
+Documents go from the cursor to the output a chunk at a time, so memory stays
+flat however large the collection is, and the first document is written as
+soon as it is read. Exports are in _id order, so the last _id of one export
+is where the next incremental one starts (after).
+"""
+
+import os
+import sys
+import zlib
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from bson.objectid import ObjectId
+
+import codec
+
+COMPRESSIONS = ("gzip",)
+
+## Bytes of NDJSON gathered before a chunk is written out
+EXPORT_CHUNK_BYTES = 64 * 1024
+GZIP_LEVEL = 6
+
+
+"""
+Input: ISO 8601 date or datetime string, UTC unless it says otherwise
+Output: Timezone aware datetime. Raises ValueError for anything else
+"""
+def parse_time(value: str) -> datetime:
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo == None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+"""
+Input: ObjectId to start after, and the start (inclusive) and end (exclusive)
+    of a time range, each optional
+Output: Dict filter on _id, empty for the whole collection. An ObjectId
+    carries its creation time to the second, so a time range is an _id range
+"""
+def id_range(after: Optional[ObjectId] = None, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    id_filter = {}
+    if after != None:
+        id_filter["$gt"] = after
+    if since != None:
+        id_filter["$gte"] = ObjectId.from_datetime(since)
+    if until != None:
+        id_filter["$lt"] = ObjectId.from_datetime(until)
+    return id_filter
+
+
+"""
+Input: Iterable of documents
+Output: Generator of NDJSON chunks of about chunk_bytes. The first document
+    is a chunk of its own so it goes out straight away
+"""
+def ndjson_chunks(documents, chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    buffer = bytearray()
+    first = True
+    for document in documents:
+        buffer += codec.dumps(document)
+        buffer += b"\n"
+        if first or len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+            first = False
+    if buffer:
+        yield bytes(buffer)
+
+"""
+Input: Iterable of byte chunks
+Output: Generator of one gzip member compressing them. The first chunk is
+    flushed through so a client can start decompressing straight away
+"""
+def gzip_chunks(chunks, level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    # wbits 31: deflate with a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if first:
+            compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+"""
+Input: Iterable of documents and None or one of COMPRESSIONS
+Output: Generator of the export's bytes
+"""
+def export_chunks(documents, compress: Optional[str] = None) -> Iterator[bytes]:
+    chunks = ndjson_chunks(documents)
+    if compress == "gzip":
+        return gzip_chunks(chunks)
+    return chunks
+
+
+class ExportTally:
+    """
+    Counts documents on their way to the export and keeps the last _id
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.last_id = None
+
+    def wrap(self, documents):
+        for document in documents:
+            self.count += 1
+            self.last_id = document["_id"]
+            yield document
+
+"""
+Input: Iterable of documents, an output path ("-" for stdout) and None or
+    one of COMPRESSIONS. A file is written next to its path and renamed into
+    place once complete, so an interrupted export leaves no partial file
+Output: (Int documents written, last ObjectId written or None)
+"""
+def write_export(documents, path: str, compress: Optional[str] = None) -> Tuple[int, Optional[ObjectId]]:
+    tally = ExportTally()
+    chunks = export_chunks(tally.wrap(documents), compress)
+
+    if path == "-":
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return tally.count, tally.last_id
+
+    tmp_path = f"{path}.partial"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return tally.count, tally.last_id
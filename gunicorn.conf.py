@@ -0,0 +1,114 @@
+"""
+gunicorn settings, loaded with
+
+    gunicorn -c gunicorn.conf.py api:app
+
+Requests spend nearly all their time waiting on Atlas, so the default
+profile runs a few worker processes with many threads each instead of one
+request per process. GUNICORN_PROFILE picks the worker model:
+
+    threaded     gthread workers, GUNICORN_THREADS threads each (default)
+    cooperative  gevent workers, GUNICORN_WORKER_CONNECTIONS greenlets each.
+                 The app is imported in each worker, after gevent has
+                 patched it, rather than preloaded in the master
+    sync         one request at a time per worker, gunicorn's default
+
+Every setting below can be overridden from the environment.
+"""
+
+import os
+import time
+
+PROFILES = {
+    "threaded": {"worker_class": "gthread", "workers_per_cpu": 1, "threads": 8, "preload": True},
+    "cooperative": {"worker_class": "gevent", "workers_per_cpu": 1, "threads": 1, "preload": False},
+    "sync": {"worker_class": "sync", "workers_per_cpu": 2, "threads": 1, "preload": True},
+}
+
+# One metrics directory per server run, see config.py. Set here, in the
+# master, before the app is imported, so every worker inherits the same one
+os.environ.setdefault("METRICS_DEPLOY_ID", f"{int(time.time())}-{os.getpid()}")
+
+profile_name = os.getenv("GUNICORN_PROFILE", "threaded")
+if profile_name not in PROFILES:
+    raise ValueError(f"GUNICORN_PROFILE must be one of {', '.join(PROFILES)}, got {profile_name!r}")
+profile = PROFILES[profile_name]
+
+
+## CPUs this process may run on, which can be fewer than the machine has
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+##
+## Worker model
+##
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", profile["worker_class"])
+# WEB_CONCURRENCY is what Heroku sets for the dyno size
+workers = int(os.getenv("WEB_CONCURRENCY", str(max(2, available_cpus() * profile["workers_per_cpu"]))))
+threads = int(os.getenv("GUNICORN_THREADS", str(profile["threads"])))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "200"))
+
+# Import the app once in the master so workers fork with it loaded. Safe,
+# since nothing connects to Mongo at import (see mongo_client.py)
+preload_app = os.getenv("GUNICORN_PRELOAD", str(profile["preload"])).lower() == "true"
+
+# A gevent worker patches the standard library when it starts, too late for
+# an app preloaded in the master: its locks, threads and sockets would be the
+# unpatched ones. Patch the master now, before anything imports them
+if worker_class == "gevent" and preload_app:
+    from gevent import monkey
+    monkey.patch_all()
+
+
+##
+## Timeouts
+##
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# Heroku sends SIGKILL 30 seconds after SIGTERM, leave time to flush buffers
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "25"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+
+##
+## Server hooks
+##
+
+def on_starting(server):
+    import metrics
+    # Empties this run's directory and drops stale ones of earlier runs
+    metrics.clear_metrics_dir()
+
+def post_worker_init(worker):
+    import config
+    import data
+    import metrics
+    import mongo_client
+    # Runs once the worker has loaded the app, so after a gevent worker has
+    # patched it; post_fork would import it unpatched. mongo_client and
+    # write_buffer already dropped the parent's client and buffers at fork;
+    # start this worker's own pool and metrics flusher
+    mongo_client.start_prewarm()
+    metrics.start_flusher()
+    if config.suggest_prewarm:
+        data.generic_item_suggestion_refresher.start(wait=False)
+    if config.autocomplete_prewarm:
+        data.generic_item_autocomplete_refresher.start(wait=False)
+
+def child_exit(server, worker):
+    import metrics
+    # Runs in the master; the worker's totals are kept in the run's retired file
+    metrics.retire_worker_file(worker.pid)
+
+def worker_exit(server, worker):
+    import metrics
+    import mongo_client
+    import write_buffer
+    write_buffer.stop_all_buffers()
+    metrics.flush_metrics()
+    mongo_client.close_client()
@@ -0,0 +1,190 @@
+"""
+Idempotency keys for retried POSTs
+
+A client that sends an Idempotency-Key header can repeat the request, after a
+timeout say, without it being written twice. The first request with a key
+claims it; once handled, its response is stored under the key for
+IDEMPOTENCY_TTL_S and repeats get that stored response without running the
+resource again. A repeat that arrives while the first is still being handled
+waits for its response rather than writing a second time.
+
+Keys are scoped to the client and route and tied to a hash of the request
+body, so a key reused for a different body is refused instead of answered
+with the wrong response. api.py claims a key only once the request's HMAC
+signature checks out, and stores only 2xx responses, so a retry after a
+refused request or a server error is handled afresh.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from local_sqlite import LocalSqlite
+
+## Claim outcomes
+NEW = "new"
+DONE = "done"
+PENDING = "pending"
+
+## Longest a claim or store waits for another worker's transaction
+BUSY_TIMEOUT_S = 1.0
+## Stores between prunes of expired keys, per process
+PRUNE_EVERY = 500
+
+KEYS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    state TEXT NOT NULL,
+    status INTEGER,
+    mimetype TEXT,
+    body BLOB,
+    created REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_expires ON idempotency_keys (expires);
+"""
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status: int
+    mimetype: str
+    body: bytes
+
+
+class MemoryIdempotencyStore:
+    """
+    Keys for this process only, oldest evicted past max_keys
+    """
+
+    def __init__(self, ttl: float, lease: float, max_keys: int):
+        self.ttl = ttl
+        self.lease = lease
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> (fingerprint, expires, StoredResponse or None while pending)
+        self._keys = OrderedDict()
+
+    """
+    Input: Scoped key, fingerprint of the request body, the current time
+    Output: (NEW, None) if this request now holds the key, (DONE,
+        StoredResponse) if it was already answered, or (PENDING, None) while
+        another request holds it. A key held past the lease, by a worker that
+        died say, is taken over
+    """
+    def claim(self, key: str, fingerprint: str, now: float = None) -> Tuple[str, Optional[StoredResponse]]:
+        now = time.time() if now == None else now
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry != None and entry[1] > now:
+                if entry[2] != None:
+                    return DONE, entry[2]
+                return PENDING, None
+            self._keys[key] = (fingerprint, now + self.lease, None)
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+            return NEW, None
+
+    def store(self, key: str, fingerprint: str, status: int, mimetype: str, body: bytes, now: float = None):
+        now = time.time() if now == None else now
+        with self._lock:
+            self._keys[key] = (fingerprint, now + self.ttl, StoredResponse(fingerprint, status, mimetype, body))
+            self._keys.move_to_end(key)
+
+    def release(self, key: str):
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry != None and entry[2] == None:
+                del self._keys[key]
+
+
+class SqliteIdempotencyStore:
+    """
+    Keys in a SQLite file shared by every worker on the host, see
+    local_sqlite.py. Past max_keys the keys closest to expiring are dropped
+    """
+
+    def __init__(self, path: str, ttl: float, lease: float, max_keys: int):
+        self.db = LocalSqlite(path, KEYS_SCHEMA, BUSY_TIMEOUT_S)
+        self.ttl = ttl
+        self.lease = lease
+        self.max_keys = max_keys
+        self._stores = 0
+
+    """
+    See MemoryIdempotencyStore.claim
+    """
+    def claim(self, key: str, fingerprint: str, now: float = None) -> Tuple[str, Optional[StoredResponse]]:
+        now = time.time() if now == None else now
+        with self.db.transaction() as connection:
+            row = connection.execute(
+                "SELECT fingerprint, state, status, mimetype, body, expires FROM idempotency_keys WHERE key = ?", (key,)
+            ).fetchone()
+            if row != None and row[5] > now:
+                if row[1] == DONE:
+                    return DONE, StoredResponse(row[0], row[2], row[3], row[4])
+                return PENDING, None
+            connection.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, state, created, expires) VALUES (?, ?, ?, ?, ?)",
+                (key, fingerprint, PENDING, now, now + self.lease),
+            )
+            return NEW, None
+
+    def store(self, key: str, fingerprint: str, status: int, mimetype: str, body: bytes, now: float = None):
+        now = time.time() if now == None else now
+        with self.db.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, state, status, mimetype, body, created, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, fingerprint, DONE, status, mimetype, body, now, now + self.ttl),
+            )
+            self._stores += 1
+            if self._stores % PRUNE_EVERY == 0:
+                self._prune(connection, now)
+
+    def release(self, key: str):
+        with self.db.transaction() as connection:
+            connection.execute("DELETE FROM idempotency_keys WHERE key = ? AND state = ?", (key, PENDING))
+
+    def _prune(self, connection, now):
+        connection.execute("DELETE FROM idempotency_keys WHERE expires <= ?", (now,))
+        excess = connection.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] - self.max_keys
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM idempotency_keys WHERE key IN "
+                "(SELECT key FROM idempotency_keys ORDER BY expires LIMIT ?)",
+                (excess,),
+            )
+
+
+"""
+Claims a key, waiting out another request that holds it
+Input: Store, scoped key, fingerprint of the request body, how long to wait
+Output: (NEW, None), (DONE, StoredResponse), or (PENDING, None) if the other
+    request was still going when the wait ran out
+"""
+def claim_or_wait(store, key: str, fingerprint: str, wait: float):
+    deadline = time.monotonic() + wait
+    delay = 0.005
+    while True:
+        outcome = store.claim(key, fingerprint)
+        if outcome[0] != PENDING or time.monotonic() >= deadline:
+            return outcome
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 0.1)
+
+
+"""
+Input: SQLite file path (empty for per-process keys), how long a response
+    is kept, how long a claim is held before another request may take it
+    over, and the most keys kept
+Output: Idempotency key store
+"""
+def make_idempotency_store(path: str, ttl: float, lease: float, max_keys: int):
+    if path == "":
+        return MemoryIdempotencyStore(ttl, lease, max_keys)
+    return SqliteIdempotencyStore(path, ttl, lease, max_keys)
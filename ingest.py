@@ -0,0 +1,145 @@
+"""
+Streaming NDJSON ingest
+
+Reads one json document per line from a file-like stream, validates each and
+writes the valid ones in chunks, so at most one chunk of documents is held in
+memory however large the upload is. Line numbers start at 1; blank lines are
+skipped but still counted.
+"""
+
+from typing import Callable, List
+
+import codec
+from validation import Check
+
+## Longest line read into memory. Longer lines are skipped and rejected
+MAX_LINE_BYTES = 64 * 1024
+## Rejections reported in full; any past this are only counted
+MAX_REPORTED_REJECTIONS = 1000
+
+LINE_TOO_LONG_MESSAGE = f"Line is longer than {MAX_LINE_BYTES} bytes"
+INVALID_LINE_JSON_MESSAGE = "Line is not valid json"
+INVALID_JSON_MESSAGE = "Submitted json does not fit required format"
+
+
+"""
+Input: Binary stream with readline(size)
+Output: Generator of (line number, line bytes), or (line number, None) for a
+    line longer than max_line_bytes, whose remainder is read and discarded
+"""
+def read_lines(stream, max_line_bytes: int = MAX_LINE_BYTES):
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+
+        if len(line) > max_line_bytes and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_line_bytes + 1)
+            yield line_number, None
+            continue
+        yield line_number, line
+
+
+class IngestSummary:
+    """
+    Accepted lines are kept as [first, last] ranges, so a clean upload
+    summarizes to one range whatever its size
+    """
+
+    def __init__(self):
+        self.accepted = 0
+        self.accepted_ranges: List[List[int]] = []
+        self.rejected = 0
+        self.rejected_lines = []
+
+    def accept(self, line_number: int):
+        self.accepted += 1
+        if self.accepted_ranges and self.accepted_ranges[-1][1] == line_number - 1:
+            self.accepted_ranges[-1][1] = line_number
+        else:
+            self.accepted_ranges.append([line_number, line_number])
+
+    def reject(self, line_number: int, status: int, message: str, errors=None):
+        self.rejected += 1
+        if len(self.rejected_lines) >= MAX_REPORTED_REJECTIONS:
+            return
+        rejection = {"line": line_number, "status": status, "message": message}
+        if errors != None:
+            rejection["errors"] = errors
+        self.rejected_lines.append(rejection)
+
+    def as_dict(self):
+        return {
+            "accepted": self.accepted,
+            "accepted_lines": self.accepted_ranges,
+            "rejected": self.rejected,
+            "rejected_lines": self.rejected_lines,
+            "rejected_lines_truncated": self.rejected > len(self.rejected_lines),
+        }
+
+
+_INVALID = object()
+
+def _parse_line(line: bytes):
+    try:
+        return codec.loads(line)
+    except ValueError:
+        return _INVALID
+
+"""
+Input: Binary stream of NDJSON, the validator for each document, a data.py
+    insert_* batch function (see insert_many_unordered), the chunk size, and
+    dry_run to validate without writing
+Output: Dict summary, see IngestSummary.as_dict
+"""
+def ingest_ndjson(
+    stream,
+    check: Check,
+    insert_many: Callable,
+    chunk_size: int = 500,
+    dry_run: bool = False,
+    max_line_bytes: int = MAX_LINE_BYTES,
+):
+    summary = IngestSummary()
+    line_numbers, documents = [], []
+
+    def flush():
+        if dry_run:
+            for line_number in line_numbers:
+                summary.accept(line_number)
+        else:
+            for line_number, result in zip(line_numbers, insert_many(documents)):
+                if "error" in result:
+                    summary.reject(line_number, 500, result["error"])
+                else:
+                    summary.accept(line_number)
+        line_numbers.clear()
+        documents.clear()
+
+    for line_number, line in read_lines(stream, max_line_bytes):
+        if line == None:
+            summary.reject(line_number, 413, LINE_TOO_LONG_MESSAGE)
+            continue
+        if line.strip() == b"":
+            continue
+
+        document = _parse_line(line)
+        if document is _INVALID:
+            summary.reject(line_number, 403, INVALID_LINE_JSON_MESSAGE)
+            continue
+        errors = check(document)
+        if errors:
+            summary.reject(line_number, 403, INVALID_JSON_MESSAGE, errors)
+            continue
+
+        line_numbers.append(line_number)
+        documents.append(document)
+        if len(documents) >= chunk_size:
+            flush()
+
+    if documents:
+        flush()
+    return summary.as_dict()
@@ -0,0 +1,335 @@
+"""
+Bulk loader for the reference GenericItemSet
+
+Reads generic items from CSV, JSON (an array) or NDJSON files, normalizes
+them to the types in GENERIC_ITEM_KEYS_AND_TYPES, validates them with
+check_generic_item and upserts them on their Name, Category, Subcategory and
+flags (canonical.IDENTITY_FIELDS) in unordered bulk writes, several chunks at
+a time on writer threads. An item already stored is updated in place, so a
+reload picks up changed days or notes. Within one file the first record of
+each identity wins; later ones are counted as duplicates. Items differing
+only in IsCut, IsCooked or IsOpened are separate items.
+
+Progress is checkpointed to a small json file next to the input: the number
+of records from the start of the file whose chunks have all been written.
+Rerunning the same load skips those records. Chunks finish out of order, and
+a chunk with failed writes holds the checkpoint back, so some records past it
+can be written again on resume, which the upserts make harmless.
+
+python manage.py load FILE [FILE ...] [--threads N] [--chunk-size N] [--restart]
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from canonical import IDENTITY_FIELDS, canonicalize_generic_item, with_content_hash
+from schema import GENERIC_ITEM_KEYS_AND_TYPES
+from validation import check_generic_item
+
+MongoObject = Dict[str, Any]
+
+FORMATS = ("csv", "json", "ndjson")
+FORMAT_EXTENSIONS = {".csv": "csv", ".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+TRUE_STRINGS = {"true", "t", "yes", "y", "1"}
+FALSE_STRINGS = {"false", "f", "no", "n", "0"}
+
+## Rejections printed in full; any past this are only counted
+MAX_REPORTED_REJECTIONS = 20
+
+
+##
+## Reading
+##
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Cannot tell the format of {path}, pass --format ({', '.join(FORMATS)})")
+    return FORMAT_EXTENSIONS[extension]
+
+"""
+Input: File path and one of FORMATS
+Output: Generator of (record number from 1, raw Dict record). A record that
+    cannot be parsed at all is yielded as None
+"""
+def read_records(path: str, format: str) -> Iterator[Tuple[int, Optional[MongoObject]]]:
+    if format == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for number, row in enumerate(csv.DictReader(f), start=1):
+                yield number, row
+    elif format == "ndjson":
+        number = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip() == b"":
+                    continue
+                number += 1
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None
+    elif format == "json":
+        with open(path, "rb") as f:
+            records = json.load(f)
+        if type(records) is not list:
+            raise ValueError(f"{path} must hold a json array of generic items")
+        for number, record in enumerate(records, start=1):
+            yield number, record
+    else:
+        raise ValueError(f"Unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+
+
+##
+## Normalizing
+##
+
+def _normalize_value(value, expected_type):
+    if type(value) is not str:
+        if expected_type == float and type(value) == int:
+            return float(value)
+        return value
+
+    value = value.strip()
+    if expected_type == str:
+        return value
+    if value == "":
+        return None
+    if expected_type == bool:
+        lowered = value.lower()
+        if lowered in TRUE_STRINGS:
+            return True
+        if lowered in FALSE_STRINGS:
+            return False
+    elif expected_type == float:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    # Left as is for the validator to report
+    return value
+
+"""
+Input: Raw Dict record, from any of the formats
+Output: Dict with only the GENERIC_ITEM_KEYS_AND_TYPES fields, strings
+    converted to the expected bool / float and empty non-string cells dropped
+    so they count as left out. Other fields (_id, ContentHash, ...) are ignored
+"""
+def normalize_generic_item(record: MongoObject) -> MongoObject:
+    normalized = {}
+    for k, expected_type in GENERIC_ITEM_KEYS_AND_TYPES.items():
+        if k not in record or record[k] == None:
+            continue
+        value = _normalize_value(record[k], expected_type)
+        if value != None:
+            normalized[k] = value
+    return normalized
+
+
+##
+## Checkpoints
+##
+
+def default_checkpoint_path(path: str) -> str:
+    return f"{path}.checkpoint"
+
+def _file_identity(path: str) -> MongoObject:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+"""
+Output: Number of records already loaded from path, 0 if there is no
+    checkpoint or it was written for a different version of the file
+"""
+def read_checkpoint(checkpoint_path: str, path: str) -> int:
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get("file") != _file_identity(path):
+        return 0
+    return int(checkpoint.get("records_done", 0))
+
+def write_checkpoint(checkpoint_path: str, path: str, records_done: int):
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"file": _file_identity(path), "records_done": records_done}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+class Watermark:
+    """
+    Tracks chunks that finish out of order and reports the highest record
+    number below which every chunk is done
+    """
+
+    def __init__(self, start: int):
+        self.done = start
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    """
+    Input: The chunk's first and last record numbers
+    Output: The new watermark if it moved, otherwise None
+    """
+    def complete(self, first: int, last: int) -> Optional[int]:
+        with self._lock:
+            self._pending[first] = last
+            moved = False
+            while self.done + 1 in self._pending:
+                self.done = self._pending.pop(self.done + 1)
+                moved = True
+            return self.done if moved else None
+
+
+##
+## Loading
+##
+
+class LoadStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.read = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.upserted = 0
+        self.matched = 0
+        self.failed = 0
+        self.rejections = []
+
+    def add_written(self, upserted: int, matched: int, failed: int):
+        with self._lock:
+            self.upserted += upserted
+            self.matched += matched
+            self.failed += failed
+
+    def reject(self, number: int, message: str):
+        self.rejected += 1
+        if len(self.rejections) < MAX_REPORTED_REJECTIONS:
+            self.rejections.append(f"record {number}: {message}")
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        written = self.upserted + self.matched
+        rate = written / elapsed if elapsed > 0 else 0.0
+        return (
+            f"read {self.read}, skipped {self.skipped}, upserted {self.upserted}, "
+            f"already present {self.matched}, rejected {self.rejected}, duplicates {self.duplicates}, "
+            f"failed {self.failed} in {elapsed:.1f}s ({rate:.0f} items/s)"
+        )
+
+
+"""
+Input: File path, its format, upsert_many (see data.upsert_generic_items),
+    writer threads, items per bulk write, checkpoint path (None to not
+    checkpoint), restart to ignore an existing checkpoint, and log for
+    progress lines
+Output: LoadStats
+"""
+def load_generic_items(
+    path: str,
+    format: str,
+    upsert_many: Callable,
+    threads: int = 4,
+    chunk_size: int = 1000,
+    checkpoint_path: Optional[str] = None,
+    restart: bool = False,
+    log: Callable[[str], None] = print,
+    progress_interval: float = 5.0,
+) -> LoadStats:
+    stats = LoadStats()
+    resume_from = 0
+    if checkpoint_path != None and not restart:
+        resume_from = read_checkpoint(checkpoint_path, path)
+        if resume_from > 0:
+            log(f"Resuming {path} after record {resume_from}")
+    watermark = Watermark(resume_from)
+    checkpoint_lock = threading.Lock()
+
+    def write_chunk(first, last, items):
+        upserted, matched, errors = upsert_many(items)
+        stats.add_written(upserted, matched, len(errors))
+        for err in errors[:MAX_REPORTED_REJECTIONS]:
+            log(f"  failed to write {items[err['index']]['Name']!r}: {err['errmsg']}")
+        if errors:
+            # Holds the checkpoint before this chunk so a rerun retries it
+            return
+        if watermark.complete(first, last) != None and checkpoint_path != None:
+            with checkpoint_lock:
+                write_checkpoint(checkpoint_path, path, watermark.done)
+
+    # Bounds how many read-ahead chunks wait for a writer
+    in_flight = threading.BoundedSemaphore(threads * 2)
+    futures, failures = [], []
+    next_report = time.perf_counter() + progress_interval
+    seen_identities = set()
+    chunk, first = [], None
+
+    def on_done(future):
+        if future.exception() != None:
+            failures.append(future.exception())
+        in_flight.release()
+
+    def submit(pool, first, last, items):
+        in_flight.acquire()
+        # Stops reading once a write has raised, e.g. the database is unreachable
+        if failures:
+            in_flight.release()
+            raise failures[0]
+        future = pool.submit(write_chunk, first, last, items)
+        future.add_done_callback(on_done)
+        futures.append(future)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        number = resume_from
+        for number, record in read_records(path, format):
+            if number <= resume_from:
+                stats.skipped += 1
+                continue
+            stats.read += 1
+            if first == None:
+                first = number
+
+            item = None
+            if type(record) is not dict:
+                stats.reject(number, "not a json object")
+            else:
+                normalized = normalize_generic_item(record)
+                errors = check_generic_item(normalized)
+                if errors:
+                    stats.reject(number, ", ".join(f"{e['field']}: {e['message']}" for e in errors))
+                else:
+                    item = with_content_hash(canonicalize_generic_item(normalized))
+                    identity = tuple(item[k] for k in IDENTITY_FIELDS)
+                    if identity in seen_identities:
+                        stats.duplicates += 1
+                        item = None
+                    else:
+                        seen_identities.add(identity)
+            if item != None:
+                chunk.append(item)
+
+            if len(chunk) >= chunk_size:
+                submit(pool, first, number, chunk)
+                chunk, first = [], None
+
+            if time.perf_counter() >= next_report:
+                log(stats.report())
+                next_report = time.perf_counter() + progress_interval
+
+        # The last chunk also covers trailing rejected records
+        if first != None:
+            submit(pool, first, number, chunk)
+
+    for future in futures:
+        future.result()
+    return stats
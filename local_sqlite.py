@@ -0,0 +1,50 @@
+"""
+SQLite file shared by the workers on one host
+
+Used for small bits of state every gunicorn worker must agree on (rate limit
+buckets, idempotency keys). Each thread gets its own connection, reopened
+after a fork, in WAL mode with syncing off: the state is worth keeping across
+requests, not across a power cut.
+"""
+
+import os
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+
+
+class LocalSqlite:
+
+    def __init__(self, path: str, schema: str, busy_timeout: float):
+        self.path = path
+        self.schema = schema
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            # isolation_level None: transactions are begun explicitly
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.executescript(self.schema)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    """
+    Write transaction. IMMEDIATE takes the write lock up front, so two
+    workers cannot both read a row and then both write it. Raises
+    sqlite3.OperationalError if the lock is still held after busy_timeout
+    """
+    @contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,187 @@
+"""
+Maintenance commands for the SYG database
+
+python manage.py backfill-hashes [--all]
+python manage.py ensure-indexes
+python manage.py rebuild-review-queue
+python manage.py snapshot [--path PATH] [--watch] [--interval SECONDS]
+python manage.py export COLLECTION [--out PATH] [--gzip] [--after ID] [--since TIME] [--until TIME]
+python manage.py load FILE [FILE ...] [--format FORMAT] [--threads N] [--chunk-size N] [--restart]
+"""
+
+import os
+import sys
+
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+
+from config import generic_item_snapshot_path
+from data import (
+    backfill_generic_item_hashes,
+    ensure_generic_item_indexes,
+    ensure_review_queue_indexes,
+    ensure_submission_indexes,
+    generic_item_set,
+    iter_export,
+    rebuild_review_queue,
+    upsert_generic_items,
+    EXPORT_COLLECTIONS,
+)
+from export import id_range, parse_time, write_export
+from loader import FORMATS, default_checkpoint_path, detect_format, load_generic_items
+from snapshot import build_snapshot, run_refresher
+
+
+def backfill_hashes(args):
+    updated, duplicates = backfill_generic_item_hashes(recompute_all=args.all)
+    print(f"Stored content hash on {updated} GenericItemSet documents")
+
+    if len(duplicates) > 0:
+        print(f"{len(duplicates)} content hashes are shared by more than one document:")
+        for key, ids in duplicates.items():
+            print(f"  {key}: {', '.join(str(_id) for _id in ids)}")
+        print("Not creating the unique index until these are resolved")
+        return 1
+
+    try:
+        ensure_generic_item_indexes()
+    except OperationFailure as e:
+        print(f"Could not create the unique identity index: {e}")
+        print("More than one document has the same Name, Category, Subcategory and flags")
+        return 1
+    print("Unique content hash and identity indexes are in place")
+    return 0
+
+
+def ensure_indexes(args):
+    ensure_submission_indexes()
+    print("Unique submission hash indexes are in place")
+    ensure_review_queue_indexes()
+    print("Unique review queue index is in place")
+    return 0
+
+
+def rebuild_queue(args):
+    counted, failed = rebuild_review_queue()
+    print(f"Rebuilt the review queue from {counted} updates")
+    if failed > 0:
+        print(f"Votes for {failed} original items could not be recorded")
+        return 1
+    return 0
+
+
+def snapshot(args):
+    if args.path == "":
+        print("No snapshot path. Pass --path or set GENERIC_ITEM_SNAPSHOT_PATH")
+        return 1
+
+    if not args.watch:
+        count = build_snapshot(generic_item_set.find({}), args.path)
+        print(f"Wrote {count} generic items to {args.path}")
+        return 0
+
+    def on_rebuild(count):
+        print(f"Wrote {count} generic items to {args.path}", flush=True)
+
+    try:
+        run_refresher(generic_item_set, args.path, interval=args.interval, on_rebuild=on_rebuild)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def load(args):
+    try:
+        ensure_generic_item_indexes()
+    except OperationFailure as e:
+        print(f"Could not create the unique content hash or identity index: {e}")
+        print("Run python manage.py backfill-hashes first")
+        return 1
+
+    exit_code = 0
+    for path in args.paths:
+        format = args.format if args.format != None else detect_format(path)
+        checkpoint_path = args.checkpoint if args.checkpoint != None else default_checkpoint_path(path)
+        print(f"Loading {path} as {format}", flush=True)
+
+        stats = load_generic_items(
+            path,
+            format,
+            upsert_generic_items,
+            threads=args.threads,
+            chunk_size=args.chunk_size,
+            checkpoint_path=checkpoint_path,
+            restart=args.restart,
+            log=lambda line: print(line, flush=True),
+        )
+        for rejection in stats.rejections:
+            print(f"  rejected {rejection}")
+        if stats.rejected > len(stats.rejections):
+            print(f"  ... and {stats.rejected - len(stats.rejections)} more rejected")
+        print(stats.report(), flush=True)
+
+        if stats.failed > 0:
+            print(f"Keeping {checkpoint_path}; rerun to retry from the last complete chunk")
+            exit_code = 1
+        elif os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    return exit_code
+
+
+def export(args):
+    id_filter = id_range(args.after, args.since, args.until)
+    compress = "gzip" if args.gzip else None
+    path = args.out
+    if path == None:
+        path = f"{args.collection}.ndjson.gz" if args.gzip else f"{args.collection}.ndjson"
+
+    count, last_id = write_export(iter_export(args.collection, id_filter), path, compress)
+    # Reports go to stderr so --out - can be piped
+    print(f"Exported {count} documents from {args.collection} to {path}", file=sys.stderr)
+    if last_id != None:
+        print(f"Last _id {last_id}, pass --after {last_id} to continue from here", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill-hashes", help="store content hashes on GenericItemSet and index them")
+    backfill_parser.add_argument("--all", action="store_true", help="rehash every document, not just those missing a hash")
+    backfill_parser.set_defaults(func=backfill_hashes)
+
+    indexes_parser = subparsers.add_parser("ensure-indexes", help="create the unique indexes used by DEDUP_SUBMISSIONS and the review queue")
+    indexes_parser.set_defaults(func=ensure_indexes)
+
+    review_parser = subparsers.add_parser("rebuild-review-queue", help="rebuild the update review queue from UserUpdatedGenericItemSet")
+    review_parser.set_defaults(func=rebuild_queue)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="write the memory-mapped GenericItemSet snapshot")
+    snapshot_parser.add_argument("--path", type=str, default=generic_item_snapshot_path, help="defaults to GENERIC_ITEM_SNAPSHOT_PATH")
+    snapshot_parser.add_argument("--watch", action="store_true", help="keep running and rebuild when GenericItemSet changes")
+    snapshot_parser.add_argument("--interval", type=float, default=60.0, help="seconds between rebuilds without a change stream")
+    snapshot_parser.set_defaults(func=snapshot)
+
+    export_parser = subparsers.add_parser("export", help="stream a submission collection to an ndjson file")
+    export_parser.add_argument("collection", choices=sorted(EXPORT_COLLECTIONS))
+    export_parser.add_argument("--out", type=str, default=None, help="defaults to COLLECTION.ndjson[.gz], - for stdout")
+    export_parser.add_argument("--gzip", action="store_true", help="gzip the ndjson")
+    export_parser.add_argument("--after", type=ObjectId, default=None, help="_id to start after, the last _id of the previous export")
+    export_parser.add_argument("--since", type=parse_time, default=None, help="ISO 8601 time to start at, UTC unless it says otherwise")
+    export_parser.add_argument("--until", type=parse_time, default=None, help="ISO 8601 time to stop before")
+    export_parser.set_defaults(func=export)
+
+    load_parser = subparsers.add_parser("load", help="upsert generic items from csv, json or ndjson files into GenericItemSet")
+    load_parser.add_argument("paths", nargs="+", metavar="FILE")
+    load_parser.add_argument("--format", choices=FORMATS, default=None, help="defaults to the file extension")
+    load_parser.add_argument("--threads", type=int, default=4, help="bulk writes in flight at once")
+    load_parser.add_argument("--chunk-size", type=int, default=1000, help="items per bulk write")
+    load_parser.add_argument("--checkpoint", type=str, default=None, help="defaults to FILE.checkpoint")
+    load_parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and load from the start")
+    load_parser.set_defaults(func=load)
+
+    args = parser.parse_args()
+    raise SystemExit(args.func(args))
@@ -0,0 +1,363 @@
+"""
+Low-overhead in-process metrics, exported in the Prometheus text format
+
+Each worker keeps its own counters and fixed-bucket histograms in memory; an
+observation is a bisect and a few additions under a lock. To aggregate across
+gunicorn workers, every process periodically writes its totals to its own
+file in the server run's directory under METRICS_DIR, and the /metrics route
+sums the files there. Another worker's numbers can be up to
+METRICS_FLUSH_INTERVAL_S old.
+
+Every total only ever goes up, since Prometheus takes any drop for a counter
+reset. When a worker exits, gunicorn folds its file into the run's retired
+file, which /metrics keeps adding in, the way prometheus_client's
+multiprocess mode keeps the totals of dead processes.
+"""
+
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Tuple
+
+from pymongo import monitoring
+
+from config import metrics_base_dir, metrics_dir, metrics_flush_interval_s
+
+## Flush intervals an earlier run's directory may go unwritten before it is removed
+STALE_FLUSHES = 3
+
+## Totals of the exited workers of a run, and the workers they came from
+RETIRED_FILE = "retired_workers.json"
+
+## Upper bounds in seconds, from sub-millisecond cache hits to slow Atlas writes
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HISTOGRAMS = {
+    "syg_request_seconds": "Total time spent handling a request, by endpoint",
+    "syg_request_stage_seconds": "Time spent in each stage of a request, by endpoint and stage",
+    "syg_data_call_seconds": "Time spent in each data.py function",
+    "syg_mongo_command_seconds": "Mongo round-trip time, by command",
+}
+
+COUNTERS = {
+    "syg_requests_total": "Requests handled, by endpoint and status code",
+    "syg_request_errors_total": "Aborted requests, by endpoint and reason",
+    "syg_mongo_command_failures_total": "Mongo commands that failed, by command",
+    "syg_idempotent_replays_total": "Repeated requests answered with the stored response for their Idempotency-Key, by endpoint",
+    "syg_review_queue_errors_total": "Original items whose update votes could not be added to the review queue",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Labels], float] = {}
+# (name, labels) -> [count per bucket (last one is +Inf), sum, count]
+_histograms: Dict[Tuple[str, Labels], list] = {}
+
+
+##
+## Recording
+##
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+def inc(name: str, amount: float = 1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name: str, seconds: float, **labels):
+    key = (name, _labels(labels))
+    bucket = bisect_left(BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram == None:
+            histogram = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histogram[0][bucket] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+@contextmanager
+def timer(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+"""
+Decorator recording every call of the wrapped function in syg_data_call_seconds
+"""
+def timed_data_call(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with timer("syg_data_call_seconds", function=fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    pymongo command listener recording the round-trip time of every command
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe("syg_mongo_command_seconds", event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        observe("syg_mongo_command_seconds", event.duration_micros / 1e6, command=event.command_name)
+        inc("syg_mongo_command_failures_total", command=event.command_name)
+
+
+##
+## Aggregation across workers
+##
+
+def _new_worker_id() -> str:
+    return f"{os.getpid()}-{time.time()}"
+
+# Tells a worker's file from a later one with the same pid
+_worker_id = _new_worker_id()
+
+def _snapshot():
+    with _lock:
+        return {
+            "worker": _worker_id,
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "histograms": [
+                [name, list(labels), list(buckets), total, count]
+                for (name, labels), (buckets, total, count) in _histograms.items()
+            ],
+        }
+
+def _worker_file(pid: int) -> str:
+    return os.path.join(metrics_dir, f"worker_{pid}.json")
+
+def _worker_pid(name: str):
+    try:
+        return int(name[len("worker_"):-len(".json")])
+    except ValueError:
+        return None
+
+def _read_snapshot(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+def _write_snapshot(snapshot, path: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+"""
+Input: Snapshots as written by flush_metrics
+Output: (Dict (name, labels) -> counter total, Dict (name, labels) ->
+    [count per bucket, sum, count]) summed over the snapshots
+"""
+def _merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [[0] * (len(BUCKETS) + 1), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+"""
+Writes this process's totals to its file in METRICS_DIR
+"""
+def flush_metrics():
+    if metrics_dir == "":
+        return
+    os.makedirs(metrics_dir, exist_ok=True)
+    _write_snapshot(_snapshot(), _worker_file(os.getpid()))
+
+"""
+Adds an exited worker's totals to the run's retired file and removes the
+worker's file. Called by gunicorn in the master, one worker at a time, once
+the worker has exited. The retired file names the worker before its file
+goes, so a scrape in between counts it once, see _load_all
+"""
+def retire_worker_file(pid: int):
+    if metrics_dir == "":
+        return
+    path = _worker_file(pid)
+    retired_path = os.path.join(metrics_dir, RETIRED_FILE)
+    try:
+        worker = _read_snapshot(path)
+    except FileNotFoundError:
+        # Exited before its first flush; no scrape has seen its totals
+        return
+    except ValueError:
+        # Cut short by a crash mid-write; a complete file replaces it atomically
+        os.remove(path)
+        return
+
+    try:
+        retired = _read_snapshot(retired_path)
+    except FileNotFoundError:
+        retired = {"workers": [], "counters": [], "histograms": []}
+    if worker.get("worker") not in retired["workers"]:
+        counters, histograms = _merge([retired, worker])
+        _write_snapshot({
+            "workers": retired["workers"] + [worker.get("worker")],
+            "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [
+                [name, list(labels), buckets, total, count]
+                for (name, labels), (buckets, total, count) in histograms.items()
+            ],
+        }, retired_path)
+    os.remove(path)
+
+"""
+Removes every worker and retired file of this run, and the directories of
+earlier runs whose files have all gone stale. Called once when the server
+starts, before any worker. A run still writing to its directory on the same
+host is left be
+"""
+def clear_metrics_dir():
+    if metrics_dir == "" or not os.path.isdir(metrics_base_dir):
+        return
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.startswith("worker_") or name.startswith(RETIRED_FILE):
+                os.remove(os.path.join(metrics_dir, name))
+
+    stale_before = time.time() - STALE_FLUSHES * metrics_flush_interval_s
+    for name in os.listdir(metrics_base_dir):
+        path = os.path.join(metrics_base_dir, name)
+        if path == metrics_dir or not os.path.isdir(path):
+            continue
+        try:
+            newest = max((entry.stat().st_mtime for entry in os.scandir(path)), default=0)
+        except OSError:
+            continue
+        if newest < stale_before:
+            shutil.rmtree(path, ignore_errors=True)
+
+"""
+Output: List of the snapshots of every worker of this run, and the retired
+    one. A worker file is counted however old, as its totals stand until
+    retire_worker_file moves them to the retired file
+"""
+def _load_all():
+    if metrics_dir == "":
+        return [_snapshot()]
+
+    flush_metrics()
+    workers = []
+    for name in os.listdir(metrics_dir):
+        if not name.startswith("worker_") or not name.endswith(".json") or _worker_pid(name) == None:
+            continue
+        try:
+            workers.append(_read_snapshot(os.path.join(metrics_dir, name)))
+        except (OSError, ValueError):
+            # Removed since listed, its totals are in the retired file read below
+            continue
+
+    # Read last: a worker retired since its file was read is in here, and
+    # left out of the workers
+    try:
+        retired = _read_snapshot(os.path.join(metrics_dir, RETIRED_FILE))
+    except FileNotFoundError:
+        return workers
+    retired_workers = set(retired["workers"])
+    return [worker for worker in workers if worker.get("worker") not in retired_workers] + [retired]
+
+_flusher = None
+
+def _run_flusher():
+    while True:
+        time.sleep(metrics_flush_interval_s)
+        try:
+            flush_metrics()
+        except OSError:
+            pass
+
+"""
+Starts the background thread that keeps this process's file current. Safe
+to call more than once and again after a fork
+"""
+def start_flusher():
+    global _flusher
+    if metrics_dir == "" or (_flusher != None and _flusher.is_alive()):
+        return
+    _flusher = threading.Thread(target=_run_flusher, name="metrics-flusher", daemon=True)
+    _flusher.start()
+
+def _reset_after_fork():
+    global _lock, _flusher, _worker_id
+    # Totals recorded by the parent are the parent's; the child starts at zero
+    _lock = threading.Lock()
+    _worker_id = _new_worker_id()
+    _counters.clear()
+    _histograms.clear()
+    _flusher = None
+
+def _flush_at_exit():
+    try:
+        flush_metrics()
+    except OSError:
+        pass
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_flush_at_exit)
+
+
+##
+## Prometheus text format
+##
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if len(pairs) == 0:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+"""
+Output: Prometheus text exposition of every worker's metrics, summed
+"""
+def render_metrics() -> str:
+    counters, histograms = _merge(_load_all())
+
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+    for name, help_text in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + (float("inf"),), buckets):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
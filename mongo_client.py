@@ -0,0 +1,148 @@
+"""
+Per-process MongoClient, created on first use
+
+Nothing here talks to Mongo at import, so importing api does no DNS SRV
+lookup and opens no sockets. Each process builds its own client the first
+time a collection is used, and a forked child drops the parent's client and
+builds a new one, since a MongoClient's sockets and monitor threads do not
+survive a fork. start_prewarm() opens the pool in the background once a
+worker starts, so the first request does not pay for the connection.
+"""
+
+import logging
+import os
+import threading
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from config import (
+    mongo_uri,
+    mongo_max_pool_size,
+    mongo_min_pool_size,
+    mongo_max_idle_time_ms,
+    mongo_connect_timeout_ms,
+    mongo_socket_timeout_ms,
+    mongo_server_selection_timeout_ms,
+    mongo_wait_queue_timeout_ms,
+    mongo_compressors,
+    mongo_zlib_compression_level,
+    mongo_prewarm,
+)
+from metrics import MongoCommandTimer
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client = None
+
+
+## 0 means no timeout in config.py, None does for pymongo
+def _timeout_ms(value: int):
+    return None if value == 0 else value
+
+"""
+Output: Dict of MongoClient keyword arguments from config.py
+"""
+def client_options():
+    options = {
+        "maxPoolSize": mongo_max_pool_size,
+        "minPoolSize": mongo_min_pool_size,
+        "maxIdleTimeMS": _timeout_ms(mongo_max_idle_time_ms),
+        "connectTimeoutMS": _timeout_ms(mongo_connect_timeout_ms),
+        "socketTimeoutMS": _timeout_ms(mongo_socket_timeout_ms),
+        "serverSelectionTimeoutMS": mongo_server_selection_timeout_ms,
+        "waitQueueTimeoutMS": _timeout_ms(mongo_wait_queue_timeout_ms),
+        "event_listeners": [MongoCommandTimer()],
+    }
+    if mongo_compressors != "":
+        options["compressors"] = mongo_compressors
+        options["zlibCompressionLevel"] = mongo_zlib_compression_level
+    return options
+
+"""
+Output: This process's MongoClient, built on the first call
+"""
+def get_client() -> MongoClient:
+    global _client
+    client = _client
+    if client != None:
+        return client
+
+    with _lock:
+        if _client == None:
+            _client = MongoClient(mongo_uri, **client_options())
+        return _client
+
+"""
+Closes this process's client. The next get_client() builds a new one
+"""
+def close_client():
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client != None:
+        client.close()
+
+def _reset_after_fork():
+    global _lock, _client
+    # The inherited client's sockets are shared with the parent and its
+    # monitor threads did not survive the fork; drop it without closing
+    _lock = threading.Lock()
+    _client = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+## Pre-warming
+
+def _prewarm():
+    try:
+        # A ping selects a server and opens the first connection; pymongo's
+        # pool maintenance then fills the pool up to minPoolSize
+        get_client().admin.command("ping")
+    except PyMongoError as e:
+        logger.warning("Could not pre-warm the Mongo connection pool: %s", e)
+
+"""
+Builds the client and opens its pool on a background thread. Does nothing
+when MONGO_PREWARM is off
+"""
+def start_prewarm():
+    if not mongo_prewarm:
+        return
+    threading.Thread(target=_prewarm, name="mongo-prewarm", daemon=True).start()
+
+
+## Collection references
+
+class LazyCollection:
+    """
+    Stands in for a pymongo Collection that can be created at import. The
+    real Collection comes from the current process's client on each use,
+    every other attribute is passed through to it. client_getter picks the
+    client instead, e.g. async_data.get_client for the running event loop's
+    """
+
+    def __init__(self, database_name: str, name: str, client_getter=None):
+        self.database_name = database_name
+        self.name = name
+        self._client_getter = client_getter or get_client
+        self._client = None
+        self._collection = None
+
+    """
+    Output: Collection on this process's (or client_getter's) client
+    """
+    def collection(self):
+        client = self._client_getter()
+        if client is not self._client:
+            self._collection = client[self.database_name][self.name]
+            self._client = client
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self.collection(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.database_name!r}, {self.name!r})"
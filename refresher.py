@@ -0,0 +1,63 @@
+"""
+Background refresh of the in-memory indexes each worker keeps (suggestions,
+autocomplete)
+
+A refresher runs its refresh function once on first use and then every
+interval seconds on a daemon thread. A worker forked from a process that
+already started one starts its own, since threads do not survive a fork.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRefresher:
+
+    def __init__(self, refresh: Callable[[], object], interval: float = 60.0, name: str = "index-refresher"):
+        self.refresh = refresh
+        self.interval = interval
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._refreshed = threading.Event()
+        # The parent's thread may hold the lock at a fork; the child has no
+        # such thread
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    """
+    Input: wait for the first refresh before returning, at most timeout
+        seconds if given
+    Output: True once the first refresh has run
+    """
+    def start(self, wait: bool = True, timeout: Optional[float] = None) -> bool:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._refreshed = threading.Event()
+                    threading.Thread(target=self._run, name=self.name, daemon=True).start()
+                    self._pid = os.getpid()
+        if wait:
+            self._refreshed.wait(timeout)
+        return self._refreshed.is_set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                # Any error, not only a Mongo one: the thread must live on to
+                # retry, and the waiters below must be released
+                logger.exception("%s refresh failed", self.name)
+            # Set after a failed first refresh too, so requests do not hang on
+            # a cluster that is down; they see an empty index until it is back
+            self._refreshed.set()
+            time.sleep(self.interval)
@@ -1,19 +1,45 @@
-from tests_private_api.tests_http_requests.test_client import run_local_api_tests, run_remote_api_tests
-from tests_private_api.tests_mongo_queries.test_mongo import run_mongo_tests
-
-
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("type", type=str, help="api or mongo")
+    parser.add_argument("type", type=str, help="http, mongo, modules or bench")
     parser.add_argument("--loc", type=str, help="local or remote")
+    parser.add_argument("--save", type=str, help="bench: where to save results")
+    parser.add_argument("--baseline", type=str, help="bench: baseline results to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="bench: save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="bench: allowed slowdown vs the baseline, as a fraction")
+    parser.add_argument("--repeat", type=int, default=7, help="bench: timed repeats per benchmark in a run, the best is kept")
+    parser.add_argument("--rounds", type=int, default=3, help="bench: runs a baseline is the best of, and most runs to confirm a regression")
     args = parser.parse_args()
 
+    # Imported per type: the bench suite switches data.py to the memory
+    # storage backend, so it must be loaded before anything imports config
     if args.type == "mongo":
+        from tests_private_api.tests_mongo_queries.test_mongo import run_mongo_tests
+
         run_mongo_tests()
+    elif args.type == "modules":
+        from tests_private_api.tests_modules.test_modules import run_module_tests
+
+        raise SystemExit(0 if run_module_tests() else 1)
     elif args.type == "http": 
+        from tests_private_api.tests_http_requests.test_client import run_local_api_tests, run_remote_api_tests
+
         if args.loc == "local":
             run_local_api_tests()
         else:
             run_remote_api_tests()
+    elif args.type == "bench":
+        from tests_private_api.benchmarks.bench_suite import (
+            run_benchmarks, DEFAULT_RESULTS_PATH, DEFAULT_BASELINE_PATH
+        )
+
+        passed = run_benchmarks(
+            save_path=args.save or DEFAULT_RESULTS_PATH,
+            baseline_path=args.baseline or DEFAULT_BASELINE_PATH,
+            update_baseline=args.update_baseline,
+            tolerance=args.tolerance,
+            repeat=args.repeat,
+            rounds=args.rounds,
+        )
+        raise SystemExit(0 if passed else 1)
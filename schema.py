@@ -0,0 +1,13 @@
+"""
+Field names and types of the documents the API accepts
+"""
+
+GENERIC_ITEM_KEYS_AND_TYPES = {'Name': str, 'Category': str, 'Subcategory': str, 'IsCut': bool, 'IsCooked': bool, 'IsOpened': bool, 'DaysInFridge': float, 'DaysOnShelf': float, 'DaysInFreezer': float, 'Notes': str, 'Links': str}
+
+MATCHED_ITEM_KEYS_AND_TYPES = {'ScannedItemName': str, 'GenericItemObj': dict}
+
+UPDATE_GENERIC_ITEM_KEYS_AND_TYPES = {'Original': dict, 'Updated': dict}
+
+## A generic item may leave out up to three fields. These are the ones the 
+## app actually omits, and what an omitted one means
+GENERIC_ITEM_OPTIONAL_DEFAULTS = {'IsCut': False, 'IsCooked': False, 'IsOpened': False}
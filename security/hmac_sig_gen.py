@@ -1,6 +1,8 @@
 import hmac
 import hashlib
 
+from typing import Dict, Optional
+
 def generate_hmac_signature(message, key):
     hmc = hmac.new(key=key.encode(), msg=message.encode(), digestmod=hashlib.sha256)
     message_digest = hmc.digest()
@@ -9,4 +11,59 @@ def generate_hmac_signature(message, key):
 
 
 def compare_hmac_signatures(a, b):
-    return hmac.compare_digest(a, b)
\ No newline at end of file
+    return hmac.compare_digest(a, b)
+
+
+class HmacVerifier:
+    """
+    Verifies HMAC signatures against one or more active secrets
+
+    Each secret is keyed into an HMAC object once, up front. A request only
+    copy()s the pre-keyed state and feeds it the message, and the digest is
+    compared as raw bytes. Secrets are named by key id so a client can say
+    which one it signed with (X-Hmac-Key-Id) and rotation never means trying
+    every key.
+
+    Input: Dict of key id -> secret, and the key id used when a request
+        does not name one
+    """
+
+    def __init__(self, keys: Dict[str, str], default_key_id: Optional[str] = None):
+        self.default_key_id = default_key_id
+        self._keyed = {
+            key_id: hmac.new(key=secret.encode(), digestmod=hashlib.sha256)
+            for key_id, secret in keys.items() if secret
+        }
+
+    def key_ids(self):
+        return list(self._keyed.keys())
+
+    def _digest(self, keyed, message: str) -> bytes:
+        hmc = keyed.copy()
+        hmc.update(message.encode())
+        return hmc.digest()
+
+    """
+    Input: Message string and the key id to sign with (default key if None)
+    Output: Raw digest bytes
+    """
+    def sign(self, message: str, key_id: Optional[str] = None) -> bytes:
+        return self._digest(self._keyed[key_id or self.default_key_id], message)
+
+    """
+    Input: Message string, hex signature as sent in X-Hmac-Signature and the 
+        key id it was made with (default key if None)
+    Output: True if the signature matches. Unknown key ids and malformed hex 
+        do not match
+    """
+    def verify(self, message: str, signature_hex: str, key_id: Optional[str] = None) -> bool:
+        keyed = self._keyed.get(key_id or self.default_key_id)
+        if keyed == None:
+            return False
+
+        try:
+            received = bytes.fromhex(signature_hex)
+        except ValueError:
+            return False
+
+        return hmac.compare_digest(received, self._digest(keyed, message))
@@ -0,0 +1,221 @@
+"""
+Read-only, memory-mapped snapshot of GenericItemSet shared by every worker
+
+Layout (little-endian):
+    header      magic, version, item count, build time, records offset
+    index       one fixed-size entry per item, sorted by content hash:
+                sha256 (32 bytes), ObjectId (12 bytes), record offset, record length
+    records     canonical generic item json, packed back to back
+
+Workers map the same file, so the pages are shared through the OS page cache
+and a lookup is a binary search over the index with no Mongo round trip. The
+refresher writes a new file next to the old one and os.replace()s it into
+place; readers notice the new inode and remap.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from canonical import canonicalize_generic_item, generic_item_hash
+
+MongoObject = Dict[str, Any]
+
+MAGIC = b"SYGSNAP1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+INDEX_ENTRY = struct.Struct("<32s12sQI")
+HASH_SIZE = 32
+
+
+## Building
+
+"""
+Input: Iterable of GenericItemSet documents (with _id) and the path to write
+Output: Int number of items written. The file at path is replaced atomically
+"""
+def build_snapshot(generic_items: Iterable[MongoObject], path: str) -> int:
+    entries = {}
+    for item in generic_items:
+        canonical = canonicalize_generic_item(item)
+        record = json.dumps(canonical, separators=(",", ":"), ensure_ascii=False).encode()
+        entries[bytes.fromhex(generic_item_hash(canonical))] = (item["_id"].binary, record)
+
+    index_size = INDEX_ENTRY.size * len(entries)
+    records_offset = HEADER.size + index_size
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries), time.time_ns(), records_offset))
+
+        offset = 0
+        records = []
+        for key in sorted(entries):
+            oid, record = entries[key]
+            f.write(INDEX_ENTRY.pack(key, oid, offset, len(record)))
+            records.append(record)
+            offset += len(record)
+        for record in records:
+            f.write(record)
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+## Reading
+
+class GenericItemSnapshot:
+    """
+    One mapped snapshot file. Immutable once opened. Raises ValueError for a
+    file that is not a whole snapshot
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a generic item snapshot")
+        magic, version, self.count, self.built_at_ns, self._records_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} generic item snapshot")
+
+        index_end = HEADER.size + self.count * INDEX_ENTRY.size
+        if self._records_offset != index_end or len(self._map) < index_end:
+            raise ValueError(f"{path} is truncated or corrupt")
+        # Records are written in index order, so the last one ends the file
+        records_size = 0
+        if self.count > 0:
+            _, _, offset, length = INDEX_ENTRY.unpack_from(self._map, index_end - INDEX_ENTRY.size)
+            records_size = offset + length
+        if len(self._map) != index_end + records_size:
+            raise ValueError(f"{path} is truncated or corrupt")
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, content_hash: str) -> Optional[Tuple[bytes, int, int]]:
+        key = bytes.fromhex(content_hash)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = HEADER.size + mid * INDEX_ENTRY.size
+            probe = self._map[start:start + HASH_SIZE]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                _, oid, offset, length = INDEX_ENTRY.unpack_from(self._map, start)
+                return oid, offset, length
+        return None
+
+    """
+    Input: Hex content hash (see canonical.generic_item_hash)
+    Output: ObjectId of the matching GenericItemSet document, or None
+    """
+    def lookup_id(self, content_hash: str) -> Optional[ObjectId]:
+        found = self._find(content_hash)
+        return None if found == None else ObjectId(found[0])
+
+    def _record(self, offset: int, length: int) -> MongoObject:
+        start = self._records_offset + offset
+        return json.loads(self._map[start:start + length])
+
+    """
+    Input: Hex content hash
+    Output: Canonical generic item, or None
+    """
+    def get_item(self, content_hash: str) -> Optional[MongoObject]:
+        found = self._find(content_hash)
+        return None if found == None else self._record(found[1], found[2])
+
+    """
+    Output: (ObjectId, canonical generic item) for every item, in hash order
+    """
+    def items(self) -> Iterator[Tuple[ObjectId, MongoObject]]:
+        for i in range(self.count):
+            _, oid, offset, length = INDEX_ENTRY.unpack_from(self._map, HEADER.size + i * INDEX_ENTRY.size)
+            yield ObjectId(oid), self._record(offset, length)
+
+
+class SnapshotReader:
+    """
+    Follows the snapshot file at path, remapping it after the refresher swaps
+    in a new one. The file is stat()ed at most once every check_interval seconds
+    """
+
+    def __init__(self, path: str, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    """
+    Output: The current GenericItemSnapshot, or None if there is no usable file yet
+    """
+    def current(self) -> Optional[GenericItemSnapshot]:
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._snapshot
+
+        with self._lock:
+            if now < self._next_check:
+                return self._snapshot
+            self._next_check = now + self.check_interval
+            try:
+                inode = os.stat(self.path).st_ino
+                if self._snapshot == None or self._snapshot.inode != inode:
+                    # The old mapping is unmapped once no request still holds it
+                    self._snapshot = GenericItemSnapshot(self.path)
+            except (OSError, ValueError):
+                self._snapshot = None
+            return self._snapshot
+
+    def lookup_id(self, content_hash: str) -> Optional[ObjectId]:
+        snapshot = self.current()
+        return None if snapshot == None else snapshot.lookup_id(content_hash)
+
+
+## Refreshing
+
+"""
+Rebuilds the snapshot at path from collection whenever it changes. Uses a 
+change stream where the cluster supports one, otherwise rebuilds every 
+interval seconds. Runs until interrupted 
+Input: GenericItemSet collection reference, snapshot path, polling interval, 
+    and on_rebuild(count) called after every swap
+"""
+def run_refresher(collection, path: str, interval: float = 60.0, on_rebuild=None):
+    def rebuild():
+        count = build_snapshot(collection.find({}), path)
+        if on_rebuild != None:
+            on_rebuild(count)
+
+    rebuild()
+    while True:
+        try:
+            with collection.watch(max_await_time_ms=1000) as stream:
+                while stream.alive:
+                    if stream.try_next() == None:
+                        continue
+                    # Coalesce a burst of changes into one rebuild: keep
+                    # draining until a second passes with no new change
+                    while stream.try_next() != None:
+                        pass
+                    rebuild()
+        except PyMongoError:
+            time.sleep(interval)
+            rebuild()
@@ -0,0 +1,588 @@
+"""
+Storage backends behind data.py
+
+data.py only ever talks to collection objects handed out by a backend, so the
+backend decides where documents live. STORAGE_BACKEND in config.py selects one:
+
+    mongo   pymongo collections on this process's client (see mongo_client.py)
+    memory  MemoryCollection, an in-process stand-in for load tests,
+            benchmarks and running the mongo tests offline. Nothing is
+            persisted and every worker has its own copy
+
+MemoryCollection implements the subset of the pymongo Collection API that
+data.py, manage.py, snapshot.py and the tests use, with the same return
+types and errors: insert_one / insert_many (ordered or not), find / find_one
+with equality, $exists, $in, $nin, $ne and range filters and projections,
+find_one_and_delete, update_one with upsert and $set / $setOnInsert / $inc /
+$push, bulk_write of InsertOne / UpdateOne / DeleteOne, unique (and partial)
+indexes, delete_one / delete_many, count_documents, and aggregate with $match
+and $group stages summing numbers, fields or $ifNull of a field.
+"""
+
+import threading
+
+from abc import ABC, abstractmethod
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+from typing import Any, Dict, List, Optional
+
+from mongo_client import LazyCollection, close_client
+
+MongoObject = Dict[str, Any]
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class Storage(ABC):
+    """
+    A backend hands out collection objects by database and collection name
+    """
+
+    @abstractmethod
+    def collection(self, database_name: str, name: str):
+        pass
+
+    def close(self):
+        pass
+
+
+class MongoStorage(Storage):
+    def collection(self, database_name: str, name: str):
+        return LazyCollection(database_name, name)
+
+    def close(self):
+        close_client()
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections = {}
+
+    def collection(self, database_name: str, name: str):
+        with self._lock:
+            key = (database_name, name)
+            if key not in self._collections:
+                self._collections[key] = MemoryCollection(name)
+            return self._collections[key]
+
+
+STORAGE_BACKENDS = {
+    "mongo": MongoStorage,
+    "memory": MemoryStorage,
+}
+
+"""
+Input: Backend name, one of STORAGE_BACKENDS
+Output: New Storage
+"""
+def make_storage(backend: str) -> Storage:
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(STORAGE_BACKENDS)}, got {backend!r}")
+    return STORAGE_BACKENDS[backend]()
+
+
+##
+## In-memory collection
+##
+
+_MISSING = object()
+
+## Documents are copied in and out, as a round trip through BSON would
+def _copy(value):
+    if type(value) is dict:
+        return {k: _copy(v) for k, v in value.items()}
+    if type(value) is list:
+        return [_copy(v) for v in value]
+    return value
+
+def _hashable(value):
+    if type(value) is dict:
+        return tuple((k, _hashable(v)) for k, v in value.items())
+    if type(value) is list:
+        return tuple(_hashable(v) for v in value)
+    return value
+
+def _get_path(document, path: str):
+    value = document
+    for part in path.split("."):
+        if type(value) is not dict or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _set_path(document, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+def _compare(value, operand, op) -> bool:
+    if value is _MISSING:
+        return False
+    try:
+        return op(value, operand)
+    except TypeError:
+        # Mongo only compares values of the same type
+        return False
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+def _equals(value, expected) -> bool:
+    if value is _MISSING:
+        return expected == None
+    if type(value) is list and type(expected) is not list:
+        return expected in value
+    return value == expected
+
+def _matches_condition(value, condition) -> bool:
+    if type(condition) is not dict or not any(k.startswith("$") for k in condition):
+        return _equals(value, condition)
+
+    for op, operand in condition.items():
+        if op == "$eq":
+            ok = _equals(value, operand)
+        elif op == "$ne":
+            ok = not _equals(value, operand)
+        elif op == "$exists":
+            ok = (value is not _MISSING) == bool(operand)
+        elif op == "$in":
+            ok = any(_equals(value, v) for v in operand)
+        elif op == "$nin":
+            ok = not any(_equals(value, v) for v in operand)
+        elif op in _COMPARISONS:
+            ok = _compare(value, operand, _COMPARISONS[op])
+        else:
+            raise OperationFailure(f"{op} is not supported by the memory backend")
+        if not ok:
+            return False
+    return True
+
+def _matches(document: MongoObject, query: Optional[MongoObject]) -> bool:
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(_matches(document, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(document, q) for q in condition):
+                return False
+        elif not _matches_condition(_get_path(document, key), condition):
+            return False
+    return True
+
+def _project(document: MongoObject, projection) -> MongoObject:
+    if projection == None:
+        return _copy(document)
+    if type(projection) is not dict:
+        projection = {field: 1 for field in projection}
+
+    include_id = bool(projection.get("_id", 1))
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if any(fields.values()):
+        projected = {k: _copy(document[k]) for k in fields if k in document}
+    else:
+        projected = {k: _copy(v) for k, v in document.items() if k not in fields and k != "_id"}
+    if include_id and "_id" in document:
+        projected = {"_id": document["_id"], **projected}
+    return projected
+
+def _evaluate(document: MongoObject, expression):
+    if type(expression) is str and expression.startswith("$"):
+        value = _get_path(document, expression[1:])
+        return None if value is _MISSING else value
+    if type(expression) is dict and list(expression) == ["$ifNull"]:
+        value, default = expression["$ifNull"]
+        value = _evaluate(document, value)
+        return _evaluate(document, default) if value == None else value
+    if type(expression) is dict:
+        raise OperationFailure(f"{next(iter(expression))} is not supported by the memory backend")
+    return expression
+
+def _group(documents: List[MongoObject], spec: MongoObject) -> List[MongoObject]:
+    groups = {}
+    for document in documents:
+        key = _evaluate(document, spec["_id"])
+        group = groups.setdefault(_hashable(key), {"_id": key})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            if list(accumulator) != ["$sum"]:
+                raise OperationFailure(f"{next(iter(accumulator))} is not supported by the memory backend")
+            value = _evaluate(document, accumulator["$sum"])
+            group[field] = group.get(field, 0) + (value if type(value) in (int, float) else 0)
+    return list(groups.values())
+
+def _index_fields(keys) -> List[str]:
+    if type(keys) is str:
+        return [keys]
+    return [k if type(k) is str else k[0] for k in keys]
+
+
+class MemoryCursor:
+    """
+    Result of MemoryCollection.find. Holds the matching documents, already
+    copied, and supports the cursor methods the callers chain on it
+    """
+
+    def __init__(self, documents: List[MongoObject]):
+        self._documents = documents
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=ASCENDING):
+        keys = [(key_or_list, direction)] if type(key_or_list) is str else list(key_or_list)
+        # Stable sorts, least significant key first
+        for field, field_direction in reversed(keys):
+            present = [d for d in self._documents if _get_path(d, field) is not _MISSING]
+            missing = [d for d in self._documents if _get_path(d, field) is _MISSING]
+            present.sort(key=lambda d: _get_path(d, field), reverse=field_direction < 0)
+            # Missing sorts as null, before everything ascending
+            self._documents = missing + present if field_direction > 0 else present + missing
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        end = None if self._limit == 0 else self._skip + self._limit
+        return iter(self._documents[self._skip:end])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemoryCollection:
+    """
+    Dict-backed collection, see the module docstring for what is supported.
+    Documents are kept in insertion order, keyed by _id. Safe to share
+    between threads
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.RLock()
+        self._documents: Dict[Any, MongoObject] = {}
+        # index name -> (fields, partial filter, {key: _id})
+        self._unique_indexes = {}
+
+    ## Indexes
+
+    def create_index(self, keys, unique=False, name=None, partialFilterExpression=None, **kwargs):
+        fields = _index_fields(keys)
+        name = name or "_".join(f"{field}_1" for field in fields)
+        if not unique:
+            return name
+
+        with self._lock:
+            entries = {}
+            index = (fields, partialFilterExpression, entries)
+            for document in self._documents.values():
+                key = self._index_key(index, document)
+                if key is _MISSING:
+                    continue
+                if key in entries:
+                    raise OperationFailure(
+                        f"E11000 duplicate key error collection: {self.name} index: {name}",
+                        code=DUPLICATE_KEY_ERROR,
+                    )
+                entries[key] = document["_id"]
+            self._unique_indexes[name] = index
+        return name
+
+    def _index_key(self, index, document):
+        fields, partial, _ = index
+        if partial != None and not _matches(document, partial):
+            return _MISSING
+        values = []
+        for field in fields:
+            value = _get_path(document, field)
+            values.append(None if value is _MISSING else _hashable(value))
+        return tuple(values)
+
+    def _check_unique(self, document, replacing_id=_MISSING):
+        for name, index in self._unique_indexes.items():
+            key = self._index_key(index, document)
+            if key is _MISSING:
+                continue
+            existing = index[2].get(key, _MISSING)
+            if existing is not _MISSING and existing != replacing_id:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {name}",
+                    code=DUPLICATE_KEY_ERROR,
+                )
+
+    def _index_add(self, document):
+        for index in self._unique_indexes.values():
+            key = self._index_key(index, document)
+            if key is not _MISSING:
+                index[2][key] = document["_id"]
+
+    def _index_remove(self, document):
+        for index in self._unique_indexes.values():
+            key = self._index_key(index, document)
+            if key is not _MISSING and index[2].get(key) == document["_id"]:
+                del index[2][key]
+
+    def _store(self, document):
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} index: _id_",
+                code=DUPLICATE_KEY_ERROR,
+            )
+        self._check_unique(document)
+        self._documents[document["_id"]] = document
+        self._index_add(document)
+
+    def _replace(self, old, new):
+        self._check_unique(new, replacing_id=old["_id"])
+        self._index_remove(old)
+        self._documents[new["_id"]] = new
+        self._index_add(new)
+
+    def _remove(self, document):
+        self._index_remove(document)
+        del self._documents[document["_id"]]
+
+    ## Lookup
+
+    def _candidates(self, query):
+        if not query:
+            return list(self._documents.values())
+
+        _id = query.get("_id", _MISSING)
+        if _id is not _MISSING and type(_id) is not dict:
+            document = self._documents.get(_id)
+            return [] if document == None else [document]
+
+        # Equality on every field of a full (not partial) unique index
+        for fields, partial, entries in self._unique_indexes.values():
+            if partial != None and not _matches(query, partial):
+                continue
+            values = [query.get(field, _MISSING) for field in fields]
+            if all(v is not _MISSING and type(v) is not dict for v in values):
+                _id = entries.get(tuple(_hashable(v) for v in values), _MISSING)
+                return [] if _id is _MISSING else [self._documents[_id]]
+
+        return list(self._documents.values())
+
+    def _find(self, query, limit=0):
+        found = []
+        for document in self._candidates(query):
+            if _matches(document, query):
+                found.append(document)
+                if len(found) == limit:
+                    break
+        return found
+
+    def find(self, filter=None, projection=None, **kwargs) -> MemoryCursor:
+        with self._lock:
+            return MemoryCursor([_project(document, projection) for document in self._find(filter)])
+
+    def find_one(self, filter=None, projection=None, **kwargs) -> Optional[MongoObject]:
+        if filter != None and type(filter) is not dict:
+            filter = {"_id": filter}
+        with self._lock:
+            found = self._find(filter, limit=1)
+            return _project(found[0], projection) if found else None
+
+    def find_one_and_delete(self, filter, projection=None, **kwargs) -> Optional[MongoObject]:
+        with self._lock:
+            found = self._find(filter, limit=1)
+            if not found:
+                return None
+            self._remove(found[0])
+            return _project(found[0], projection)
+
+    def count_documents(self, filter, **kwargs) -> int:
+        with self._lock:
+            return len(self._find(filter))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._documents)
+
+    def aggregate(self, pipeline: List[MongoObject], **kwargs) -> MemoryCursor:
+        with self._lock:
+            documents = [_copy(document) for document in self._documents.values()]
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                documents = [document for document in documents if _matches(document, spec)]
+            elif name == "$group":
+                documents = _group(documents, spec)
+            else:
+                raise OperationFailure(f"{name} is not supported by the memory backend")
+        return MemoryCursor(documents)
+
+    ## Inserts
+
+    def insert_one(self, document: MongoObject, **kwargs) -> InsertOneResult:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        with self._lock:
+            self._store(_copy(document))
+        return InsertOneResult(document["_id"], acknowledged=True)
+
+    def insert_many(self, documents: List[MongoObject], ordered=True, **kwargs) -> InsertManyResult:
+        result = self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+        return InsertManyResult([document["_id"] for document in documents], acknowledged=result.acknowledged)
+
+    ## Updates
+
+    def _apply_update(self, document, update, inserting):
+        for op, fields in update.items():
+            if op == "$setOnInsert" and not inserting:
+                continue
+            for path, value in fields.items():
+                if op in ("$set", "$setOnInsert"):
+                    _set_path(document, path, _copy(value))
+                elif op == "$inc":
+                    current = _get_path(document, path)
+                    _set_path(document, path, value if current is _MISSING else current + value)
+                elif op == "$push":
+                    current = _get_path(document, path)
+                    if current is _MISSING:
+                        current = []
+                        _set_path(document, path, current)
+                    elif type(current) is not list:
+                        raise OperationFailure(f"The field '{path}' must be an array", code=2)
+                    if type(value) is dict and "$each" in value:
+                        current.extend(_copy(value["$each"]))
+                    else:
+                        current.append(_copy(value))
+                else:
+                    raise OperationFailure(f"{op} is not supported by the memory backend")
+
+    def _update_one(self, filter, update, upsert):
+        found = self._find(filter, limit=1)
+        if found:
+            old = found[0]
+            new = _copy(old)
+            self._apply_update(new, update, inserting=False)
+            modified = new != old
+            if modified:
+                self._replace(old, new)
+            return {"n": 1, "nModified": 1 if modified else 0}
+
+        if not upsert:
+            return {"n": 0, "nModified": 0}
+
+        # The new document starts from the filter's equality conditions
+        document = {}
+        for key, condition in (filter or {}).items():
+            if not key.startswith("$") and not (type(condition) is dict and any(k.startswith("$") for k in condition)):
+                _set_path(document, key, _copy(condition))
+        self._apply_update(document, update, inserting=True)
+        if "_id" not in document:
+            document = {"_id": ObjectId(), **document}
+        self._store(document)
+        return {"n": 1, "nModified": 0, "upserted": document["_id"]}
+
+    def update_one(self, filter, update, upsert=False, **kwargs) -> UpdateResult:
+        with self._lock:
+            raw_result = self._update_one(filter, update, upsert)
+        return UpdateResult(dict(raw_result, ok=1.0), acknowledged=True)
+
+    ## Deletes
+
+    def delete_one(self, filter, **kwargs) -> DeleteResult:
+        with self._lock:
+            found = self._find(filter, limit=1)
+            for document in found:
+                self._remove(document)
+        return DeleteResult({"n": len(found), "ok": 1.0}, acknowledged=True)
+
+    def delete_many(self, filter, **kwargs) -> DeleteResult:
+        with self._lock:
+            found = self._find(filter)
+            for document in found:
+                self._remove(document)
+        return DeleteResult({"n": len(found), "ok": 1.0}, acknowledged=True)
+
+    ## Bulk writes
+
+    def bulk_write(self, requests, ordered=True, **kwargs) -> BulkWriteResult:
+        result = {
+            "writeErrors": [],
+            "writeConcernErrors": [],
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        }
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    self._bulk_write_one(index, request, result)
+                except (DuplicateKeyError, OperationFailure) as e:
+                    result["writeErrors"].append({
+                        "index": index,
+                        "code": e.code,
+                        "errmsg": str(e),
+                        "op": getattr(request, "_doc", None) or getattr(request, "_filter", None),
+                    })
+                    if ordered:
+                        break
+
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, acknowledged=True)
+
+    def _bulk_write_one(self, index, request, result):
+        if isinstance(request, InsertOne):
+            document = request._doc
+            if "_id" not in document:
+                document["_id"] = ObjectId()
+            self._store(_copy(document))
+            result["nInserted"] += 1
+        elif isinstance(request, UpdateOne):
+            raw_result = self._update_one(request._filter, request._doc, request._upsert)
+            if "upserted" in raw_result:
+                result["nUpserted"] += 1
+                result["upserted"].append({"index": index, "_id": raw_result["upserted"]})
+            else:
+                result["nMatched"] += raw_result["n"]
+                result["nModified"] += raw_result["nModified"]
+        elif isinstance(request, DeleteOne):
+            found = self._find(request._filter, limit=1)
+            for document in found:
+                self._remove(document)
+            result["nRemoved"] += len(found)
+        else:
+            raise OperationFailure(f"{type(request).__name__} is not supported by the memory backend")
+
+    ## Change streams
+
+    def watch(self, *args, **kwargs):
+        # snapshot.run_refresher falls back to polling
+        raise OperationFailure("Change streams are not supported by the memory backend")
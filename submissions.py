@@ -0,0 +1,100 @@
+"""
+Submission documents shared by data.py and async_data.py
+
+Builds the dedup upserts and review queue votes without doing any I/O, so the
+blocking and the async write paths store the same documents and only differ
+in how they send them.
+"""
+
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from typing import Any, Dict, List, Tuple
+
+from canonical import canonicalize_generic_item, generic_item_hash
+
+## Typings
+MongoObject = Dict[str, Any]
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+## Deduplicated submissions
+##  - only used when DEDUP_SUBMISSIONS is set. Each distinct submission is a 
+##    single document keyed by its SubmissionHash that counts how often it 
+##    was submitted, instead of one document per submission
+
+SUBMISSION_HASH_FIELD = "SubmissionHash"
+SUBMISSION_COUNT_FIELD = "SubmissionCount"
+FIRST_SEEN_FIELD = "FirstSeen"
+LAST_SEEN_FIELD = "LastSeen"
+
+"""
+Input: Dict document carrying its SubmissionHash, how many submissions it 
+    stands for and the time they were seen 
+Output: (filter, update) for an upsert that creates the document on first 
+    sight and otherwise bumps its count and last-seen time 
+"""
+def submission_upsert(document: MongoObject, count: int, now: datetime):
+    fields = {k: v for k, v in document.items() if k not in (SUBMISSION_HASH_FIELD, "_id")}
+    fields[FIRST_SEEN_FIELD] = now
+    return (
+        {SUBMISSION_HASH_FIELD: document[SUBMISSION_HASH_FIELD]},
+        {
+            "$setOnInsert": fields,
+            "$inc": {SUBMISSION_COUNT_FIELD: count},
+            "$set": {LAST_SEEN_FIELD: now},
+        },
+    )
+
+
+## Generic Item Update Review Queue
+##  - see data.py for the document format
+
+REVIEW_ORIGINAL_HASH_FIELD = "OriginalHash"
+
+"""
+Input: List of Dict generic item updates and the time they were proposed
+Output: List of UpdateOne upserts, one per distinct Original, with the votes 
+    for each of its distinct Updated summed
+"""
+def review_vote_operations(generic_item_updates: List[MongoObject], now: datetime):
+    votes = {}
+    for update in generic_item_updates:
+        original_hash = generic_item_hash(update["Original"])
+        entry = votes.setdefault(original_hash, (update["Original"], {}))
+        updated_hash = generic_item_hash(update["Updated"])
+        updated, count = entry[1].get(updated_hash, (update["Updated"], 0))
+        entry[1][updated_hash] = (updated, count + 1)
+
+    operations = []
+    for original_hash, (original, updates) in votes.items():
+        to_set = {"LastProposed": now}
+        to_inc = {"TotalVotes": 0}
+        for updated_hash, (updated, count) in updates.items():
+            to_set[f"Updates.{updated_hash}.Updated"] = canonicalize_generic_item(updated)
+            to_inc[f"Updates.{updated_hash}.Votes"] = count
+            to_inc["TotalVotes"] += count
+        operations.append(UpdateOne(
+            {REVIEW_ORIGINAL_HASH_FIELD: original_hash},
+            {
+                "$setOnInsert": {"Original": canonicalize_generic_item(original), "FirstProposed": now},
+                "$set": to_set,
+                "$inc": to_inc,
+            },
+            upsert=True,
+        ))
+    return operations
+
+"""
+Input: Review vote operations sent unordered and the BulkWriteError they raised
+Output: (Int operations that failed for good, List of operations to send
+    again). Only a duplicate key, from two first votes for the same Original
+    racing, is worth sending again
+"""
+def split_review_vote_errors(operations: List[UpdateOne], error: BulkWriteError) -> Tuple[int, List[UpdateOne]]:
+    errors = error.details["writeErrors"]
+    failed = sum(1 for err in errors if err["code"] != DUPLICATE_KEY_ERROR)
+    retry = [operations[err["index"]] for err in errors if err["code"] == DUPLICATE_KEY_ERROR]
+    return failed, retry
@@ -0,0 +1,188 @@
+"""
+Trigram index for suggesting GenericItemSet items from a scanned name
+
+Names are lowercased, split into words on anything not a letter or digit,
+and each word padded and cut into trigrams ("appl" -> "  a", " ap", "app",
+"ppl", "pl "), so a receipt abbreviation still shares most trigrams with the
+full word. The index maps each trigram to the items whose name has it.
+
+A query scores only the items sharing a trigram with it:
+    coverage of the query   idf-weighted share of its trigrams the item has,
+                            so rare trigrams count for more than common ones
+    coverage of the item    share of the item's trigrams the query has
+and ranks by their geometric mean, so "Gala Apple" beats "Apple" for
+"ORG GALA APPL 3LB", and both beat "Pineapple".
+
+The index is updated in place: sync_index, run by a refresher (see
+refresher.py), diffs _id and content hash against GenericItemSet and only
+reindexes what was added, changed or removed.
+"""
+
+import heapq
+import math
+import os
+import re
+import threading
+
+from typing import Any, Dict, List, Optional, Set
+
+from canonical import CONTENT_HASH_FIELD
+
+MongoObject = Dict[str, Any]
+
+WORD = re.compile(r"[^\W_]+")
+
+## Candidates a query gathers from its rarer trigrams before its commoner
+## ones stop adding new ones
+MIN_CANDIDATES = 200
+
+## Items fetched per round trip when reindexing
+FETCH_CHUNK_SIZE = 1000
+
+
+"""
+Input: Name, e.g. a receipt line
+Output: Set of the trigrams of its words
+"""
+def trigrams(name: str) -> Set[str]:
+    grams = set()
+    for word in WORD.findall(name.casefold()):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class TrigramIndex:
+    """
+    Items are added and removed by key (the GenericItemSet _id). Queries and
+    updates share a lock; a query holds it for well under a millisecond
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # trigram -> keys of the items with it
+        self._postings: Dict[str, Set[Any]] = {}
+        # key -> (content hash, item, trigrams)
+        self._items: Dict[Any, tuple] = {}
+        # The refresher thread may hold the lock at a fork; the child has no
+        # such thread
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    """
+    Output: Dict of key to the content hash it was indexed with
+    """
+    def hashes(self) -> Dict[Any, Optional[str]]:
+        with self._lock:
+            return {key: entry[0] for key, entry in self._items.items()}
+
+    """
+    Input: Key, content hash and item (a Dict with Name). Replaces any item
+        already under the key
+    """
+    def add(self, key, content_hash: Optional[str], item: MongoObject):
+        grams = trigrams(item.get("Name", ""))
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (content_hash, item, grams)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._items.pop(key, None)
+        if entry == None:
+            return
+        for gram in entry[2]:
+            keys = self._postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self._postings[gram]
+
+    """
+    Input: Scanned name, how many suggestions at most, lowest score kept
+    Output: List of (score, key, item), best first
+    """
+    def search(self, name: str, limit: int = 5, min_score: float = 0.0) -> List[tuple]:
+        query = trigrams(name)
+        if not query:
+            return []
+
+        with self._lock:
+            total = len(self._items)
+            query_weight = 0.0
+            # Rarest trigrams first: they find the candidates. Once there are
+            # enough, a common trigram only adds to the candidates it has
+            # instead of walking its whole posting list
+            found = []
+            for gram in query:
+                keys = self._postings.get(gram)
+                frequency = 0 if keys == None else len(keys)
+                idf = math.log(1 + (total + 1) / (frequency + 1))
+                query_weight += idf
+                if frequency > 0:
+                    found.append((frequency, idf, keys))
+            found.sort(key=lambda entry: entry[0])
+
+            weights: Dict[Any, float] = {}
+            matches: Dict[Any, int] = {}
+            weight_of, matches_of = weights.get, matches.get
+            for frequency, idf, keys in found:
+                if len(weights) >= MIN_CANDIDATES and frequency > len(weights):
+                    for key in [key for key in weights if key in keys]:
+                        weights[key] += idf
+                        matches[key] += 1
+                    continue
+                for key in keys:
+                    weights[key] = weight_of(key, 0.0) + idf
+                    matches[key] = matches_of(key, 0) + 1
+
+            items = self._items
+            scored = []
+            for key, weight in weights.items():
+                score = math.sqrt(weight / query_weight * matches[key] / len(items[key][2]))
+                if score >= min_score:
+                    scored.append((score, key))
+            best = heapq.nlargest(limit, scored, key=lambda pair: pair[0])
+            return [(score, key, self._items[key][1]) for score, key in best]
+
+
+##
+## Keeping the index in step with GenericItemSet
+##
+
+"""
+Brings index up to date with collection, fetching only the items that were
+added or whose content hash changed
+Input: TrigramIndex, GenericItemSet collection reference
+Output: (Int added or changed, Int removed)
+"""
+def sync_index(index: TrigramIndex, collection):
+    indexed = index.hashes()
+    current = {
+        document["_id"]: document.get(CONTENT_HASH_FIELD)
+        for document in collection.find({}, {CONTENT_HASH_FIELD: 1})
+    }
+
+    removed = [key for key in indexed if key not in current]
+    for key in removed:
+        index.remove(key)
+
+    # An item without a content hash is only picked up when it first appears
+    changed = [key for key, content_hash in current.items() if key not in indexed or indexed[key] != content_hash]
+    for start in range(0, len(changed), FETCH_CHUNK_SIZE):
+        chunk = changed[start:start + FETCH_CHUNK_SIZE]
+        for document in collection.find({"_id": {"$in": chunk}}):
+            key = document.pop("_id")
+            content_hash = document.pop(CONTENT_HASH_FIELD, None)
+            index.add(key, content_hash, document)
+    return len(changed), len(removed)
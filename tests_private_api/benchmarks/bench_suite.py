@@ -0,0 +1,251 @@
+"""
+Benchmarks of each stage of the request hot path, in isolation:
+payload validation, HMAC signing and verification, JSON parsing and full
+round trips through every resource with Flask's test client, with data.py on
+the in-memory storage backend.
+
+Every benchmark is warmed up, then timed repeat times with the garbage
+collector off, keeping the best. A run is one such pass over every
+benchmark; a baseline is the best of rounds runs, and a comparison runs
+again, up to rounds times, while anything still looks slower than the
+tolerance, so one noisy run is not reported as a regression. Without a
+stored baseline the comparison fails:
+
+python run_tests.py bench [--save PATH] [--baseline PATH] [--update-baseline] [--repeat N] [--rounds N]
+"""
+
+import gc
+import json
+import os
+import platform
+import time
+
+from .bench_validation import (
+    GENERIC_ITEM,
+    MATCHED_ITEM,
+    UPDATED_GENERIC_ITEM,
+    INVALID_GENERIC_ITEM,
+)
+from . import memory_data
+
+from security.hmac_sig_gen import HmacVerifier, generate_hmac_signature
+from validation import check_generic_item, check_matched_item, check_updated_generic_item
+
+
+BENCH_DIR = os.path.dirname(__file__)
+DEFAULT_RESULTS_PATH = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_BASELINE_PATH = os.path.join(BENCH_DIR, "results", "baseline.json")
+
+## A benchmark is a regression when it is this much slower than the baseline
+DEFAULT_TOLERANCE = 0.20
+
+BENCH_SECRET_KEY = "benchmarksecretkey"
+HMAC_MESSAGE = "We were living to run, and running to live"
+BATCH_SIZE = 50
+
+
+## Timed repeats per benchmark in a run
+DEFAULT_REPEAT = 7
+## Runs a baseline is the best of, and most runs a comparison takes
+DEFAULT_ROUNDS = 3
+## Untimed calls before the first repeat, as a share of the calls per repeat
+WARMUP_FRACTION = 0.5
+
+
+"""
+Input: Callable taking no arguments, calls per repeat and number of repeats
+Output: Best time per call in microseconds, after an untimed warmup
+"""
+def time_per_call_us(fn, number, repeat=DEFAULT_REPEAT):
+    for _ in range(max(1, int(number * WARMUP_FRACTION))):
+        fn()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best == None else min(best, elapsed)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best / number * 1e6
+
+
+##
+## Stages
+##
+
+def bench_validation(repeat):
+    return {
+        "validate/generic_item": time_per_call_us(lambda: check_generic_item(GENERIC_ITEM), 20000, repeat),
+        "validate/generic_item_invalid": time_per_call_us(lambda: check_generic_item(INVALID_GENERIC_ITEM), 20000, repeat),
+        "validate/matched_item": time_per_call_us(lambda: check_matched_item(MATCHED_ITEM), 20000, repeat),
+        "validate/updated_generic_item": time_per_call_us(lambda: check_updated_generic_item(UPDATED_GENERIC_ITEM), 20000, repeat),
+    }
+
+
+def bench_hmac(api, repeat):
+    verifier = HmacVerifier({"default": BENCH_SECRET_KEY}, default_key_id="default")
+    signature = generate_hmac_signature(HMAC_MESSAGE, BENCH_SECRET_KEY).hex()
+    headers = {"X-Hmac-Signature": signature, "X-Hmac-Message": HMAC_MESSAGE, "X-Is-Test-Request": "False"}
+
+    results = {
+        "hmac/generate_hmac_signature": time_per_call_us(
+            lambda: generate_hmac_signature(HMAC_MESSAGE, BENCH_SECRET_KEY).hex(), 20000, repeat
+        ),
+        "hmac/verifier_verify": time_per_call_us(
+            lambda: verifier.verify(HMAC_MESSAGE, signature), 20000, repeat
+        ),
+    }
+    with api.app.test_request_context("/usersubmittedgenericitemset", method="POST", headers=headers):
+        results["hmac/validate_headers"] = time_per_call_us(api.validate_headers, 20000, repeat)
+    return results
+
+
+def bench_json_parsing(api, repeat):
+    from flask import request
+
+    results = {}
+    bodies = {
+        "json/get_json_generic_item": GENERIC_ITEM,
+        "json/get_json_updated_generic_item": UPDATED_GENERIC_ITEM,
+        f"json/get_json_batch_{BATCH_SIZE}": [GENERIC_ITEM] * BATCH_SIZE,
+    }
+    for name, body in bodies.items():
+        with api.app.test_request_context("/", method="POST", json=body):
+            # Read the body once up front so every get_json(cache=False)
+            # re-parses the same bytes instead of an exhausted stream
+            request.get_data()
+            results[name] = time_per_call_us(lambda: request.get_json(cache=False), 5000, repeat)
+    return results
+
+
+def bench_round_trips(api, repeat):
+    generic_item_id = memory_data.add_generic_item(GENERIC_ITEM)
+    client = api.app.test_client()
+    signature = generate_hmac_signature(HMAC_MESSAGE, BENCH_SECRET_KEY).hex()
+    headers = {"X-Hmac-Signature": signature, "X-Hmac-Message": HMAC_MESSAGE, "X-Is-Test-Request": "False"}
+
+    requests_by_name = {
+        "round_trip/usersubmittedgenericitemset": ("/usersubmittedgenericitemset", GENERIC_ITEM),
+        "round_trip/usersubmittedmatcheditemset": ("/usersubmittedmatcheditemset", MATCHED_ITEM),
+        "round_trip/userupdatedgenericitemset": ("/userupdatedgenericitemset", UPDATED_GENERIC_ITEM),
+        "round_trip/usersubmittedgenericitemset_invalid": ("/usersubmittedgenericitemset", INVALID_GENERIC_ITEM),
+        f"round_trip/usersubmittedgenericitemset_batch_{BATCH_SIZE}": ("/usersubmittedgenericitemset/batch", [GENERIC_ITEM] * BATCH_SIZE),
+    }
+
+    results = {}
+    for name, (url, body) in requests_by_name.items():
+        def post():
+            # Every insert_* stamps an _id into the document, so send a fresh copy
+            client.post(url, json=json.loads(json.dumps(body)), headers=headers)
+        results[name] = time_per_call_us(post, 500, repeat)
+        memory_data.clear()
+    # Leave the collections as found, for the next run
+    memory_data.remove_generic_item(generic_item_id)
+    return results
+
+
+##
+## Results
+##
+
+def run_all_benchmarks(repeat=DEFAULT_REPEAT):
+    os.environ.setdefault("PRIVATE_API_SECRET_KEY", BENCH_SECRET_KEY)
+    api = memory_data.import_api_with_memory_data()
+    api.hmac_verifier = HmacVerifier({"default": BENCH_SECRET_KEY}, default_key_id="default")
+
+    results = {}
+    results.update(bench_validation(repeat))
+    results.update(bench_hmac(api, repeat))
+    results.update(bench_json_parsing(api, repeat))
+    results.update(bench_round_trips(api, repeat))
+    return results
+
+
+"""
+Input: Results of two runs
+Output: Dict of each benchmark's best time of the two
+"""
+def best_of(results, other):
+    return {name: min(us, other.get(name, us)) for name, us in results.items()}
+
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "us_per_call": results,
+        }, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["us_per_call"]
+
+
+"""
+Input: Current and baseline results, and the allowed slowdown as a fraction
+Output: List of names of the benchmarks that regressed
+"""
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    return [name for name, us in results.items() if name in baseline and us / baseline[name] - 1 > tolerance]
+
+
+"""
+Prints current and baseline results side by side
+Output: List of names of the benchmarks that regressed, see find_regressions
+"""
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = find_regressions(results, baseline, tolerance)
+    print(f"{'benchmark':<56}{'us/call':>12}{'baseline':>12}{'change':>10}")
+    for name, us in results.items():
+        if name not in baseline:
+            print(f"{name:<56}{us:>12.2f}{'-':>12}{'new':>10}")
+            continue
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<56}{us:>12.2f}{baseline[name]:>12.2f}{us / baseline[name] - 1:>+9.0%}{flag}")
+    return regressions
+
+
+"""
+Runs every benchmark, saves the results to save_path and compares them with 
+the baseline at baseline_path
+Output: True if nothing regressed by more than tolerance. False if there is
+    no baseline to compare with, rather than passing with nothing compared
+"""
+def run_benchmarks(save_path=DEFAULT_RESULTS_PATH, baseline_path=DEFAULT_BASELINE_PATH, update_baseline=False, tolerance=DEFAULT_TOLERANCE, repeat=DEFAULT_REPEAT, rounds=DEFAULT_ROUNDS):
+    if not update_baseline and not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}, nothing to compare against.")
+        print("Record one on this machine first with: python run_tests.py bench --update-baseline")
+        return False
+    baseline = {} if update_baseline else load_results(baseline_path)
+
+    results = run_all_benchmarks(repeat)
+    for round_number in range(2, rounds + 1):
+        if not update_baseline:
+            suspects = find_regressions(results, baseline, tolerance)
+            if len(suspects) == 0:
+                break
+            print(f"{len(suspects)} benchmark(s) look slower than the baseline, run {round_number} of {rounds}")
+        results = best_of(results, run_all_benchmarks(repeat))
+    save_results(results, save_path)
+    print(f"Saved results to {save_path}")
+
+    if update_baseline:
+        save_results(results, baseline_path)
+        print(f"Saved results as the baseline at {baseline_path}")
+        return True
+
+    regressions = compare_results(results, baseline, tolerance)
+    if len(regressions) > 0:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {tolerance:.0%}")
+        return False
+    return True
@@ -0,0 +1,117 @@
+"""
+Microbenchmark of the precompiled payload validators in validation.py against
+the set-based validators they replaced
+
+python -m tests_private_api.benchmarks.bench_validation [--peak-rps N]
+"""
+
+import timeit
+
+from schema import (
+    GENERIC_ITEM_KEYS_AND_TYPES,
+    MATCHED_ITEM_KEYS_AND_TYPES,
+    UPDATE_GENERIC_ITEM_KEYS_AND_TYPES,
+)
+from validation import check_generic_item, check_matched_item, check_updated_generic_item
+
+
+GENERIC_ITEM = {
+    'Name': 'Apple',
+    'Category': 'Produce',
+    'Subcategory': 'Fresh',
+    'IsCut': False, 
+    'DaysInFridge': 30.0,
+    'DaysOnShelf': 10.0,
+    'DaysInFreezer': 240.0,
+    'Notes': '',
+    'Links': 'https://www.healthline.com/nutrition/how-long-do-apples-last#shelf-life'
+}
+
+MATCHED_ITEM = {
+    'ScannedItemName': 'ORG GALA APPL 3LB',
+    'GenericItemObj': GENERIC_ITEM,
+}
+
+UPDATED_GENERIC_ITEM = {
+    'Original': GENERIC_ITEM,
+    'Updated': dict(GENERIC_ITEM, DaysOnShelf=14.0),
+}
+
+INVALID_GENERIC_ITEM = dict(GENERIC_ITEM, IsCut='False', DaysInFridge='30.0')
+
+
+##
+## Set-based validators as they were before validation.py, returning a bool
+## instead of aborting. Kept here only as the baseline to compare against
+##
+
+def legacy_is_valid_generic_item_json(rec_json):
+    keys_to_validate = set(rec_json.keys())
+    if len(set(GENERIC_ITEM_KEYS_AND_TYPES.keys()).difference(keys_to_validate)) > 3 :
+        return False
+    for k in keys_to_validate:
+        if type(rec_json[k]) != GENERIC_ITEM_KEYS_AND_TYPES[k]:
+            if type(rec_json[k]) == int and GENERIC_ITEM_KEYS_AND_TYPES[k] == float: 
+                continue 
+            return False
+    return True
+
+def legacy_is_valid_matched_item_json(rec_json):
+    keys_to_validate = set(rec_json.keys())
+    if len(set(MATCHED_ITEM_KEYS_AND_TYPES.keys()).difference(keys_to_validate)) > 0 :
+        return False
+    for k in keys_to_validate:
+        if type(rec_json[k]) != MATCHED_ITEM_KEYS_AND_TYPES[k]:
+            return False
+        if type(rec_json[k]) == dict and not legacy_is_valid_generic_item_json(rec_json[k]): 
+            return False
+    return True
+
+def legacy_is_valid_updated_generic_item_json(rec_json):
+    keys_to_validate = set(rec_json.keys())
+    if len(set(UPDATE_GENERIC_ITEM_KEYS_AND_TYPES.keys()).difference(keys_to_validate)) > 0 :
+        return False
+    for k in keys_to_validate:
+        if type(rec_json[k]) != UPDATE_GENERIC_ITEM_KEYS_AND_TYPES[k]:
+            return False
+        if not legacy_is_valid_generic_item_json(rec_json[k]):
+            return False
+    return True
+
+
+CASES = [
+    ("generic item", GENERIC_ITEM, check_generic_item, legacy_is_valid_generic_item_json),
+    ("generic item, invalid", INVALID_GENERIC_ITEM, check_generic_item, legacy_is_valid_generic_item_json),
+    ("matched item", MATCHED_ITEM, check_matched_item, legacy_is_valid_matched_item_json),
+    ("updated generic item", UPDATED_GENERIC_ITEM, check_updated_generic_item, legacy_is_valid_updated_generic_item_json),
+]
+
+
+"""
+Input: Callable taking no arguments
+Output: Best time per call in microseconds over a few repeats
+"""
+def time_per_call_us(fn, number=20000, repeat=5):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def run_validation_benchmarks(peak_rps=200):
+    print(f"{'payload':<24}{'compiled us':>14}{'legacy us':>12}{'speedup':>10}{'% core @ peak':>16}")
+    results = {}
+    for name, payload, check, legacy in CASES:
+        compiled_us = time_per_call_us(lambda: check(payload))
+        legacy_us = time_per_call_us(lambda: legacy(payload))
+        core_share = compiled_us * peak_rps / 1e6 * 100
+        print(f"{name:<24}{compiled_us:>14.3f}{legacy_us:>12.3f}{legacy_us / compiled_us:>9.1f}x{core_share:>15.4f}%")
+        results[name] = compiled_us
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peak-rps", type=float, default=200, help="peak requests per second to size the cpu cost against")
+    args = parser.parse_args()
+
+    run_validation_benchmarks(args.peak_rps)
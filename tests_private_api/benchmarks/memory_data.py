@@ -0,0 +1,40 @@
+"""
+Runs the real data.py on the in-memory storage backend (see storage.py), so
+the request hot path can be benchmarked without a database
+"""
+
+import os
+import sys
+
+from canonical import with_content_hash
+
+
+"""
+Output: api module imported with data.py on the memory backend
+"""
+def import_api_with_memory_data():
+    os.environ["STORAGE_BACKEND"] = "memory"
+    if "config" in sys.modules and sys.modules["config"].storage_backend != "memory":
+        raise RuntimeError("config was already imported with another STORAGE_BACKEND")
+    import api
+    return api
+
+
+## Test setup
+
+def add_generic_item(generic_item):
+    import data
+    return data.generic_item_set.insert_one(with_content_hash(dict(generic_item))).inserted_id
+
+def remove_generic_item(generic_item_id):
+    import data
+    data.generic_item_set.delete_one({'_id': generic_item_id})
+
+def clear():
+    import data
+    for collection in (
+        data.user_submitted_generic_item_set,
+        data.user_submitted_matched_item_dict,
+        data.user_updated_generic_item_set,
+    ):
+        collection.delete_many({})
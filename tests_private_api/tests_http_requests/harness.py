@@ -0,0 +1,195 @@
+"""
+Ways for the http tests to reach the api
+
+ - in process: requests go straight to api.app through Flask's test client,
+   with data.py on the memory storage backend unless STORAGE_BACKEND says
+   otherwise. No server, no network, no sleeping
+ - local server: python api.py in a subprocess, used once it answers instead
+   of after a fixed wait. Only for what needs a real socket, like timeouts
+"""
+
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+
+from .test_config import secret_key
+
+## Bearer token /metrics is served with to the tests
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "local-metrics-token")
+
+## Generic item the matched item tests look up, as stored in GenericItemSet
+SEED_GENERIC_ITEM = {
+    'Name': 'Apple',
+    'Category': 'Produce',
+    'Subcategory': 'Fresh',
+    'IsCut': False,
+    'DaysInFridge': 30.0,
+    'DaysOnShelf': 10.0,
+    'DaysInFreezer': 240.0,
+    'Notes': '',
+    'Links': 'https://www.healthline.com/nutrition/how-long-do-apples-last#shelf-life'
+}
+
+
+##
+## In process
+##
+
+class InProcessResponse:
+    """
+    The parts of a requests.Response the tests read, from a Flask test response
+    """
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.get_data()
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class InProcessClient:
+    """
+    Takes full urls like requests does and sends their path to api.app
+    """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, url, json=None, headers=None, timeout=None, data=None):
+        path = urlsplit(url).path
+        if data != None and not isinstance(data, (bytes, str, dict)):
+            # An iterable, which requests sends chunked: no Content-Length
+            return InProcessResponse(self.client.post(
+                path, input_stream=io.BytesIO(b"".join(data)),
+                headers={**(headers or {}), "Transfer-Encoding": "chunked"},
+                environ_overrides={"wsgi.input_terminated": True},
+            ))
+        return InProcessResponse(self.client.post(path, json=json, data=data, headers=headers))
+
+    def get(self, url, headers=None, timeout=None, params=None):
+        path = urlsplit(url).path
+        return InProcessResponse(self.client.get(path, headers=headers, query_string=params))
+
+_in_process_client = None
+
+"""
+Output: InProcessClient on api.app, importing api on the first call
+"""
+def in_process_client() -> InProcessClient:
+    global _in_process_client
+    if _in_process_client != None:
+        return _in_process_client
+
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    os.environ.setdefault("METRICS_TOKEN", METRICS_TOKEN)
+    if secret_key != None:
+        os.environ.setdefault("PRIVATE_API_SECRET_KEY", secret_key)
+
+    import api
+    import data
+    from canonical import with_content_hash
+
+    if data.storage_backend == "memory":
+        data.generic_item_set.insert_one(with_content_hash(dict(SEED_GENERIC_ITEM)))
+
+    _in_process_client = InProcessClient(api.app)
+    return _in_process_client
+
+
+##
+## Local server
+##
+
+LOCAL_SERVER_URL = "http://localhost:5000"
+
+def start_local_server() -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("STORAGE_BACKEND", "memory")
+    env.setdefault("METRICS_TOKEN", METRICS_TOKEN)
+    if secret_key != None:
+        env.setdefault("PRIVATE_API_SECRET_KEY", secret_key)
+    return subprocess.Popen([sys.executable, "api.py"], env=env)
+
+"""
+Polls the server until it answers any http request
+Input: Server process, how long to wait in seconds
+"""
+def wait_until_ready(server: subprocess.Popen, url: str = LOCAL_SERVER_URL, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() != None:
+            raise RuntimeError(f"Local api exited with code {server.returncode} before it was ready")
+        try:
+            requests.get(url, timeout=0.25)
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.05)
+        except requests.exceptions.Timeout:
+            pass
+    raise RuntimeError(f"Local api did not answer within {timeout} seconds")
+
+"""
+Stops the server process for the duration, so a request connects (the
+kernel still accepts on its socket) but gets no answer. On the memory
+backend the server can answer in under a millisecond, the least a socket
+timeout waits, so a client timeout is otherwise not certain to fire
+"""
+@contextmanager
+def paused(server: subprocess.Popen):
+    server.send_signal(signal.SIGSTOP)
+    try:
+        yield
+    finally:
+        server.send_signal(signal.SIGCONT)
+
+def stop_local_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+##
+## Parallel runs
+##
+
+"""
+Runs each suite on its own thread and prints their reports in order
+Input: List of unittest suites, typically one per test class
+Output: Bool whether every suite passed
+"""
+def run_suites_in_parallel(suites, verbosity=1) -> bool:
+    def run(suite):
+        stream = io.StringIO()
+        result = unittest.TextTestRunner(stream=stream, verbosity=verbosity).run(suite)
+        return result, stream.getvalue()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, len(suites))) as pool:
+        outcomes = list(pool.map(run, suites))
+
+    passed = True
+    for result, report in outcomes:
+        sys.stderr.write(report)
+        passed = passed and result.wasSuccessful()
+    sys.stderr.write(f"\nRan {len(suites)} suites in parallel in {time.perf_counter() - start:.3f}s: {'OK' if passed else 'FAILED'}\n")
+    return passed
@@ -1,40 +1,90 @@
 """
 Fires off http requests to private api and tests return code
- 
+
+The local tests run in process through Flask's test client, see harness.py.
+Only the timeout test needs a real server
 """
 
-from time import sleep
 import requests
 from requests.exceptions import Timeout
 import unittest
-import subprocess
 import json 
+import gzip
+from random import random
 
 from .test_config import api_key, secret_key
+from .harness import (
+    METRICS_TOKEN,
+    in_process_client,
+    start_local_server,
+    wait_until_ready,
+    paused,
+    stop_local_server,
+    run_suites_in_parallel,
+)
 
 from security.hmac_sig_gen import generate_hmac_signature
 
 
-def run_local_api():
-    api = subprocess.Popen(["python", "api.py"])
-    return api
+##
+## Secured requests w/ hmac sig
+##
+def make_keyed_post_request(payload, url, timeout=5.0, key_id=None, post=requests.post, idempotency_key=None, chunked=False) -> requests.Response:
+    hmac_msg = "We were living to run, and running to live"
+    hmac_sig = generate_hmac_signature(hmac_msg, secret_key).hex()
+    headers = {"X-Hmac-Signature": hmac_sig, "X-Hmac-Message": hmac_msg, "X-Is-Test-Request": 'True'}
+    if key_id != None:
+        headers["X-Hmac-Key-Id"] = key_id
+    if idempotency_key != None:
+        headers["Idempotency-Key"] = idempotency_key
+    try:
+        if chunked:
+            # A generator body is sent with Transfer-Encoding: chunked
+            headers["Content-Type"] = "application/json"
+            response = post(url, data=iter([json.dumps(payload).encode()]), headers=headers, timeout=timeout)
+        else:
+            response = post(
+                url,
+                json=payload,
+                headers=headers,
+                timeout=timeout
+            )
+    except Timeout:
+        raise Timeout
 
+    return response
 
-def stop_local_api(api: subprocess.Popen):
-    subprocess.run(["kill", str(api.pid)])
+def make_keyed_ndjson_post_request(payloads, url, timeout=5.0, post=requests.post) -> requests.Response:
+    hmac_msg = "We were living to run, and running to live"
+    hmac_sig = generate_hmac_signature(hmac_msg, secret_key).hex()
+    headers = {
+        "X-Hmac-Signature": hmac_sig, 
+        "X-Hmac-Message": hmac_msg, 
+        "X-Is-Test-Request": 'True', 
+        "Content-Type": "application/x-ndjson",
+    }
+    body = "\n".join(json.dumps(payload) for payload in payloads) + "\n"
+    try:
+        response = post(
+            url,
+            data=body.encode(),
+            headers=headers,
+            timeout=timeout
+        )
+    except Timeout:
+        raise Timeout
 
+    return response
 
-##
-## Secured requests w/ hmac sig
-##
-def make_keyed_post_request(payload, url, timeout=5.0) -> requests.Response:
+def make_keyed_get_request(url, params=None, timeout=5.0, get=requests.get) -> requests.Response:
     hmac_msg = "We were living to run, and running to live"
     hmac_sig = generate_hmac_signature(hmac_msg, secret_key).hex()
+    headers = {"X-Hmac-Signature": hmac_sig, "X-Hmac-Message": hmac_msg, "X-Is-Test-Request": 'True'}
     try:
-        response = requests.post(
+        response = get(
             url,
-            json=payload,
-            headers={"X-Hmac-Signature": hmac_sig, "X-Hmac-Message": hmac_msg, "X-Is-Test-Request": 'True'},
+            params=params,
+            headers=headers,
             timeout=timeout
         )
     except Timeout:
@@ -43,13 +93,13 @@ def make_keyed_post_request(payload, url, timeout=5.0) -> requests.Response:
     return response
 
 ## Meant to fail requests
-def make_incorrect_key_post_request(payload, url, timeout=5.0) -> requests.Response:
+def make_incorrect_key_post_request(payload, url, timeout=5.0, post=requests.post) -> requests.Response:
     incorrect_secret_key = "thisisnothecorrectsecretkey"
     hmac_msg = "Til there was nothing left to burn, and nothing left to prove"
     hmac_sig = generate_hmac_signature(hmac_msg, incorrect_secret_key).hex()
 
     try:
-        response = requests.post(
+        response = post(
             url,
             json=payload,
             headers={"X-Hmac-Signature": hmac_sig, "X-Hmac-Message": hmac_msg, "X-Is-Test-Request": 'True'},
@@ -85,20 +135,30 @@ def make_timedout_post_request(payload, url) -> requests.Response:
 USER_SUBMITTED_GENERIC_ITEM_LOCAL = "http://localhost:5000/usersubmittedgenericitemset"
 USER_SUBMITTED_MATCHED_ITEM_LOCAL = "http://localhost:5000/usersubmittedmatcheditemset"
 USER_UPDATED_GENERIC_ITEM_LOCAL = "http://localhost:5000/userupdatedgenericitemset"
+USER_SUBMITTED_GENERIC_ITEM_BATCH_LOCAL = "http://localhost:5000/usersubmittedgenericitemset/batch"
+USER_SUBMITTED_GENERIC_ITEM_NDJSON_LOCAL = "http://localhost:5000/usersubmittedgenericitemset/ndjson"
+USER_SUBMITTED_GENERIC_ITEM_EXPORT_LOCAL = "http://localhost:5000/usersubmittedgenericitemset/export"
+GENERIC_ITEM_SUGGESTIONS_LOCAL = "http://localhost:5000/genericitemsuggestions"
+GENERIC_ITEM_AUTOCOMPLETE_LOCAL = "http://localhost:5000/genericitemautocomplete"
+METRICS_LOCAL = "http://localhost:5000/metrics"
 ## Remote endpoints
 USER_SUBMITTED_GENERIC_ITEM_REMOTE = "https://syg-user-submitted.herokuapp.com/usersubmittedgenericitemset"
 USER_SUBMITTED_MATCHED_ITEM_REMOTE = "https://syg-user-submitted.herokuapp.com/usersubmittedmatcheditemset"
 USER_UPDATED_GENERIC_ITEM_REMOTE = "https://syg-user-submitted.herokuapp.com/userupdatedgenericitemset"
+USER_SUBMITTED_GENERIC_ITEM_BATCH_REMOTE = "https://syg-user-submitted.herokuapp.com/usersubmittedgenericitemset/batch"
 
 
 ## HTTP Response Status codes
 SUCCESS_CODE = 200
-FORBIDDEN_CODE = 403 
+BAD_REQUEST_CODE = 400
+FORBIDDEN_CODE = 403
+PAYLOAD_TOO_LARGE_CODE = 413
+UNPROCESSABLE_CODE = 422 
 
 class PrivateLocalAPITests(unittest.TestCase):
-    def setUp(self) -> None:
-        self.api = run_local_api()
-        sleep(1)
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.client = in_process_client()
 
     def test_user_submitted_generic_item_post(self):
         payload = {
@@ -114,7 +174,7 @@ class PrivateLocalAPITests(unittest.TestCase):
         }
 
         try: 
-            response = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_LOCAL)
+            response = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post)
         except Timeout: 
             self.fail("Request timed out")
 
@@ -142,7 +202,7 @@ class PrivateLocalAPITests(unittest.TestCase):
         }
         
         try: 
-            response = make_keyed_post_request(payload, USER_SUBMITTED_MATCHED_ITEM_LOCAL)
+            response = make_keyed_post_request(payload, USER_SUBMITTED_MATCHED_ITEM_LOCAL, post=self.client.post)
         except Timeout: 
             self.fail("Request timed out")
 
@@ -180,7 +240,96 @@ class PrivateLocalAPITests(unittest.TestCase):
         }
 
         try:
-            response = make_keyed_post_request(payload, USER_UPDATED_GENERIC_ITEM_LOCAL)
+            response = make_keyed_post_request(payload, USER_UPDATED_GENERIC_ITEM_LOCAL, post=self.client.post)
+        except Timeout: 
+            self.fail("Request timed out")
+
+        failure_msg = f"Request failed. Response: {response.content}"
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg=failure_msg,
+        )
+
+    def test_user_submitted_generic_item_batch_post(self):
+        payload = [{
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': '',
+            'Links': ''
+        }, {
+            'Name': 'Random',
+            'Category': 'Produce',
+        }]
+
+        try: 
+            response = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_BATCH_LOCAL, post=self.client.post)
+        except Timeout: 
+            self.fail("Request timed out")
+
+        failure_msg = f"Request failed. Response: {response.content}"
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg=failure_msg,
+        )
+
+        results = json.loads(response.content)['results']
+        self.assertEqual(
+            [result['status'] for result in results],
+            [SUCCESS_CODE, FORBIDDEN_CODE],
+            msg=failure_msg,
+        )
+
+    def test_user_submitted_generic_item_ndjson_post(self):
+        payloads = [{
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': '',
+            'Links': ''
+        }, {
+            'Name': 'Random',
+            'Category': 'Produce',
+        }]
+
+        try: 
+            response = make_keyed_ndjson_post_request(payloads, USER_SUBMITTED_GENERIC_ITEM_NDJSON_LOCAL, post=self.client.post)
+        except Timeout: 
+            self.fail("Request timed out")
+
+        failure_msg = f"Request failed. Response: {response.content}"
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg=failure_msg,
+        )
+
+        summary = json.loads(response.content)
+        self.assertEqual(summary['accepted_lines'], [[1, 1]], msg=failure_msg)
+        self.assertEqual(
+            [rejection['line'] for rejection in summary['rejected_lines']],
+            [2],
+            msg=failure_msg,
+        )
+
+    def test_user_submitted_generic_item_page_get(self):
+        try: 
+            response = make_keyed_get_request(
+                USER_SUBMITTED_GENERIC_ITEM_LOCAL, params={"limit": 1, "fields": "Name"}, get=self.client.get
+            )
+            invalid_response = make_keyed_get_request(
+                USER_SUBMITTED_GENERIC_ITEM_LOCAL, params={"limit": 0}, get=self.client.get
+            )
         except Timeout: 
             self.fail("Request timed out")
 
@@ -191,6 +340,259 @@ class PrivateLocalAPITests(unittest.TestCase):
             msg=failure_msg,
         )
 
+        page = json.loads(response.content)
+        self.assertLessEqual(len(page['items']), 1, msg=failure_msg)
+        for item in page['items']:
+            self.assertEqual(set(item.keys()), {'_id', 'Name'}, msg=failure_msg)
+        self.assertIn('next', page, msg=failure_msg)
+
+        self.assertEqual(
+            invalid_response.status_code,
+            BAD_REQUEST_CODE,
+            msg="Page size out of range was not rejected",
+        )
+
+    def test_generic_item_suggestions_get(self):
+        try: 
+            response = make_keyed_get_request(
+                GENERIC_ITEM_SUGGESTIONS_LOCAL, params={"ScannedItemName": "ORG APPL 3LB", "limit": 3}, get=self.client.get
+            )
+            invalid_response = make_keyed_get_request(
+                GENERIC_ITEM_SUGGESTIONS_LOCAL, params={"limit": 3}, get=self.client.get
+            )
+        except Timeout: 
+            self.fail("Request timed out")
+
+        failure_msg = f"Request failed. Response: {response.content}"
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg=failure_msg,
+        )
+
+        suggestions = json.loads(response.content)['suggestions']
+        self.assertLessEqual(len(suggestions), 3, msg=failure_msg)
+        self.assertIn('Apple', [suggestion['GenericItemObj']['Name'] for suggestion in suggestions], msg=failure_msg)
+
+        self.assertEqual(
+            invalid_response.status_code,
+            BAD_REQUEST_CODE,
+            msg="Missing ScannedItemName was not rejected",
+        )
+
+    def test_generic_item_autocomplete_get(self):
+        try: 
+            response = make_keyed_get_request(
+                GENERIC_ITEM_AUTOCOMPLETE_LOCAL, params={"prefix": "app", "limit": 5}, get=self.client.get
+            )
+            invalid_response = make_keyed_get_request(
+                GENERIC_ITEM_AUTOCOMPLETE_LOCAL, params={"prefix": "app", "limit": 50}, get=self.client.get
+            )
+            last_code_point_response = make_keyed_get_request(
+                GENERIC_ITEM_AUTOCOMPLETE_LOCAL, params={"prefix": "a\U0010ffff"}, get=self.client.get
+            )
+        except Timeout: 
+            self.fail("Request timed out")
+
+        failure_msg = f"Request failed. Response: {response.content}"
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg=failure_msg,
+        )
+
+        completions = json.loads(response.content)['completions']
+        self.assertLessEqual(len(completions), 5, msg=failure_msg)
+        self.assertIn({'text': 'Apple', 'field': 'Name'}, [
+            {'text': completion['text'], 'field': completion['field']} for completion in completions
+        ], msg=failure_msg)
+
+        self.assertEqual(
+            invalid_response.status_code,
+            BAD_REQUEST_CODE,
+            msg="Limit out of range was not rejected",
+        )
+        self.assertEqual(
+            last_code_point_response.status_code,
+            SUCCESS_CODE,
+            msg=f"Prefix ending in U+10FFFF failed. Response: {last_code_point_response.content}",
+        )
+
+    def test_user_submitted_generic_item_export_get(self):
+        try: 
+            response = make_keyed_get_request(
+                USER_SUBMITTED_GENERIC_ITEM_EXPORT_LOCAL, params={"compress": "gzip"}, get=self.client.get
+            )
+            invalid_response = make_keyed_get_request(
+                USER_SUBMITTED_GENERIC_ITEM_EXPORT_LOCAL, params={"since": "yesterday"}, get=self.client.get
+            )
+        except Timeout: 
+            self.fail("Request timed out")
+
+        failure_msg = f"Request failed. Response: {response.content}"
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg=failure_msg,
+        )
+
+        for line in gzip.decompress(response.content).splitlines():
+            self.assertIn('_id', json.loads(line), msg=failure_msg)
+
+        self.assertEqual(
+            invalid_response.status_code,
+            BAD_REQUEST_CODE,
+            msg="Unparseable time was not rejected",
+        )
+
+    def test_idempotent_retry_replayed(self):
+        payload = {
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': '',
+            'Links': ''
+        }
+        idempotency_key = f"test-{random()}"
+
+        try: 
+            first = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post, idempotency_key=idempotency_key)
+            retry = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post, idempotency_key=idempotency_key)
+            reused = make_keyed_post_request(dict(payload, Name='Other'), USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post, idempotency_key=idempotency_key)
+        except Timeout: 
+            self.fail("Request timed out")
+
+        self.assertEqual(first.status_code, SUCCESS_CODE, msg=f"Request failed. Response: {first.content}")
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        self.assertEqual(retry.status_code, SUCCESS_CODE, msg=f"Retry failed. Response: {retry.content}")
+        self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true', msg="Retry was not answered from the stored response")
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(reused.status_code, UNPROCESSABLE_CODE, msg="Key reused for another body was not refused")
+
+    def test_refused_requests_do_not_take_idempotency_key(self):
+        payload = {
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': '',
+            'Links': ''
+        }
+        idempotency_key = f"test-{random()}"
+        hmac_msg = "Til there was nothing left to burn, and nothing left to prove"
+        forged_headers = {
+            "X-Hmac-Signature": generate_hmac_signature(hmac_msg, "thisisnothecorrectsecretkey").hex(),
+            "X-Hmac-Message": hmac_msg,
+            "X-Is-Test-Request": 'True',
+            "Idempotency-Key": idempotency_key,
+        }
+
+        try: 
+            forged = self.client.post(USER_SUBMITTED_GENERIC_ITEM_LOCAL, json=payload, headers=forged_headers, timeout=5.0)
+            invalid = make_keyed_post_request(dict(payload, DaysInFridge=30), USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post, idempotency_key=idempotency_key)
+            first = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post, idempotency_key=idempotency_key)
+        except Timeout: 
+            self.fail("Request timed out")
+
+        self.assertEqual(forged.status_code, 403, msg=f"Forged request was not refused. Response: {forged.content}")
+        self.assertEqual(invalid.status_code, 403, msg=f"Invalid payload was not refused. Response: {invalid.content}")
+        self.assertEqual(first.status_code, SUCCESS_CODE, msg=f"Key was taken by a refused request. Response: {first.content}")
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+
+    def test_oversized_body_rejected(self):
+        payload = [{
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': 'x' * 4096,
+            'Links': ''
+        }] * 300
+
+        try: 
+            response = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_BATCH_LOCAL, post=self.client.post)
+        except Timeout: 
+            self.fail("Request timed out")
+
+        self.assertEqual(
+            response.status_code,
+            PAYLOAD_TOO_LARGE_CODE,
+            msg=f"Oversized body was not refused. Response: {response.content}",
+        )
+
+    def test_oversized_chunked_body_rejected(self):
+        payload = [{
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': 'x' * 4096,
+            'Links': ''
+        }] * 300
+
+        try: 
+            response = make_keyed_post_request(
+                payload, USER_SUBMITTED_GENERIC_ITEM_BATCH_LOCAL, post=self.client.post, chunked=True
+            )
+            small_response = make_keyed_post_request(
+                payload[:1], USER_SUBMITTED_GENERIC_ITEM_BATCH_LOCAL, post=self.client.post, chunked=True
+            )
+        except Timeout: 
+            self.fail("Request timed out")
+
+        self.assertEqual(
+            response.status_code,
+            PAYLOAD_TOO_LARGE_CODE,
+            msg=f"Oversized chunked body was not refused. Response: {response.content}",
+        )
+        self.assertEqual(small_response.status_code, SUCCESS_CODE, msg=f"Response: {small_response.content}")
+
+    def test_rate_limited_request(self):
+        import api
+        from admission import make_bucket_store
+
+        payload = {
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': '',
+            'Links': ''
+        }
+        limits = (api.bucket_store, api.rate_limit_client_per_s, api.rate_limit_client_burst)
+        # Two requests, then next to no refill
+        api.bucket_store = make_bucket_store("")
+        api.rate_limit_client_per_s, api.rate_limit_client_burst = 0.01, 2
+        try: 
+            responses = [
+                make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post)
+                for _ in range(3)
+            ]
+        except Timeout: 
+            self.fail("Request timed out")
+        finally:
+            api.bucket_store, api.rate_limit_client_per_s, api.rate_limit_client_burst = limits
+
+        self.assertEqual([response.status_code for response in responses], [SUCCESS_CODE, SUCCESS_CODE, 429])
+        self.assertGreaterEqual(int(responses[2].headers["Retry-After"]), 1)
+        self.assertEqual(responses[2].json()["message"], "Too many requests, retry later")
+
     def test_invalid_hmac_user_submitted_generic_item(self):
         payload = {
             'Name': 'Random',
@@ -207,7 +609,7 @@ class PrivateLocalAPITests(unittest.TestCase):
         url = USER_SUBMITTED_GENERIC_ITEM_LOCAL
 
         try: 
-            response = make_incorrect_key_post_request(payload, url)
+            response = make_incorrect_key_post_request(payload, url, post=self.client.post)
         except Timeout:
             self.fail("Request timed out")
         
@@ -225,6 +627,73 @@ class PrivateLocalAPITests(unittest.TestCase):
             msg="Aborted request due to reasons other than invalid hmac"
         )
     
+    def test_metrics_count_aborted_request(self):
+        payload = {
+            'Name': 'Random',
+            'Category': 'Produce',
+        }
+
+        try: 
+            make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_LOCAL, post=self.client.post)
+            response = self.client.get(METRICS_LOCAL, headers={"Authorization": f"Bearer {METRICS_TOKEN}"}, timeout=5.0)
+        except Timeout:
+            self.fail("Request timed out")
+
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg="Incorrect status code")
+
+        self.assertIn(
+            'syg_request_errors_total{endpoint="usersubmittedgenericitemset",reason="invalid_json"}',
+            response.text,
+            msg="Aborted request was not counted"
+        )
+
+    def test_metrics_need_token(self):
+        try:
+            missing = self.client.get(METRICS_LOCAL, timeout=5.0)
+            wrong = self.client.get(METRICS_LOCAL, headers={"Authorization": "Bearer wrong"}, timeout=5.0)
+        except Timeout:
+            self.fail("Request timed out")
+
+        self.assertEqual(missing.status_code, 401, msg="Metrics served without a token")
+        self.assertEqual(wrong.status_code, 401, msg="Metrics served with a wrong token")
+
+    def test_unknown_key_id_user_submitted_generic_item(self):
+        payload = {
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': '',
+            'Links': ''
+        }
+
+        url = USER_SUBMITTED_GENERIC_ITEM_LOCAL
+
+        try: 
+            response = make_keyed_post_request(payload, url, key_id="notarealkeyid", post=self.client.post)
+        except Timeout:
+            self.fail("Request timed out")
+        
+        self.assertEqual(
+            response.status_code,
+            FORBIDDEN_CODE,
+            msg="Incorrect status code")
+
+        invalid_hmac_message = "Received HMAC signature could not be verified"
+        response_message = json.loads(response.content)['message']
+
+        self.assertEqual(
+            response_message,
+            invalid_hmac_message,
+            msg="Aborted request due to reasons other than invalid hmac"
+        )
+
     def test_invalid_hmac_user_submitted_matched_item(self):
         payload = {
             'ScannedItemName': 'Not Random',
@@ -244,7 +713,7 @@ class PrivateLocalAPITests(unittest.TestCase):
         url = USER_SUBMITTED_MATCHED_ITEM_LOCAL
 
         try: 
-            response = make_incorrect_key_post_request(payload, url)
+            response = make_incorrect_key_post_request(payload, url, post=self.client.post)
         except Timeout:
             self.fail("Request timed out")
         
@@ -290,7 +759,7 @@ class PrivateLocalAPITests(unittest.TestCase):
         url = USER_UPDATED_GENERIC_ITEM_LOCAL
 
         try: 
-            response = make_incorrect_key_post_request(payload, url)
+            response = make_incorrect_key_post_request(payload, url, post=self.client.post)
         except Timeout:
             self.fail("Request timed out")
         
@@ -339,7 +808,7 @@ class PrivateLocalAPITests(unittest.TestCase):
 
         for payload in payloads:
             try: 
-                response = make_keyed_post_request(payload, url)
+                response = make_keyed_post_request(payload, url, post=self.client.post)
             except Timeout:
                 self.fail("Request timed out")
             
@@ -368,7 +837,7 @@ class PrivateLocalAPITests(unittest.TestCase):
 
         for payload in payloads:
             try: 
-                response = make_keyed_post_request(payload, url)
+                response = make_keyed_post_request(payload, url, post=self.client.post)
             except Timeout:
                 self.fail("Request timed out")
             
@@ -407,7 +876,7 @@ class PrivateLocalAPITests(unittest.TestCase):
 
         for payload in payloads:
             try: 
-                response = make_keyed_post_request(payload, url)
+                response = make_keyed_post_request(payload, url, post=self.client.post)
             except Timeout:
                 self.fail("Request timed out")
             
@@ -424,7 +893,18 @@ class PrivateLocalAPITests(unittest.TestCase):
                 invalid_hmac_message,
                 msg="Aborted request due to reasons other than invalid json"
             )
-        
+
+
+class PrivateLocalServerTests(unittest.TestCase):
+    ## A real server, started once for the class
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_local_server()
+        try:
+            wait_until_ready(cls.server)
+        except RuntimeError:
+            stop_local_server(cls.server)
+            raise
 
     def test_timedout_request(self):
         payload = {
@@ -442,17 +922,16 @@ class PrivateLocalAPITests(unittest.TestCase):
         url = USER_SUBMITTED_GENERIC_ITEM_LOCAL
 
         try: 
-            make_timedout_post_request(payload, url)
+            with paused(self.server):
+                make_timedout_post_request(payload, url)
         except Timeout:
             return 
         
         self.fail("Request somehow did not time out...")
-        
-        
-    def tearDown(self) -> None:
-        print("TEARING DOWN")
-        stop_local_api(self.api)
-        print(self.api.poll())
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        stop_local_server(cls.server)
 
 
 class PrivateRemoteAPITests(unittest.TestCase):
@@ -548,6 +1027,41 @@ class PrivateRemoteAPITests(unittest.TestCase):
         )
     
 
+    def test_user_submitted_generic_item_batch_post(self):
+        payload = [{
+            'Name': 'Random',
+            'Category': 'Produce',
+            'Subcategory': 'Fresh',
+            'IsCut': False, 
+            'DaysInFridge': 30.0,
+            'DaysOnShelf': 30.0,
+            'DaysInFreezer': 240.0,
+            'Notes': '',
+            'Links': ''
+        }, {
+            'Name': 'Random',
+            'Category': 'Produce',
+        }]
+
+        try: 
+            response = make_keyed_post_request(payload, USER_SUBMITTED_GENERIC_ITEM_BATCH_REMOTE)
+        except Timeout: 
+            self.fail("Request timed out")
+
+        failure_msg = f"Request failed. Response: {response.content}"
+        self.assertEqual(
+            response.status_code,
+            SUCCESS_CODE,
+            msg=failure_msg,
+        )
+
+        results = json.loads(response.content)['results']
+        self.assertEqual(
+            [result['status'] for result in results],
+            [SUCCESS_CODE, FORBIDDEN_CODE],
+            msg=failure_msg,
+        )
+
     def test_invalid_hmac_user_submitted_generic_item(self):
         payload = {
             'Name': 'Random',
@@ -809,13 +1323,32 @@ def test_suite_local_api():
     suite.addTest(PrivateLocalAPITests("test_user_submitted_generic_item_post"))
     suite.addTest(PrivateLocalAPITests("test_user_submitted_matched_item_post"))
     suite.addTest(PrivateLocalAPITests("test_user_updated_generic_item_post"))
+    suite.addTest(PrivateLocalAPITests("test_user_submitted_generic_item_batch_post"))
+    suite.addTest(PrivateLocalAPITests("test_user_submitted_generic_item_ndjson_post"))
+    suite.addTest(PrivateLocalAPITests("test_user_submitted_generic_item_page_get"))
+    suite.addTest(PrivateLocalAPITests("test_user_submitted_generic_item_export_get"))
+    suite.addTest(PrivateLocalAPITests("test_generic_item_suggestions_get"))
+    suite.addTest(PrivateLocalAPITests("test_generic_item_autocomplete_get"))
     suite.addTest(PrivateLocalAPITests("test_invalid_hmac_user_submitted_generic_item"))
+    suite.addTest(PrivateLocalAPITests("test_unknown_key_id_user_submitted_generic_item"))
     suite.addTest(PrivateLocalAPITests("test_invalid_hmac_user_submitted_matched_item"))
     suite.addTest(PrivateLocalAPITests("test_invalid_hmac_user_updated_generic_item"))
     suite.addTest(PrivateLocalAPITests("test_invalid_payloads_user_submitted_generic_item"))
     suite.addTest(PrivateLocalAPITests("test_invalid_payloads_user_submitted_matched_item"))
     suite.addTest(PrivateLocalAPITests("test_invalid_payloads_user_updated_generic_item"))
-    suite.addTest(PrivateLocalAPITests("test_timedout_request"))
+    suite.addTest(PrivateLocalAPITests("test_metrics_count_aborted_request"))
+    suite.addTest(PrivateLocalAPITests("test_metrics_need_token"))
+    suite.addTest(PrivateLocalAPITests("test_oversized_chunked_body_rejected"))
+    suite.addTest(PrivateLocalAPITests("test_rate_limited_request"))
+    suite.addTest(PrivateLocalAPITests("test_oversized_body_rejected"))
+    suite.addTest(PrivateLocalAPITests("test_idempotent_retry_replayed"))
+    suite.addTest(PrivateLocalAPITests("test_refused_requests_do_not_take_idempotency_key"))
+    return suite
+
+
+def test_suite_local_server():
+    suite = unittest.TestSuite()
+    suite.addTest(PrivateLocalServerTests("test_timedout_request"))
     return suite
 
 
@@ -824,6 +1357,7 @@ def test_suite_remote_api():
     suite.addTest(PrivateRemoteAPITests("test_user_submitted_generic_item_post"))
     suite.addTest(PrivateRemoteAPITests("test_user_submitted_matched_item_post"))
     suite.addTest(PrivateRemoteAPITests("test_user_updated_generic_item_post"))
+    suite.addTest(PrivateRemoteAPITests("test_user_submitted_generic_item_batch_post"))
     suite.addTest(PrivateRemoteAPITests("test_invalid_hmac_user_submitted_generic_item"))
     suite.addTest(PrivateRemoteAPITests("test_invalid_hmac_user_submitted_matched_item"))
     suite.addTest(PrivateRemoteAPITests("test_invalid_hmac_user_updated_generic_item"))
@@ -834,9 +1368,13 @@ def test_suite_remote_api():
     return suite
 
 
-def run_local_api_tests():
+def run_local_api_tests(parallel=True):
+    suites = [test_suite_local_api(), test_suite_local_server()]
+    if parallel:
+        return run_suites_in_parallel(suites)
+
     runner = unittest.TextTestRunner()
-    runner.run(test_suite_local_api())
+    return all([runner.run(suite).wasSuccessful() for suite in suites])
 
 
 def run_remote_api_tests():
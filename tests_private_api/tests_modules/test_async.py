@@ -0,0 +1,195 @@
+"""
+Tests of async_api.py's routes through the Quart test client, of
+async_data.py's per event loop motor client, and that async_data.py stores
+the same documents as data.py
+"""
+
+import asyncio
+import unittest
+
+import async_api
+import async_data
+import data
+
+from security.hmac_sig_gen import HmacVerifier
+from storage import MemoryCollection
+
+from .test_validation import GENERIC_ITEM
+
+try:
+    import motor.motor_asyncio
+    MOTOR_IMPORTS = True
+except Exception:
+    MOTOR_IMPORTS = False
+
+HMAC_MESSAGE = "We were living to run, and running to live"
+
+
+class AsyncApiTests(unittest.TestCase):
+
+    def setUp(self):
+        self.verifier = async_api.hmac_verifier
+        async_api.hmac_verifier = HmacVerifier({"test": "async-test-secret"}, default_key_id="test")
+
+    def tearDown(self):
+        async_api.hmac_verifier = self.verifier
+
+    def headers(self, signature=None):
+        if signature == None:
+            signature = async_api.hmac_verifier.sign(HMAC_MESSAGE).hex()
+        return {"X-Hmac-Signature": signature, "X-Hmac-Message": HMAC_MESSAGE, "X-Is-Test-Request": 'True'}
+
+    def post(self, path, payload, headers):
+        async def request():
+            client = async_api.app.test_client()
+            response = await client.post(path, json=payload, headers=headers)
+            return response.status_code, await response.get_json()
+        return asyncio.run(request())
+
+    def test_valid_test_request_succeeds(self):
+        status, body = self.post("/usersubmittedgenericitemset", GENERIC_ITEM, self.headers())
+        self.assertEqual(status, 200)
+        self.assertEqual(body, "success")
+
+    def test_int_for_float_is_rejected(self):
+        item = dict(GENERIC_ITEM, DaysInFridge=30)
+        status, body = self.post("/usersubmittedgenericitemset", item, self.headers())
+        self.assertEqual(status, 403)
+        self.assertEqual(body["errors"], [{"field": "DaysInFridge", "message": "expected number"}])
+
+    def test_bad_hmac_signature_is_rejected(self):
+        status, body = self.post("/usersubmittedgenericitemset", GENERIC_ITEM, self.headers(signature="00" * 32))
+        self.assertEqual(status, 403)
+        self.assertEqual(body["message"], "Received HMAC signature could not be verified")
+
+    def test_test_requests_open_no_client(self):
+        self.post("/userupdatedgenericitemset", {'Original': GENERIC_ITEM, 'Updated': GENERIC_ITEM}, self.headers())
+        self.assertEqual(len(async_data._clients), 0)
+
+
+class AsyncClientTests(unittest.TestCase):
+
+    def test_no_client_at_import(self):
+        self.assertEqual(len(async_data._clients), 0)
+
+    @unittest.skipUnless(MOTOR_IMPORTS, "motor does not import with the installed pymongo")
+    def test_one_client_per_loop(self):
+        async def clients():
+            first = async_data.get_client()
+            second = async_data.get_client()
+            async_data.close_client()
+            return first, second
+
+        first, second = asyncio.run(clients())
+        self.assertIs(first, second)
+        other, _ = asyncio.run(clients())
+        self.assertIsNot(first, other)
+        self.assertEqual(len(async_data._clients), 0)
+
+
+## Awaitable view of a memory collection, standing in for a motor collection
+class AwaitingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+## Fields that differ between any two writes of the same document
+VOLATILE_FIELDS = ("_id", "FirstSeen", "LastSeen", "FirstProposed", "LastProposed")
+
+def stored(collection):
+    return sorted(
+        ({k: v for k, v in doc.items() if k not in VOLATILE_FIELDS} for doc in collection.find({})),
+        key=repr,
+    )
+
+
+class AsyncWriteTests(unittest.TestCase):
+    """
+    The same submissions through data.py and async_data.py, each on its own
+    memory collections, must leave the same documents behind
+    """
+
+    COLLECTIONS = (
+        "user_submitted_generic_item_set",
+        "user_submitted_matched_item_dict",
+        "user_updated_generic_item_set",
+        "generic_item_update_review_queue",
+    )
+
+    def setUp(self):
+        self.saved = {}
+        self.sync, self.async_ = {}, {}
+        for module in (data, async_data):
+            for name in self.COLLECTIONS:
+                self.saved[(module, name)] = getattr(module, name)
+        for name in self.COLLECTIONS:
+            self.sync[name] = MemoryCollection(name)
+            self.async_[name] = MemoryCollection(name)
+            setattr(data, name, self.sync[name])
+            setattr(async_data, name, AwaitingCollection(self.async_[name]))
+        self.dedup = data.dedup_submissions_enabled, async_data.dedup_submissions_enabled
+
+    def tearDown(self):
+        for (module, name), collection in self.saved.items():
+            setattr(module, name, collection)
+        data.dedup_submissions_enabled, async_data.dedup_submissions_enabled = self.dedup
+
+    def submit_both(self):
+        updated = dict(GENERIC_ITEM, DaysInFridge=7.0)
+        submissions = [
+            ("insert_generic_item", GENERIC_ITEM),
+            ("insert_generic_item", GENERIC_ITEM),
+            ("insert_matched_item", {'ScannedItemName': 'APPLE GALA', 'GenericItemID': 'abc'}),
+            ("insert_generic_item_update", {'Original': GENERIC_ITEM, 'Updated': updated}),
+            ("insert_generic_item_update", {'Original': GENERIC_ITEM, 'Updated': updated}),
+        ]
+
+        async def submit_async():
+            for name, document in submissions:
+                await getattr(async_data, name)(dict(document))
+
+        for name, document in submissions:
+            getattr(data, name)(dict(document))
+        asyncio.run(submit_async())
+
+    def assert_same_documents(self):
+        for name in self.COLLECTIONS:
+            self.assertEqual(stored(self.async_[name]), stored(self.sync[name]), msg=name)
+
+    def test_same_documents_without_dedup(self):
+        data.dedup_submissions_enabled = async_data.dedup_submissions_enabled = False
+        self.submit_both()
+        self.assert_same_documents()
+        self.assertEqual(self.async_["user_submitted_generic_item_set"].count_documents({}), 2)
+
+    def test_same_documents_with_dedup(self):
+        data.dedup_submissions_enabled = async_data.dedup_submissions_enabled = True
+        self.submit_both()
+        self.assert_same_documents()
+        self.assertEqual(self.async_["user_submitted_generic_item_set"].count_documents({}), 1)
+
+    def test_updates_are_voted_on(self):
+        self.submit_both()
+        queue = self.async_["generic_item_update_review_queue"].find({})
+        self.assertEqual([doc["TotalVotes"] for doc in queue], [2])
+
+
+def async_test_suite() -> unittest.TestSuite:
+    suite = unittest.TestSuite()
+    suite.addTest(AsyncApiTests("test_valid_test_request_succeeds"))
+    suite.addTest(AsyncApiTests("test_int_for_float_is_rejected"))
+    suite.addTest(AsyncApiTests("test_bad_hmac_signature_is_rejected"))
+    suite.addTest(AsyncApiTests("test_test_requests_open_no_client"))
+    suite.addTest(AsyncClientTests("test_no_client_at_import"))
+    suite.addTest(AsyncClientTests("test_one_client_per_loop"))
+    suite.addTest(AsyncWriteTests("test_same_documents_without_dedup"))
+    suite.addTest(AsyncWriteTests("test_same_documents_with_dedup"))
+    suite.addTest(AsyncWriteTests("test_updates_are_voted_on"))
+    return suite
@@ -0,0 +1,107 @@
+"""
+Counts popularity and shares loaded terms between workers, see autocomplete.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from autocomplete import AutocompleteIndex, SharedIndexRefresh, SharedTerms, count_submissions
+from refresher import BackgroundRefresher
+from storage import MemoryCollection
+
+TERMS = [("Apple", "Name", 3), ("Produce", "Category", 3), ("Fresh", "Subcategory", 3)]
+
+
+class IndexTests(unittest.TestCase):
+
+    def test_prefix_ending_in_the_last_code_point(self):
+        last = chr(0x10FFFF)
+        index = AutocompleteIndex([("Apple", "Name", 3), (f"Odd {last}", "Name", 1), (last * 2, "Name", 1)])
+        self.assertEqual(index.complete(last), [(last * 2, "Name", 1), (f"Odd {last}", "Name", 1)])
+        self.assertEqual(index.complete(f"odd {last}"), [(f"Odd {last}", "Name", 1)])
+        self.assertEqual(index.complete(f"a{last}"), [])
+
+
+class CountSubmissionsTests(unittest.TestCase):
+
+    def test_sums_counts_with_missing_as_one(self):
+        collection = MemoryCollection("UserSubmittedGenericItemSet")
+        collection.insert_many([
+            {"Name": "Apple"},
+            {"Name": "Apple", "SubmissionCount": 4},
+            {"Name": "Pear"},
+            {"Category": "No name"},
+        ])
+        self.assertEqual(count_submissions(collection, "Name", "SubmissionCount"), {"Apple": 5, "Pear": 1})
+
+
+class SharedTermsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "autocomplete.sqlite3")
+        self.loads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self):
+        self.loads += 1
+        return list(TERMS)
+
+    def test_one_worker_loads_the_others_reuse(self):
+        workers = [
+            SharedIndexRefresh(AutocompleteIndex(), SharedTerms(self.path, max_age=3600, lease=60), self.load)
+            for _ in range(3)
+        ]
+        self.assertEqual([refresh() for refresh in workers], [3, 3, 3])
+        self.assertEqual(self.loads, 1)
+        for refresh in workers:
+            self.assertEqual(refresh.index.complete("app"), [("Apple", "Name", 3)])
+
+    def test_stale_terms_are_loaded_again_under_one_lease(self):
+        first, second = SharedTerms(self.path, max_age=60, lease=30), SharedTerms(self.path, max_age=60, lease=30)
+        self.assertEqual(first.claim(now=0)[0], True)
+        # Another worker neither loads nor gets terms while the lease is held
+        self.assertEqual(second.claim(now=1), (False, None, None))
+        built = first.store(TERMS, now=2)
+        self.assertEqual(second.claim(now=3), (False, TERMS, built))
+        # Stale, so the next worker to look takes the lease
+        self.assertEqual(second.claim(have_built=built, now=70), (True, None, built))
+        self.assertEqual(first.claim(have_built=built, now=71), (False, None, built))
+
+    def test_query_does_not_wait_out_another_workers_lease(self):
+        # Another worker took the lease and has not stored terms yet
+        self.assertTrue(SharedTerms(self.path, max_age=3600, lease=3600).claim()[0])
+        index = AutocompleteIndex()
+        refresher = BackgroundRefresher(
+            SharedIndexRefresh(index, SharedTerms(self.path, max_age=3600, lease=3600), self.load),
+            name="test-autocomplete",
+        )
+        self.assertFalse(refresher.start(timeout=0.05))
+        self.assertEqual(index.complete("app"), [])
+        self.assertEqual(self.loads, 0)
+
+    def test_failed_load_gives_up_the_lease(self):
+        def fail():
+            raise RuntimeError("cluster down")
+
+        refresh = SharedIndexRefresh(AutocompleteIndex(), SharedTerms(self.path, max_age=3600, lease=3600), fail)
+        with self.assertRaises(RuntimeError):
+            refresh()
+        refresh.load = self.load
+        self.assertEqual(refresh(), 3)
+        self.assertEqual(self.loads, 1)
+
+
+def autocomplete_test_suite() -> unittest.TestSuite:
+    suite = unittest.TestSuite()
+    suite.addTest(IndexTests("test_prefix_ending_in_the_last_code_point"))
+    suite.addTest(CountSubmissionsTests("test_sums_counts_with_missing_as_one"))
+    suite.addTest(SharedTermsTests("test_one_worker_loads_the_others_reuse"))
+    suite.addTest(SharedTermsTests("test_stale_terms_are_loaded_again_under_one_lease"))
+    suite.addTest(SharedTermsTests("test_query_does_not_wait_out_another_workers_lease"))
+    suite.addTest(SharedTermsTests("test_failed_load_gives_up_the_lease"))
+    return suite
@@ -0,0 +1,180 @@
+"""
+Normalizes, checkpoints and upserts reference items, see loader.py
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import data
+from canonical import generic_item_hash
+from loader import (
+    Watermark,
+    default_checkpoint_path,
+    load_generic_items,
+    normalize_generic_item,
+    read_checkpoint,
+)
+from storage import MemoryCollection
+from validation import NO_ERRORS, check_generic_item
+
+CSV_FIELDS = ('Name', 'Category', 'Subcategory', 'IsCut', 'IsCooked', 'IsOpened',
+              'DaysInFridge', 'DaysOnShelf', 'DaysInFreezer', 'Notes', 'Links')
+
+def csv_row(name, days_in_fridge="30", is_cut="no"):
+    return {
+        'Name': f" {name} ", 'Category': 'Produce', 'Subcategory': 'Fresh',
+        'IsCut': is_cut, 'IsCooked': 'FALSE', 'IsOpened': '',
+        'DaysInFridge': days_in_fridge, 'DaysOnShelf': '10', 'DaysInFreezer': '240.5',
+        'Notes': '', 'Links': '',
+    }
+
+def quiet(line):
+    pass
+
+
+class NormalizeTests(unittest.TestCase):
+
+    def test_csv_strings_become_valid_item(self):
+        item = normalize_generic_item(dict(csv_row("Apple"), Extra="ignored"))
+        self.assertIs(check_generic_item(item), NO_ERRORS)
+        self.assertEqual(item['Name'], "Apple")
+        self.assertIs(item['IsCut'], False)
+        self.assertIs(item['IsCooked'], False)
+        # An empty cell counts as left out
+        self.assertNotIn('IsOpened', item)
+        self.assertEqual((item['DaysInFridge'], item['DaysInFreezer']), (30.0, 240.5))
+        self.assertNotIn('Extra', item)
+
+    def test_json_ints_become_floats(self):
+        record = dict(normalize_generic_item(csv_row("Apple")), DaysInFridge=30)
+        item = normalize_generic_item(record)
+        self.assertIs(type(item['DaysInFridge']), float)
+        self.assertIs(check_generic_item(item), NO_ERRORS)
+
+    def test_unparseable_values_are_left_for_the_check(self):
+        item = normalize_generic_item(dict(csv_row("Apple"), IsCut="maybe", DaysOnShelf="ten"))
+        errors = {error['field']: error['message'] for error in check_generic_item(item)}
+        self.assertEqual(errors, {'IsCut': 'expected boolean', 'DaysOnShelf': 'expected number'})
+
+
+class WatermarkTests(unittest.TestCase):
+
+    def test_moves_only_past_contiguous_chunks(self):
+        watermark = Watermark(0)
+        self.assertEqual(watermark.complete(11, 20), None)
+        self.assertEqual(watermark.complete(1, 10), 20)
+        self.assertEqual(watermark.complete(31, 40), None)
+        self.assertEqual(watermark.done, 20)
+        self.assertEqual(watermark.complete(21, 30), 40)
+
+
+class LoadTests(unittest.TestCase):
+    """
+    Loads CSV files through data.upsert_generic_items into a memory collection
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "items.csv")
+        self.checkpoint_path = default_checkpoint_path(self.path)
+        self.generic_item_set = data.generic_item_set
+        data.generic_item_set = MemoryCollection("GenericItemSet")
+        data.ensure_generic_item_indexes()
+
+    def tearDown(self):
+        data.generic_item_set = self.generic_item_set
+        shutil.rmtree(self.directory)
+
+    def write_csv(self, rows):
+        with open(self.path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def load(self, upsert_many=None, **kwargs):
+        return load_generic_items(
+            self.path, "csv", upsert_many or data.upsert_generic_items,
+            threads=2, chunk_size=2, checkpoint_path=self.checkpoint_path, log=quiet, **kwargs
+        )
+
+    def test_reload_updates_items_in_place(self):
+        self.write_csv([csv_row(f"Item {i}") for i in range(5)])
+        stats = self.load()
+        self.assertEqual((stats.upserted, stats.matched, stats.failed), (5, 0, 0))
+        before = {item['Name']: item['_id'] for item in data.generic_item_set.find({})}
+
+        self.write_csv([csv_row(f"Item {i}", days_in_fridge="7" if i == 2 else "30") for i in range(5)])
+        stats = self.load(restart=True)
+        self.assertEqual((stats.upserted, stats.matched, stats.failed), (0, 5, 0))
+
+        stored = {item['Name']: item for item in data.generic_item_set.find({})}
+        self.assertEqual({name: item['_id'] for name, item in stored.items()}, before)
+        self.assertEqual(stored['Item 2']['DaysInFridge'], 7.0)
+        self.assertEqual(stored['Item 2']['ContentHash'], generic_item_hash(stored['Item 2']))
+
+    def test_later_records_for_the_same_item_are_duplicates(self):
+        self.write_csv([csv_row("Apple"), csv_row("Apple", days_in_fridge="7"), csv_row("Pear")])
+        stats = self.load()
+        self.assertEqual((stats.upserted, stats.duplicates), (2, 1))
+        self.assertEqual(data.generic_item_set.find_one({'Name': "Apple"})['DaysInFridge'], 30.0)
+
+    def test_flag_variants_are_separate_items(self):
+        self.write_csv([csv_row("Apple"), csv_row("Apple", days_in_fridge="5", is_cut="yes")])
+        stats = self.load()
+        self.assertEqual((stats.upserted, stats.duplicates), (2, 0))
+
+        data.invalidate_generic_item_cache()
+        cut = normalize_generic_item(csv_row("Apple", days_in_fridge="5", is_cut="yes"))
+        self.assertEqual(data.fetch_generic_item_id(cut), data.generic_item_set.find_one({'IsCut': True})['_id'])
+
+        # Reloading the whole apple leaves the cut one alone
+        self.write_csv([csv_row("Apple", days_in_fridge="7")])
+        stats = self.load(restart=True)
+        self.assertEqual((stats.upserted, stats.matched), (0, 1))
+        days = {item['IsCut']: item['DaysInFridge'] for item in data.generic_item_set.find({})}
+        self.assertEqual(days, {False: 7.0, True: 5.0})
+
+    def test_left_out_flags_match_their_default(self):
+        stored = normalize_generic_item(csv_row("Apple"))
+        del stored['IsCut'], stored['IsCooked']
+        data.generic_item_set.insert_one(stored)
+
+        self.write_csv([csv_row("Apple", days_in_fridge="7")])
+        stats = self.load()
+        self.assertEqual((stats.upserted, stats.matched), (0, 1))
+        self.assertEqual(data.generic_item_set.count_documents({}), 1)
+        self.assertEqual(data.generic_item_set.find_one({})['DaysInFridge'], 7.0)
+
+    def test_resumes_after_the_last_complete_chunk(self):
+        self.write_csv([csv_row(f"Item {i}") for i in range(6)])
+
+        def fail_from_item_2(items):
+            if any(item['Name'] >= "Item 2" for item in items):
+                return 0, 0, [{"index": i, "errmsg": "unreachable"} for i in range(len(items))]
+            return data.upsert_generic_items(items)
+
+        stats = self.load(upsert_many=fail_from_item_2)
+        self.assertEqual(stats.failed, 4)
+        self.assertEqual(read_checkpoint(self.checkpoint_path, self.path), 2)
+
+        stats = self.load()
+        self.assertEqual((stats.skipped, stats.read, stats.upserted), (2, 4, 4))
+        self.assertEqual(read_checkpoint(self.checkpoint_path, self.path), 6)
+        self.assertEqual(data.generic_item_set.count_documents({}), 6)
+
+
+def loader_test_suite() -> unittest.TestSuite:
+    suite = unittest.TestSuite()
+    suite.addTest(NormalizeTests("test_csv_strings_become_valid_item"))
+    suite.addTest(NormalizeTests("test_json_ints_become_floats"))
+    suite.addTest(NormalizeTests("test_unparseable_values_are_left_for_the_check"))
+    suite.addTest(WatermarkTests("test_moves_only_past_contiguous_chunks"))
+    suite.addTest(LoadTests("test_reload_updates_items_in_place"))
+    suite.addTest(LoadTests("test_later_records_for_the_same_item_are_duplicates"))
+    suite.addTest(LoadTests("test_flag_variants_are_separate_items"))
+    suite.addTest(LoadTests("test_left_out_flags_match_their_default"))
+    suite.addTest(LoadTests("test_resumes_after_the_last_complete_chunk"))
+    return suite
@@ -0,0 +1,107 @@
+"""
+Sums worker metrics files and keeps the totals of exited workers, see
+metrics.py
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import metrics
+
+
+class MetricsFilesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.saved = metrics.metrics_base_dir, metrics.metrics_dir
+        metrics.metrics_base_dir = self.base_dir
+        metrics.metrics_dir = os.path.join(self.base_dir, "this-run")
+        os.makedirs(metrics.metrics_dir)
+
+    def tearDown(self):
+        metrics.metrics_base_dir, metrics.metrics_dir = self.saved
+        shutil.rmtree(self.base_dir)
+
+    def write_worker_file(self, pid, value, age=0.0, directory=None):
+        path = os.path.join(directory or metrics.metrics_dir, f"worker_{pid}.json")
+        with open(path, "w") as f:
+            json.dump({
+                "worker": f"{pid}-0",
+                "counters": [["syg_review_queue_errors_total", [], value]],
+                "histograms": [["syg_request_seconds", [["endpoint", "test"]], [value] + [0] * len(metrics.BUCKETS), 0.5, value]],
+            }, f)
+        if age > 0:
+            os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    ## The series the worker files write, this process's own totals included
+    def totals(self):
+        return {
+            line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in metrics.render_metrics().splitlines()
+            if line.startswith(("syg_review_queue_errors_total", 'syg_request_seconds_count{endpoint="test"}', 'syg_request_seconds_bucket{endpoint="test",le="+Inf"}'))
+        }
+
+    def test_totals_stay_after_workers_are_retired(self):
+        stale_age = (metrics.STALE_FLUSHES + 1) * metrics.metrics_flush_interval_s
+        self.write_worker_file(101, 1000)
+        self.write_worker_file(102, 100, age=stale_age)
+        worker_path = self.write_worker_file(103, 10)
+        before = self.totals()
+        self.assertEqual(before["syg_review_queue_errors_total"] - metrics._counters.get(("syg_review_queue_errors_total", ()), 0), 1110)
+
+        metrics.retire_worker_file(103)
+        self.assertFalse(os.path.exists(worker_path))
+        self.assertEqual(self.totals(), before)
+        metrics.retire_worker_file(101)
+        metrics.retire_worker_file(102)
+        # Already retired, or never flushed
+        metrics.retire_worker_file(103)
+        self.assertEqual(self.totals(), before)
+        own_file = os.path.basename(metrics._worker_file(os.getpid()))
+        self.assertEqual(sorted(os.listdir(metrics.metrics_dir)), sorted([metrics.RETIRED_FILE, own_file]))
+
+    def test_worker_retired_after_its_file_was_read_counts_once(self):
+        self.write_worker_file(101, 1000)
+        self.write_worker_file(102, 10)
+        before = self.totals()
+
+        # Retire worker 102 between the read of its file and of the retired one
+        read_snapshot = metrics._read_snapshot
+        def retire_then_read(path):
+            if path.endswith(metrics.RETIRED_FILE):
+                metrics._read_snapshot = read_snapshot
+                metrics.retire_worker_file(102)
+            return read_snapshot(path)
+        metrics._read_snapshot = retire_then_read
+        try:
+            self.assertEqual(self.totals(), before)
+        finally:
+            metrics._read_snapshot = read_snapshot
+
+    def test_start_clears_this_run_and_stale_runs(self):
+        stale_age = (metrics.STALE_FLUSHES + 1) * metrics.metrics_flush_interval_s
+        this_run = self.write_worker_file(os.getppid(), 1)
+        old_run = os.path.join(self.base_dir, "old-run")
+        live_run = os.path.join(self.base_dir, "live-run")
+        os.makedirs(old_run)
+        os.makedirs(live_run)
+        self.write_worker_file(os.getppid(), 1, age=stale_age, directory=old_run)
+        self.write_worker_file(os.getppid(), 1, directory=live_run)
+
+        metrics.clear_metrics_dir()
+        self.assertFalse(os.path.exists(this_run))
+        self.assertFalse(os.path.exists(old_run))
+        self.assertTrue(os.path.exists(live_run))
+
+
+def metrics_test_suite() -> unittest.TestSuite:
+    suite = unittest.TestSuite()
+    suite.addTest(MetricsFilesTests("test_totals_stay_after_workers_are_retired"))
+    suite.addTest(MetricsFilesTests("test_worker_retired_after_its_file_was_read_counts_once"))
+    suite.addTest(MetricsFilesTests("test_start_clears_this_run_and_stale_runs"))
+    return suite
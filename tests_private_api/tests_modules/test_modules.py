@@ -0,0 +1,34 @@
+"""
+Tests of single modules that need neither a server nor a cluster. data.py
+runs on the memory storage backend unless STORAGE_BACKEND says otherwise
+"""
+
+import os
+import unittest
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from .test_validation import validation_test_suite
+from .test_snapshot import snapshot_test_suite
+from .test_async import async_test_suite
+from .test_loader import loader_test_suite
+from .test_refresher import refresher_test_suite
+from .test_autocomplete import autocomplete_test_suite
+from .test_metrics import metrics_test_suite
+
+
+def module_test_suite() -> unittest.TestSuite:
+    return unittest.TestSuite([
+        validation_test_suite(),
+        snapshot_test_suite(),
+        async_test_suite(),
+        loader_test_suite(),
+        refresher_test_suite(),
+        autocomplete_test_suite(),
+        metrics_test_suite(),
+    ])
+
+
+def run_module_tests() -> bool:
+    runner = unittest.TextTestRunner()
+    return runner.run(module_test_suite()).wasSuccessful()
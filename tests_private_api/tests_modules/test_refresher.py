@@ -0,0 +1,49 @@
+"""
+Keeps refreshing through failed refreshes, see refresher.py
+"""
+
+import threading
+import time
+import unittest
+
+from refresher import BackgroundRefresher
+
+
+class RefresherTests(unittest.TestCase):
+
+    def test_non_mongo_error_releases_waiters_and_retries(self):
+        calls = []
+        refreshed = threading.Event()
+
+        def refresh():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError("bad document")
+            refreshed.set()
+
+        refresher = BackgroundRefresher(refresh, interval=0.01, name="test-refresher")
+        with self.assertLogs("refresher", level="ERROR") as logs:
+            starter = threading.Thread(target=refresher.start, daemon=True)
+            starter.start()
+            starter.join(5)
+            self.assertFalse(starter.is_alive(), "start(wait=True) did not return after a failed refresh")
+            # The thread is still there to try again
+            self.assertTrue(refreshed.wait(5))
+        self.assertIn("test-refresher refresh failed", logs.output[0])
+        self.assertIn("ValueError: bad document", logs.output[0])
+
+    def test_wait_for_first_refresh_is_capped(self):
+        release = threading.Event()
+        refresher = BackgroundRefresher(lambda: release.wait(5), interval=60, name="test-refresher")
+        start = time.perf_counter()
+        self.assertFalse(refresher.start(timeout=0.05))
+        self.assertLess(time.perf_counter() - start, 2)
+        release.set()
+        self.assertTrue(refresher.start(timeout=5))
+
+
+def refresher_test_suite() -> unittest.TestSuite:
+    suite = unittest.TestSuite()
+    suite.addTest(RefresherTests("test_non_mongo_error_releases_waiters_and_retries"))
+    suite.addTest(RefresherTests("test_wait_for_first_refresh_is_capped"))
+    return suite
@@ -0,0 +1,128 @@
+"""
+Writes, reads and swaps GenericItemSet snapshots, see snapshot.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bson.objectid import ObjectId
+
+import data
+from canonical import canonicalize_generic_item, generic_item_hash, with_content_hash
+from snapshot import GenericItemSnapshot, SnapshotReader, build_snapshot, run_refresher
+
+GENERIC_ITEM = {
+    'Name': 'Apple',
+    'Category': 'Produce',
+    'Subcategory': 'Fresh',
+    'IsCut': False,
+    'IsCooked': False,
+    'IsOpened': False,
+    'DaysInFridge': 30.0,
+    'DaysOnShelf': 10.0,
+    'DaysInFreezer': 240.0,
+    'Notes': '',
+    'Links': ''
+}
+
+def generic_items(count):
+    return [dict(GENERIC_ITEM, _id=ObjectId(), Name=f"Item {i}") for i in range(count)]
+
+
+class StopRefresher(Exception):
+    pass
+
+
+class SnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "generic_items.snapshot")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        items = generic_items(50)
+        self.assertEqual(build_snapshot(items, self.path), 50)
+
+        snapshot = GenericItemSnapshot(self.path)
+        self.assertEqual(len(snapshot), 50)
+        for item in items:
+            content_hash = generic_item_hash(item)
+            self.assertEqual(snapshot.lookup_id(content_hash), item["_id"])
+            self.assertEqual(snapshot.get_item(content_hash), canonicalize_generic_item(item))
+        self.assertEqual({_id for _id, _ in snapshot.items()}, {item["_id"] for item in items})
+        self.assertEqual(snapshot.lookup_id(generic_item_hash(dict(GENERIC_ITEM, Name="Missing"))), None)
+
+    def test_replaced_file_is_picked_up(self):
+        old_items, new_items = generic_items(3), generic_items(3)
+        build_snapshot(old_items, self.path)
+        reader = SnapshotReader(self.path, check_interval=0)
+        self.assertEqual(reader.lookup_id(generic_item_hash(old_items[0])), old_items[0]["_id"])
+
+        new_item = dict(new_items[0], Name="New Item")
+        build_snapshot(old_items[1:] + [new_item], self.path)
+        self.assertEqual(reader.lookup_id(generic_item_hash(new_item)), new_item["_id"])
+        self.assertEqual(reader.lookup_id(generic_item_hash(old_items[0])), None)
+
+    def test_truncated_or_corrupt_file_is_not_used(self):
+        build_snapshot(generic_items(10), self.path)
+        size = os.path.getsize(self.path)
+        for truncate_to in (0, 10, size // 2, size - 1):
+            shutil.copy(self.path, self.path + ".bad")
+            with open(self.path + ".bad", "r+b") as f:
+                f.truncate(truncate_to)
+            self.assertEqual(SnapshotReader(self.path + ".bad", check_interval=0).current(), None, msg=truncate_to)
+
+        with open(self.path + ".bad", "wb") as f:
+            f.write(os.urandom(size))
+        self.assertEqual(SnapshotReader(self.path + ".bad", check_interval=0).current(), None)
+
+    def test_corrupt_snapshot_falls_back_to_mongo(self):
+        item = with_content_hash(dict(GENERIC_ITEM, Name=f"Snapshot Fallback {ObjectId()}"))
+        _id = data.generic_item_set.insert_one(item).inserted_id
+        with open(self.path, "wb") as f:
+            f.write(b"SYGSNAP1 but not a snapshot")
+
+        previous = data.generic_item_snapshot
+        data.generic_item_snapshot = SnapshotReader(self.path, check_interval=0)
+        data.invalidate_generic_item_cache()
+        try:
+            self.assertEqual(data.fetch_generic_item_id(item), _id)
+        finally:
+            data.generic_item_snapshot = previous
+            data.generic_item_set.delete_one({"_id": _id})
+            data.invalidate_generic_item_cache()
+
+    def test_refresher_polls_without_change_stream(self):
+        # The memory backend has no change streams, so the refresher falls
+        # back to rebuilding every interval
+        item = with_content_hash(dict(GENERIC_ITEM, Name=f"Snapshot Refreshed {ObjectId()}"))
+        _id = data.generic_item_set.insert_one(item).inserted_id
+        counts = []
+
+        def on_rebuild(count):
+            counts.append(count)
+            self.assertEqual(GenericItemSnapshot(self.path).lookup_id(generic_item_hash(item)), _id)
+            if len(counts) == 2:
+                raise StopRefresher()
+
+        try:
+            with self.assertRaises(StopRefresher):
+                run_refresher(data.generic_item_set, self.path, interval=0, on_rebuild=on_rebuild)
+        finally:
+            data.generic_item_set.delete_one({"_id": _id})
+        self.assertEqual(len(counts), 2)
+
+
+def snapshot_test_suite() -> unittest.TestSuite:
+    suite = unittest.TestSuite()
+    suite.addTest(SnapshotTests("test_round_trip"))
+    suite.addTest(SnapshotTests("test_replaced_file_is_picked_up"))
+    suite.addTest(SnapshotTests("test_truncated_or_corrupt_file_is_not_used"))
+    suite.addTest(SnapshotTests("test_corrupt_snapshot_falls_back_to_mongo"))
+    suite.addTest(SnapshotTests("test_refresher_polls_without_change_stream"))
+    return suite
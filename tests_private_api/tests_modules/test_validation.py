@@ -0,0 +1,99 @@
+"""
+Pins down the type rules of the payload validators in validation.py
+"""
+
+import unittest
+
+from validation import NO_ERRORS, check_generic_item, check_matched_item, check_updated_generic_item
+
+GENERIC_ITEM = {
+    'Name': 'Apple',
+    'Category': 'Produce',
+    'Subcategory': 'Fresh',
+    'IsCut': False,
+    'IsCooked': False,
+    'IsOpened': False,
+    'DaysInFridge': 30.0,
+    'DaysOnShelf': 10.0,
+    'DaysInFreezer': 240.0,
+    'Notes': '',
+    'Links': ''
+}
+
+def fields(errors):
+    return {error['field']: error['message'] for error in errors}
+
+
+class GenericItemValidationTests(unittest.TestCase):
+
+    def test_complete_item_passes(self):
+        self.assertIs(check_generic_item(dict(GENERIC_ITEM)), NO_ERRORS)
+
+    def test_optional_flags_may_be_left_out(self):
+        item = {k: v for k, v in GENERIC_ITEM.items() if k not in ('IsCut', 'IsCooked', 'IsOpened')}
+        self.assertIs(check_generic_item(item), NO_ERRORS)
+
+    def test_other_fields_are_required(self):
+        for k in ('Name', 'Category', 'Subcategory', 'DaysInFridge', 'DaysOnShelf', 'DaysInFreezer', 'Notes', 'Links'):
+            item = dict(GENERIC_ITEM)
+            del item[k]
+            self.assertEqual(fields(check_generic_item(item)), {k: 'missing field'}, msg=k)
+
+    def test_int_is_not_a_float(self):
+        item = dict(GENERIC_ITEM, DaysInFridge=30, DaysOnShelf=30.0, DaysInFreezer=240)
+        self.assertEqual(
+            fields(check_generic_item(item)),
+            {'DaysInFridge': 'expected number', 'DaysInFreezer': 'expected number'},
+        )
+
+    def test_bool_and_number_are_not_interchangeable(self):
+        item = dict(GENERIC_ITEM, IsCut=0, DaysOnShelf=True)
+        self.assertEqual(
+            fields(check_generic_item(item)),
+            {'IsCut': 'expected boolean', 'DaysOnShelf': 'expected number'},
+        )
+
+    def test_strings_are_not_converted(self):
+        item = dict(GENERIC_ITEM, IsCut='False', DaysInFridge='30.0')
+        self.assertEqual(
+            fields(check_generic_item(item)),
+            {'IsCut': 'expected boolean', 'DaysInFridge': 'expected number'},
+        )
+
+    def test_every_error_reported(self):
+        item = dict(GENERIC_ITEM, Name=1, Extra='x')
+        del item['Links']
+        self.assertEqual(
+            fields(check_generic_item(item)),
+            {'Name': 'expected string', 'Extra': 'unexpected field', 'Links': 'missing field'},
+        )
+
+    def test_not_an_object(self):
+        self.assertEqual(fields(check_generic_item([GENERIC_ITEM])), {'$': 'expected object'})
+
+
+class NestedValidationTests(unittest.TestCase):
+
+    def test_matched_item_checks_generic_item(self):
+        self.assertIs(check_matched_item({'ScannedItemName': 'APPL', 'GenericItemObj': dict(GENERIC_ITEM)}), NO_ERRORS)
+        errors = check_matched_item({'ScannedItemName': 'APPL', 'GenericItemObj': dict(GENERIC_ITEM, DaysOnShelf=10)})
+        self.assertEqual(fields(errors), {'GenericItemObj.DaysOnShelf': 'expected number'})
+
+    def test_updated_generic_item_checks_both_items(self):
+        errors = check_updated_generic_item({'Original': 'Apple', 'Updated': dict(GENERIC_ITEM, IsCut=None)})
+        self.assertEqual(fields(errors), {'Original': 'expected object', 'Updated.IsCut': 'expected boolean'})
+
+
+def validation_test_suite() -> unittest.TestSuite:
+    suite = unittest.TestSuite()
+    suite.addTest(GenericItemValidationTests("test_complete_item_passes"))
+    suite.addTest(GenericItemValidationTests("test_optional_flags_may_be_left_out"))
+    suite.addTest(GenericItemValidationTests("test_other_fields_are_required"))
+    suite.addTest(GenericItemValidationTests("test_int_is_not_a_float"))
+    suite.addTest(GenericItemValidationTests("test_bool_and_number_are_not_interchangeable"))
+    suite.addTest(GenericItemValidationTests("test_strings_are_not_converted"))
+    suite.addTest(GenericItemValidationTests("test_every_error_reported"))
+    suite.addTest(GenericItemValidationTests("test_not_an_object"))
+    suite.addTest(NestedValidationTests("test_matched_item_checks_generic_item"))
+    suite.addTest(NestedValidationTests("test_updated_generic_item_checks_both_items"))
+    return suite
@@ -7,6 +7,10 @@ from random import random
 import unittest
 
 from data import *
+from canonical import generic_item_hash, with_content_hash
+from suggest import TrigramIndex, sync_index
+from autocomplete import AutocompleteIndex, refresh_index
+from write_buffer import WriteBehindBuffer
 
 ##
 ## Test User Submitted Generic Item Set Operations
@@ -35,6 +39,95 @@ class UserSubmittedGenericItemSetTests(unittest.TestCase):
 
         self.assertEquals(queried_item, random_item)
 
+    def test_insert_generic_items(self):
+        random_items = [{
+            "Name": "Random",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        }, {
+            "Name": "Also Random",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": True,
+            "DaysInFridge": 5.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 300.0,
+            "Notes": "",
+            "Links": "",
+        }]
+
+        results = insert_generic_items(random_items)
+
+        self.assertEqual(len(results), len(random_items))
+
+        for result, random_item in zip(results, random_items):
+            self.assertNotIn("error", result)
+            queried_item = user_submitted_generic_item_set.find_one_and_delete({"_id": result["_id"]})
+            self.assertEquals(queried_item, random_item)
+
+    def test_write_behind_insert_generic_item(self):
+        random_item = {
+            "Name": "Random",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        }
+
+        buffer = WriteBehindBuffer(
+            "test",
+            lambda documents: insert_many_unordered(user_submitted_generic_item_set, documents),
+        )
+        result = buffered_insert_one(user_submitted_generic_item_set, buffer, random_item)
+
+        self.assertFalse(result.acknowledged)
+
+        buffer.stop()
+        self.assertEqual(buffer.stats()["flushed_documents"], 1)
+
+        queried_item = user_submitted_generic_item_set.find_one_and_delete({"_id": result.inserted_id})
+
+        self.assertEquals(queried_item, random_item)
+
+    def test_upsert_many_unordered_merges_repeats(self):
+        random_item = {
+            "Name": "Random",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        }
+        submission_hash = "test-" + generic_item_hash(random_item)
+        submissions = [dict(random_item, SubmissionHash=submission_hash) for _ in range(3)]
+
+        results = upsert_many_unordered(user_submitted_generic_item_set, submissions)
+
+        self.assertEqual(len(results), 3)
+        self.assertIn("_id", results[0])
+        self.assertEqual(results[1:], [{}, {}])
+
+        upsert_submission(user_submitted_generic_item_set, None, dict(random_item), submission_hash)
+
+        queried_item = user_submitted_generic_item_set.find_one_and_delete({"SubmissionHash": submission_hash})
+
+        self.assertEqual(queried_item["_id"], results[0]["_id"])
+        self.assertEqual(queried_item["SubmissionCount"], 4)
+        self.assertEqual(queried_item["Name"], random_item["Name"])
+
 
 class UserSubmittedMatchedItemDictTests(unittest.TestCase):
 
@@ -86,14 +179,196 @@ class UserUpdatedMatchedItemSetTests(unittest.TestCase):
         self.assertTrue(result.acknowledged)
 
         queried_item = user_updated_generic_item_set.find_one_and_delete({"_id": result.inserted_id})
+        generic_item_update_review_queue.delete_one({"OriginalHash": generic_item_hash(random_update["Original"])})
 
         self.assertEquals(queried_item, random_update)
 
+    def test_review_queue_counts_votes(self):
+        original = {
+            "Name": "Random Reviewed",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        }
+        updated = dict(original, DaysOnShelf=4.0)
+        # Same change sent with an int, it should count as the same proposal
+        updated_again = dict(original, DaysOnShelf=4)
+
+        results = insert_generic_item_updates([
+            {"Original": original, "Updated": updated},
+            {"Original": original, "Updated": updated_again},
+        ])
+
+        queued = generic_item_update_review_queue.find_one({"OriginalHash": generic_item_hash(original)})
+        self.assertEqual(queued["TotalVotes"], 2)
+        self.assertEqual([entry["Votes"] for entry in queued["Updates"].values()], [2])
+
+        generic_item_update_review_queue.delete_one({"_id": queued["_id"]})
+        for result in results:
+            user_updated_generic_item_set.delete_one({"_id": result["_id"]})
+
+class GenericItemSetTests(unittest.TestCase):
+
+    def test_fetch_generic_item_id_cached(self):
+        random_item = {
+            "Name": "Random",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        }
+
+        invalidate_generic_item_cache()
+        self.assertIsNone(fetch_generic_item_id(random_item))
+
+        result = generic_item_set.insert_one(with_content_hash(random_item))
+        # The miss above is cached until the cache is told GenericItemSet changed
+        self.assertIsNone(fetch_generic_item_id(random_item))
+        invalidate_generic_item_cache(random_item)
+
+        self.assertEqual(fetch_generic_item_id(random_item), result.inserted_id)
+        hits = generic_item_cache_stats()["hits"]
+        self.assertEqual(fetch_generic_item_id(random_item), result.inserted_id)
+        self.assertEqual(generic_item_cache_stats()["hits"], hits + 1)
+
+        generic_item_set.find_one_and_delete({"_id": result.inserted_id})
+        invalidate_generic_item_cache(random_item)
+
+    def test_fetch_generic_item_id_canonical(self):
+        random_item = {
+            "Name": "Random",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "IsCooked": False,
+            "IsOpened": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        }
+        # Same item reordered, with ints and the optional flags left out
+        submitted_item = {
+            "Links": "",
+            "Notes": "",
+            "DaysInFreezer": 420,
+            "DaysOnShelf": 0,
+            "DaysInFridge": 10,
+            "Subcategory": "Fresh",
+            "Category": "Produce",
+            "Name": "Random",
+        }
+
+        result = generic_item_set.insert_one(with_content_hash(random_item))
+        invalidate_generic_item_cache()
+
+        self.assertEqual(fetch_generic_item_id(submitted_item), result.inserted_id)
+
+        generic_item_set.find_one_and_delete({"_id": result.inserted_id})
+        invalidate_generic_item_cache()
+
+    def test_upsert_generic_items(self):
+        random_item = with_content_hash({
+            "Name": "Random Loaded",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "IsCooked": False,
+            "IsOpened": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        })
+
+        self.assertEqual(upsert_generic_items([random_item]), (1, 0, []))
+        # Loading it again matches the stored document instead of adding one
+        self.assertEqual(upsert_generic_items([random_item]), (0, 1, []))
+        self.assertEqual(generic_item_set.count_documents({"ContentHash": random_item["ContentHash"]}), 1)
+
+        generic_item_set.delete_many({"ContentHash": random_item["ContentHash"]})
+        invalidate_generic_item_cache()
+
+    def test_suggestion_index_sync(self):
+        random_item = with_content_hash({
+            "Name": f"Random Suggested {random()}",
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "IsCooked": False,
+            "IsOpened": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        })
+        _id = generic_item_set.insert_one(random_item).inserted_id
+
+        index = TrigramIndex()
+        sync_index(index, generic_item_set)
+        self.assertIn(_id, [key for _, key, _ in index.search("RNDM SUGGESTED", limit=len(index))])
+        # Nothing changed, nothing is fetched again
+        self.assertEqual(sync_index(index, generic_item_set), (0, 0))
+
+        generic_item_set.delete_one({"_id": _id})
+        self.assertEqual(sync_index(index, generic_item_set), (0, 1))
+        self.assertNotIn(_id, [key for _, key, _ in index.search("RNDM SUGGESTED", limit=len(index))])
+
+    def test_autocomplete_ranks_by_submissions(self):
+        name = f"Random Completed {random()}"
+        random_item = with_content_hash({
+            "Name": name,
+            "Category": "Produce",
+            "Subcategory": "Fresh",
+            "IsCut": False,
+            "IsCooked": False,
+            "IsOpened": False,
+            "DaysInFridge": 10.0,
+            "DaysOnShelf": 0.0,
+            "DaysInFreezer": 420.0,
+            "Notes": "",
+            "Links": "",
+        })
+        _id = generic_item_set.insert_one(random_item).inserted_id
+        matched_ids = user_submitted_matched_item_dict.insert_many([
+            {"ScannedItemName": "RNDM CMPLTD", "GenericItemID": _id} for _ in range(3)
+        ]).inserted_ids
+
+        index = AutocompleteIndex()
+        refresh_index(index, generic_item_set, user_submitted_matched_item_dict, user_submitted_generic_item_set, SUBMISSION_COUNT_FIELD)
+        # Typed from the start of any word, in any case
+        completions = index.complete("COMPLETED " + name.split(" ")[2][:4], limit=20)
+        self.assertIn((name, "Name", 3), completions)
+
+        user_submitted_matched_item_dict.delete_many({"_id": {"$in": matched_ids}})
+        generic_item_set.delete_one({"_id": _id})
+
 def mongo_test_suite() -> unittest.TestSuite:
     suite = unittest.TestSuite()
     suite.addTest(UserSubmittedGenericItemSetTests("test_insert_generic_item"))
+    suite.addTest(UserSubmittedGenericItemSetTests("test_insert_generic_items"))
+    suite.addTest(UserSubmittedGenericItemSetTests("test_write_behind_insert_generic_item"))
+    suite.addTest(UserSubmittedGenericItemSetTests("test_upsert_many_unordered_merges_repeats"))
     suite.addTest(UserSubmittedMatchedItemDictTests("test_insert_matched_item"))
     suite.addTest(UserUpdatedMatchedItemSetTests("test_insert_generic_item_update"))
+    suite.addTest(UserUpdatedMatchedItemSetTests("test_review_queue_counts_votes"))
+    suite.addTest(GenericItemSetTests("test_fetch_generic_item_id_cached"))
+    suite.addTest(GenericItemSetTests("test_fetch_generic_item_id_canonical"))
+    suite.addTest(GenericItemSetTests("test_upsert_generic_items"))
+    suite.addTest(GenericItemSetTests("test_suggestion_index_sync"))
+    suite.addTest(GenericItemSetTests("test_autocomplete_ranks_by_submissions"))
     return suite
 
 
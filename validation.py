@@ -0,0 +1,115 @@
+"""
+Precompiled payload validators
+
+Each schema in schema.py is turned once, at import, into a check function
+closed over a table of its fields: one dict lookup and one type identity
+test per field, with no sets or lists built for a valid payload. A check
+returns an empty tuple for a valid payload, otherwise a list of every field
+error found:
+
+    [{"field": "GenericItemObj.DaysInFridge", "message": "expected number"}]
+
+Types are matched exactly: a float field takes a float only, not an int
+(send 30.0, not 30), and a bool is not taken for a number or the other way
+round. Only the keys a check is given as optional may be left out.
+"""
+
+from typing import Callable, Dict, Iterable, Sequence
+
+from schema import (
+    GENERIC_ITEM_KEYS_AND_TYPES,
+    GENERIC_ITEM_OPTIONAL_DEFAULTS,
+    MATCHED_ITEM_KEYS_AND_TYPES,
+    UPDATE_GENERIC_ITEM_KEYS_AND_TYPES,
+)
+
+FieldError = Dict[str, str]
+Check = Callable[..., Sequence[FieldError]]
+
+NO_ERRORS = ()
+
+_MISSING = object()
+
+TYPE_NAMES = {str: "string", bool: "boolean", float: "number", int: "integer", dict: "object", list: "array"}
+
+
+def _field_error(errors, path, field, message):
+    if errors == None:
+        errors = []
+    errors.append({"field": f"{path}{field}", "message": message})
+    return errors
+
+
+def _extra_field_errors(errors, rec_json, path, keys):
+    for k in rec_json:
+        if k not in keys:
+            errors = _field_error(errors, path, k, "unexpected field")
+    return errors
+
+
+def _missing_field_errors(errors, rec_json, path, required):
+    for k in required:
+        if k not in rec_json:
+            errors = _field_error(errors, path, k, "missing field")
+    return errors
+
+
+"""
+Input: Dict of key -> expected type, keys that may be left out, and nested
+    checks for dict-typed keys
+Output: check(rec_json, path="") -> NO_ERRORS or List of field errors
+"""
+def compile_check(keys_and_types: Dict[str, type], optional: Iterable[str] = (), nested: Dict[str, Check] = None) -> Check:
+    nested = nested or {}
+    optional = set(optional)
+    keys = tuple(keys_and_types.keys())
+    required = tuple(k for k in keys if k not in optional)
+    # (key, expected type, required, nested check or None, message for a
+    # wrong type)
+    fields = tuple(
+        (k, expected_type, k not in optional, nested.get(k), f"expected {TYPE_NAMES[expected_type]}")
+        for k, expected_type in keys_and_types.items()
+    )
+
+    def check(rec_json, path=""):
+        if type(rec_json) is not dict:
+            return [{"field": path[:-1] or "$", "message": "expected object"}]
+        errors = None
+        found = 0
+        found_required = 0
+        get = rec_json.get
+        for k, expected_type, is_required, nested_check, message in fields:
+            v = get(k, _MISSING)
+            if v is _MISSING:
+                continue
+            found += 1
+            found_required += is_required
+            if type(v) is not expected_type:
+                errors = _field_error(errors, path, k, message)
+            elif nested_check != None:
+                nested_errors = nested_check(v, f"{path}{k}.")
+                if nested_errors:
+                    if errors == None:
+                        errors = []
+                    errors.extend(nested_errors)
+        if found != len(rec_json):
+            errors = _extra_field_errors(errors, rec_json, path, keys)
+        if found_required < len(required):
+            errors = _missing_field_errors(errors, rec_json, path, required)
+        return NO_ERRORS if errors == None else errors
+
+    return check
+
+
+## A generic item may leave out the flags the app omits, see schema.py
+check_generic_item = compile_check(GENERIC_ITEM_KEYS_AND_TYPES, optional=GENERIC_ITEM_OPTIONAL_DEFAULTS)
+
+check_matched_item = compile_check(
+    MATCHED_ITEM_KEYS_AND_TYPES,
+    nested={'GenericItemObj': check_generic_item},
+)
+
+check_updated_generic_item = compile_check(
+    UPDATE_GENERIC_ITEM_KEYS_AND_TYPES,
+    nested={'Original': check_generic_item, 'Updated': check_generic_item},
+)
@@ -0,0 +1,190 @@
+"""
+Write-behind group commit for the insert_* functions in data.py
+
+Inserts are queued in a bounded in-process buffer and a background flusher
+thread commits them in groups, once either max_batch documents are waiting or
+the oldest waiting document is max_latency seconds old.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+MongoObject = Dict[str, Any]
+
+
+class WriteBehindBuffer:
+    """
+    Input: name used in logs and stats, flush_documents callable that writes a
+        List of documents and returns per-document results (see
+        data.insert_many_unordered), and the size / latency thresholds
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_documents: Callable[[List[MongoObject]], List[MongoObject]],
+        max_buffered: int = 10000,
+        max_batch: int = 500,
+        max_latency: float = 0.05,
+        put_timeout: float = 0.5,
+    ):
+        self.name = name
+        self.flush_documents = flush_documents
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=max_buffered)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._flusher = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "flushes": 0,
+            "flushed_documents": 0,
+            "failed_documents": 0,
+            "max_batch_size": 0,
+            "flush_latency_total": 0.0,
+            "flush_latency_max": 0.0,
+        }
+
+    ## Producer side
+
+    """
+    Input: Dict document, which must already carry its _id
+    Output: True if buffered. False if the buffer stayed full for put_timeout,
+        in which case the caller should write the document itself
+    """
+    def put(self, document: MongoObject) -> bool:
+        self._ensure_flusher()
+        try:
+            self._queue.put(document, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            return False
+
+        with self._lock:
+            self._stats["enqueued"] += 1
+        return True
+
+    ## Flusher side
+
+    def _reset_after_fork(self):
+        # Threads do not survive a fork and documents buffered by the parent
+        # are the parent's to flush, so each worker starts from an empty buffer
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._flusher = None
+
+    def _ensure_flusher(self):
+        if self._flusher != None and self._flusher.is_alive():
+            return
+
+        with self._lock:
+            if self._flusher != None and self._flusher.is_alive():
+                return
+            self._stopping.clear()
+            self._flusher = threading.Thread(
+                target=self._run, name=f"write-behind-{self.name}", daemon=True
+            )
+            self._flusher.start()
+
+    def _next_batch(self, block: bool) -> List[MongoObject]:
+        try:
+            first = self._queue.get(timeout=self.max_latency) if block else self._queue.get_nowait()
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and block:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch(block=True)
+            if len(batch) > 0:
+                self._commit(batch)
+        self.flush()
+
+    def _commit(self, batch: List[MongoObject]):
+        start = time.perf_counter()
+        try:
+            results = self.flush_documents(batch)
+            failed = sum(1 for result in results if "error" in result)
+        except Exception:
+            logger.exception("write-behind flush of %d documents to %s failed", len(batch), self.name)
+            failed = len(batch)
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["flushed_documents"] += len(batch) - failed
+            self._stats["failed_documents"] += failed
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+            self._stats["flush_latency_total"] += latency
+            self._stats["flush_latency_max"] = max(self._stats["flush_latency_max"], latency)
+
+    """
+    Commits everything currently buffered from the calling thread
+    """
+    def flush(self):
+        while True:
+            batch = self._next_batch(block=False)
+            if len(batch) == 0:
+                return
+            self._commit(batch)
+
+    """
+    Stops the flusher and commits whatever is left. Called on worker shutdown
+    """
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        if self._flusher != None:
+            self._flusher.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["buffered"] = self._queue.qsize()
+        flushes = stats["flushes"]
+        stats["mean_batch_size"] = (stats["flushed_documents"] + stats["failed_documents"]) / flushes if flushes else 0.0
+        stats["mean_flush_latency"] = stats["flush_latency_total"] / flushes if flushes else 0.0
+        return stats
+
+
+## Registry so every buffer is flushed when the worker exits
+
+_buffers: List[WriteBehindBuffer] = []
+
+def register_buffer(buffer: WriteBehindBuffer) -> WriteBehindBuffer:
+    _buffers.append(buffer)
+    return buffer
+
+def stop_all_buffers():
+    for buffer in _buffers:
+        buffer.stop()
+
+atexit.register(stop_all_buffers)